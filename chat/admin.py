@@ -1,3 +1,18 @@
 from django.contrib import admin
 
-# Register your models here.
+from .models import Conversation, Message
+
+
+class MessageInline(admin.TabularInline):
+    model = Message
+    extra = 0
+    fields = ['role', 'content', 'name', 'created_at']
+    readonly_fields = ['created_at']
+
+
+@admin.register(Conversation)
+class ConversationAdmin(admin.ModelAdmin):
+    list_display = ['id', 'user', 'title', 'created_at', 'updated_at']
+    search_fields = ['title', 'user__username']
+    readonly_fields = ['created_at', 'updated_at']
+    inlines = [MessageInline]
@@ -0,0 +1,197 @@
+# chat/context.py
+
+"""
+发给模型的对话上下文的 token 预算
+
+一轮对话从一条用户消息开始, 包含其后的工具调用、工具结果和回复, 按轮取舍以保证工具调用和结果总是成对出现。
+每次请求保留系统提示和最近 CHAT_KEEP_TURNS 轮(总量不超过 CHAT_CONTEXT_TOKENS, 至少保留最近一轮),
+更早的轮次压缩进对话的滚动摘要。
+
+摘要保存在 Conversation 上, 只有窗口向后滑动(有轮次被移出)时才调用模型重新生成;
+未超出预算时至少攒够 CHAT_SUMMARY_BATCH 轮才滑动一次, 不会每轮对话都多一次摘要调用。
+"""
+
+import json
+import re
+import time
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Tuple
+
+from django.conf import settings
+
+from core import metrics
+from .conversations import MESSAGE_FIELDS, clean_message
+from .models import Conversation
+from .services import get_sync_client
+
+try:
+    import tiktoken
+except ImportError:  # tiktoken 为可选依赖, 未安装时按字符数估算
+    tiktoken = None
+
+SUMMARY_MODEL = "gpt-4o-mini"
+# 每条消息在角色、分隔符上的固定开销
+MESSAGE_OVERHEAD_TOKENS = 4
+# 写入摘要请求的单条工具结果最多保留的字符数
+SUMMARY_TOOL_CHARS = 500
+
+SUMMARY_PROMPT = (
+    "你负责压缩健康教练与用户的对话记录。请把已有摘要和新的对话记录合并成一份新的摘要, "
+    "保留用户的身体情况、健康目标、偏好和禁忌、已创建或修改的计划以及尚未完成的约定, "
+    "省略寒暄和重复内容。直接输出摘要正文, 不超过300字。"
+)
+
+_CJK = re.compile(r'[\u2e80-\u9fff\uac00-\ud7af\uff00-\uffef]')
+
+
+def _setting(name: str, default: int) -> int:
+    return getattr(settings, name, default)
+
+
+@lru_cache(maxsize=1)
+def _encoding():
+    if tiktoken is None:
+        return None
+    try:
+        return tiktoken.get_encoding("o200k_base")  # gpt-4o 系列使用的编码
+    except Exception as e:
+        # 编码文件需要联网下载, 失败时退回估算
+        print(f"加载 tiktoken 编码失败, 改为按字符数估算: {e}")
+        return None
+
+
+def count_tokens(text: Optional[str]) -> int:
+    """计算文本的 token 数(未安装 tiktoken 时估算: 中日韩字符每字 1 个, 其余每 4 个字符 1 个)"""
+    if not text:
+        return 0
+    encoding = _encoding()
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    cjk = len(_CJK.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def message_tokens(message: Dict[str, Any]) -> int:
+    tokens = MESSAGE_OVERHEAD_TOKENS + count_tokens(message.get('content'))
+    if message.get('tool_calls'):
+        tokens += count_tokens(json.dumps(message['tool_calls'], ensure_ascii=False))
+    if message.get('name'):
+        tokens += count_tokens(message['name'])
+    return tokens
+
+
+def split_turns(messages: List[Dict[str, Any]]) -> List[List[Dict[str, Any]]]:
+    """按用户消息把消息切分为轮次"""
+    turns: List[List[Dict[str, Any]]] = []
+    for message in messages:
+        if message.get('role') == 'user' or not turns:
+            turns.append([message])
+        else:
+            turns[-1].append(message)
+    return turns
+
+
+def _turn_tokens(turn: List[Dict[str, Any]]) -> int:
+    return sum(message_tokens(message) for message in turn)
+
+
+def _window_start(turns: List[List[Dict[str, Any]]], reserved_tokens: int) -> int:
+    """返回保留的第一轮的下标: 最多 CHAT_KEEP_TURNS 轮, 超出预算时继续丢弃最早的轮次(至少保留最近一轮)"""
+    budget = _setting('CHAT_CONTEXT_TOKENS', 6000)
+    start = max(0, len(turns) - _setting('CHAT_KEEP_TURNS', 6))
+    tokens = reserved_tokens + sum(_turn_tokens(turn) for turn in turns[start:])
+    while start < len(turns) - 1 and tokens > budget:
+        tokens -= _turn_tokens(turns[start])
+        start += 1
+    return start
+
+
+def trim_history(history: List[Any], reserved_tokens: int) -> List[Dict[str, Any]]:
+    """
+    按预算截取客户端传来的历史(旧客户端, 不带 conversation_id)
+
+    这些历史只作为本轮的上下文, 不保存到服务端, 也没有可以缓存摘要的地方, 窗口外的轮次直接不发给模型。
+    """
+    turns = split_turns([message for message in history if isinstance(message, dict)])
+    start = _window_start(turns, reserved_tokens)
+    return [message for turn in turns[start:] for message in turn]
+
+
+def _transcript(messages: List[Dict[str, Any]]) -> str:
+    lines = []
+    for message in messages:
+        role = message['role']
+        if role == 'user':
+            lines.append(f"用户: {message.get('content') or ''}")
+        elif role == 'assistant':
+            if message.get('content'):
+                lines.append(f"教练: {message['content']}")
+            for tool_call in message.get('tool_calls') or []:
+                function = tool_call.get('function', {})
+                lines.append(f"教练调用工具 {function.get('name')}: {function.get('arguments')}")
+        elif role == 'tool':
+            lines.append(f"工具 {message.get('name')} 返回: {(message.get('content') or '')[:SUMMARY_TOOL_CHARS]}")
+    return "\n".join(lines)
+
+
+def summarize(previous_summary: str, messages: List[Dict[str, Any]]) -> str:
+    """调用模型把已有摘要和新移出窗口的消息合并为新的摘要"""
+    content = f"已有摘要:\n{previous_summary or '(无)'}\n\n新的对话记录:\n{_transcript(messages)}"
+    started = time.perf_counter()
+    response = get_sync_client().chat.completions.create(
+        model=SUMMARY_MODEL,
+        messages=[
+            {"role": "system", "content": SUMMARY_PROMPT},
+            {"role": "user", "content": content},
+        ],
+        max_tokens=_setting('CHAT_SUMMARY_MAX_TOKENS', 400),
+    )
+    metrics.observe('chat.summary', time.perf_counter() - started)
+    return (response.choices[0].message.content or "").strip()
+
+
+def load_context(conversation: Conversation, reserved_tokens: int) -> Tuple[str, List[Dict[str, Any]]]:
+    """
+    加载对话的摘要和窗口内的消息, 窗口滑动时先更新摘要
+
+    Args:
+        reserved_tokens: 系统提示和本轮用户消息占用的 token 数
+
+    Returns:
+        (摘要, 按时间顺序的窗口内消息)
+    """
+    rows = list(
+        conversation.messages.filter(id__gt=conversation.summary_upto)
+        .order_by('id').values('id', *MESSAGE_FIELDS)
+    )
+    turns = split_turns(rows)
+    reserved_tokens += count_tokens(conversation.summary)
+    start = _window_start(turns, reserved_tokens)
+
+    if 0 < start < _setting('CHAT_SUMMARY_BATCH', 2):
+        total = reserved_tokens + sum(_turn_tokens(turn) for turn in turns)
+        if total <= _setting('CHAT_CONTEXT_TOKENS', 6000):
+            # 未超出预算, 攒够一批再滑动
+            start = 0
+
+    if start > 0:
+        evicted = [message for turn in turns[:start] for message in turn]
+        try:
+            conversation.summary = summarize(conversation.summary, evicted)
+            conversation.summary_upto = evicted[-1]['id']
+            conversation.save(update_fields=['summary', 'summary_upto'])
+            metrics.incr('chat.summary.regenerated')
+        except Exception as e:
+            # 摘要失败不影响本轮对话: 沿用旧摘要, 下次请求重试
+            metrics.incr('chat.summary.failed')
+            print(f"生成对话摘要失败: {e}")
+
+    window = [clean_message(message) for turn in turns[start:] for message in turn]
+    while window and window[0]['role'] != 'user':
+        # 不发送缺少对应工具调用的工具结果
+        window.pop(0)
+    return conversation.summary, window
+
+
+def summary_message(summary: str) -> Dict[str, Any]:
+    return {"role": "system", "content": f"以下是与该用户更早对话的摘要, 供参考:\n{summary}"}
@@ -0,0 +1,96 @@
+# chat/conversations.py
+
+"""
+服务端对话存储
+
+每轮对话只从数据库加载最近 CHAT_HISTORY_WINDOW 条消息发给模型, 本轮产生的消息
+(用户消息、工具调用、工具结果、最终回复)在本轮成功结束后一次性写入。
+"""
+
+from typing import Any, Dict, List, Optional
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import transaction
+
+from .models import Conversation, Message
+
+# 返回给客户端和发给模型的消息只保留这些字段
+MESSAGE_FIELDS = ('role', 'content', 'tool_calls', 'tool_call_id', 'name')
+
+
+def _window_size() -> int:
+    return getattr(settings, 'CHAT_HISTORY_WINDOW', 40)
+
+
+def clean_message(message: Dict[str, Any]) -> Dict[str, Any]:
+    """去掉模型返回消息中的空字段(function_call、refusal 等)"""
+    cleaned = {'role': message['role'], 'content': message.get('content')}
+    for key in ('tool_calls', 'tool_call_id', 'name'):
+        if message.get(key):
+            cleaned[key] = message[key]
+    return cleaned
+
+
+def get_conversation(user_id: int, conversation_id) -> Optional[Conversation]:
+    try:
+        return Conversation.objects.filter(pk=conversation_id, user_id=user_id).first()
+    except ValidationError:
+        # conversation_id 不是合法的 UUID
+        return None
+
+
+def create_conversation(user_id: int, first_message: str) -> Conversation:
+    return Conversation.objects.create(user_id=user_id, title=first_message[:50])
+
+
+def get_or_create_legacy_conversation(user_id: int, first_message: str) -> Conversation:
+    """
+    旧客户端每轮都不带对话ID, 所有轮次追加到该用户的同一个对话中, 不会每轮新建对话
+
+    客户端带来的本地历史不保存(见 _start_turn), 对话中只有在服务端发生过的轮次, 每条消息只保存一次。
+    """
+    conversation = Conversation.objects.filter(user_id=user_id, legacy=True).first()
+    if conversation is None:
+        conversation = Conversation.objects.create(user_id=user_id, title=first_message[:50], legacy=True)
+    return conversation
+
+
+def load_window(conversation: Conversation, limit: int = None) -> List[Dict[str, Any]]:
+    """
+    读取最近的消息, 按时间顺序返回
+
+    窗口从一条用户消息开始, 避免只带上工具结果而缺少对应的工具调用(模型会拒绝这样的请求)。
+    """
+    rows = list(
+        conversation.messages.order_by('-id').values(*MESSAGE_FIELDS)[:limit or _window_size()]
+    )[::-1]
+    while rows and rows[0]['role'] != Message.Role.USER:
+        rows.pop(0)
+    return [clean_message(row) for row in rows]
+
+
+def append_messages(conversation: Conversation, messages: List[Dict[str, Any]]):
+    """追加本轮的消息并更新对话时间"""
+    with transaction.atomic():
+        Message.objects.bulk_create([
+            Message(
+                conversation=conversation,
+                role=message['role'],
+                content=message.get('content'),
+                tool_calls=message.get('tool_calls') or None,
+                tool_call_id=message.get('tool_call_id') or '',
+                name=message.get('name') or '',
+            )
+            for message in messages
+        ])
+        conversation.save(update_fields=['updated_at'])
+
+
+def serialize_conversation(conversation: Conversation) -> Dict[str, Any]:
+    return {
+        "conversation_id": str(conversation.id),
+        "title": conversation.title,
+        "created_at": conversation.created_at.isoformat(),
+        "updated_at": conversation.updated_at.isoformat(),
+    }
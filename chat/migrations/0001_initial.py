@@ -0,0 +1,52 @@
+# Generated by Django 5.1.7 on 2026-10-17 23:24
+
+import django.db.models.deletion
+import uuid
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Conversation',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('title', models.CharField(blank=True, max_length=100, verbose_name='标题')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='创建时间')),
+                ('updated_at', models.DateTimeField(auto_now=True, db_index=True, verbose_name='更新时间')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='conversations', to=settings.AUTH_USER_MODEL, verbose_name='所属用户')),
+            ],
+            options={
+                'verbose_name': 'AI对话',
+                'verbose_name_plural': 'AI对话',
+                'ordering': ['-updated_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='Message',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('role', models.CharField(choices=[('user', '用户'), ('assistant', 'AI'), ('tool', '工具')], max_length=10, verbose_name='角色')),
+                ('content', models.TextField(blank=True, null=True, verbose_name='内容')),
+                ('tool_calls', models.JSONField(blank=True, null=True, verbose_name='工具调用')),
+                ('tool_call_id', models.CharField(blank=True, max_length=100, verbose_name='工具调用ID')),
+                ('name', models.CharField(blank=True, max_length=100, verbose_name='工具名称')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='创建时间')),
+                ('conversation', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='messages', to='chat.conversation', verbose_name='所属对话')),
+            ],
+            options={
+                'verbose_name': '对话消息',
+                'verbose_name_plural': '对话消息',
+                'ordering': ['id'],
+                'indexes': [models.Index(fields=['conversation', 'id'], name='chat_message_window_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.1.7 on 2026-10-17 23:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='conversation',
+            name='summary',
+            field=models.TextField(blank=True, verbose_name='早期对话摘要'),
+        ),
+        migrations.AddField(
+            model_name='conversation',
+            name='summary_upto',
+            field=models.PositiveBigIntegerField(default=0, verbose_name='摘要覆盖到的消息'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.7 on 2026-10-17 23:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0002_conversation_summary_conversation_summary_upto'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='conversation',
+            name='legacy',
+            field=models.BooleanField(default=False, verbose_name='旧客户端对话'),
+        ),
+    ]
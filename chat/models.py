@@ -0,0 +1,71 @@
+# chat/models.py
+
+import uuid
+
+from django.conf import settings
+from django.db import models
+
+
+class Conversation(models.Model):
+    """
+    服务端保存的AI对话
+
+    客户端每轮只发送新消息和对话ID, 服务端追加消息并只加载最近的一段历史发给模型,
+    更早的消息压缩为滚动摘要(见 chat/context.py)。
+    """
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='conversations',
+        verbose_name="所属用户"
+    )
+    title = models.CharField(max_length=100, blank=True, verbose_name="标题")
+    summary = models.TextField(blank=True, verbose_name="早期对话摘要")
+    # 摘要已覆盖到的最后一条消息的 id, 之后的消息按原文发给模型
+    summary_upto = models.PositiveBigIntegerField(default=0, verbose_name="摘要覆盖到的消息")
+    # 旧客户端(只发送本地历史、不带对话ID)的轮次都追加到该用户唯一的旧版对话中
+    legacy = models.BooleanField(default=False, verbose_name="旧客户端对话")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="创建时间")
+    updated_at = models.DateTimeField(auto_now=True, db_index=True, verbose_name="更新时间")
+
+    class Meta:
+        verbose_name = "AI对话"
+        verbose_name_plural = "AI对话"
+        ordering = ['-updated_at']
+
+    def __str__(self):
+        return f"{self.user} - {self.title or self.id}"
+
+
+class Message(models.Model):
+    """对话中的一条消息(用户消息、模型回复/工具调用、工具结果), 按 id 顺序排列"""
+
+    class Role(models.TextChoices):
+        USER = 'user', "用户"
+        ASSISTANT = 'assistant', "AI"
+        TOOL = 'tool', "工具"
+
+    conversation = models.ForeignKey(
+        Conversation,
+        on_delete=models.CASCADE,
+        related_name='messages',
+        verbose_name="所属对话"
+    )
+    role = models.CharField(max_length=10, choices=Role.choices, verbose_name="角色")
+    content = models.TextField(null=True, blank=True, verbose_name="内容")
+    tool_calls = models.JSONField(null=True, blank=True, verbose_name="工具调用")  # assistant 消息
+    tool_call_id = models.CharField(max_length=100, blank=True, verbose_name="工具调用ID")  # tool 消息
+    name = models.CharField(max_length=100, blank=True, verbose_name="工具名称")  # tool 消息
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="创建时间")
+
+    class Meta:
+        verbose_name = "对话消息"
+        verbose_name_plural = "对话消息"
+        ordering = ['id']
+        indexes = [
+            models.Index(fields=['conversation', 'id'], name='chat_message_window_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.get_role_display()}: {(self.content or '')[:30]}"
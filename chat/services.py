@@ -1,15 +1,194 @@
+"""
+OpenAI 客户端
+
+- get_sync_client(): 同步客户端(WSGI 视图使用), 首次使用时创建, 复用 httpx 连接池
+- get_async_llm(): 异步客户端封装(ASGI 异步视图使用), 带并发上限、单次调用超时、
+  带随机抖动的指数退避重试, 每个事件循环复用一个连接池
+
+并发上限、超时和重试次数见 settings.LLM_MAX_CONCURRENCY / LLM_TIMEOUT / LLM_MAX_RETRIES。
+"""
+
+import asyncio
 import os
-from django.http import JsonResponse
-from openai import OpenAI
-from dotenv import load_dotenv
+import random
+import threading
+import weakref
+from contextlib import contextmanager
 from pathlib import Path
 
+import httpx
+from django.conf import settings
+from dotenv import load_dotenv
+from openai import (
+    OpenAI, AsyncOpenAI,
+    APIConnectionError, APITimeoutError, InternalServerError, RateLimitError,
+)
+
+from core import metrics
+
 BASE_DIR = Path(__file__).resolve().parent.parent
 load_dotenv(BASE_DIR / '.env')
 api_key = os.getenv("OPENAI_API_KEY")
 base_url = os.getenv("OPENAI_BASE_URL")
 
-client = OpenAI(
-    base_url=base_url,
-    api_key=api_key,
-)
\ No newline at end of file
+# 可以重试的错误: 网络错误、超时、限流和服务端5xx
+RETRYABLE_ERRORS = (APIConnectionError, APITimeoutError, RateLimitError, InternalServerError)
+
+_sync_client = None
+_sync_client_lock = threading.Lock()
+
+
+def _max_concurrency() -> int:
+    return getattr(settings, 'LLM_MAX_CONCURRENCY', 100)
+
+
+def _timeout() -> float:
+    return getattr(settings, 'LLM_TIMEOUT', 60.0)
+
+
+def _max_retries() -> int:
+    return getattr(settings, 'LLM_MAX_RETRIES', 2)
+
+
+def _pool_limits() -> httpx.Limits:
+    return httpx.Limits(max_connections=_max_concurrency(), max_keepalive_connections=_max_concurrency())
+
+
+def get_sync_client() -> OpenAI:
+    """获取进程内共享的同步客户端"""
+    global _sync_client
+    if _sync_client is None:
+        with _sync_client_lock:
+            if _sync_client is None:
+                _sync_client = OpenAI(
+                    base_url=base_url,
+                    api_key=api_key,
+                    timeout=_timeout(),
+                    max_retries=_max_retries(),
+                    http_client=httpx.Client(limits=_pool_limits(), timeout=_timeout()),
+                )
+    return _sync_client
+
+
+@contextmanager
+def override_llm_endpoint(endpoint_url: str, endpoint_key: str = "stub"):
+    """
+    临时把进程内共享的客户端指向其他 OpenAI 兼容服务(如本地桩服务), 用于基准测试
+
+    退出时恢复原来的地址; 期间创建的客户端会被丢弃。
+    """
+    global api_key, base_url, _sync_client
+    with _sync_client_lock:
+        saved = api_key, base_url, _sync_client
+        api_key, base_url, _sync_client = endpoint_key, endpoint_url, None
+        _async_clients.clear()
+    try:
+        yield
+    finally:
+        with _sync_client_lock:
+            api_key, base_url, _sync_client = saved
+            _async_clients.clear()
+
+
+def __getattr__(name):
+    # 兼容旧代码的 from chat.services import client
+    if name == 'client':
+        return get_sync_client()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+class AsyncLLMClient:
+    """
+    AsyncOpenAI 的并发受限封装
+
+    同一事件循环内的所有调用共享一个信号量和连接池, 超过并发上限的调用排队等待,
+    不会无限制地占用连接; 可重试错误按 base * 2^n 的上限随机等待后重试(full jitter)。
+    """
+
+    def __init__(self, max_concurrency: int = None, timeout: float = None, max_retries: int = None,
+                 backoff_base: float = 0.5, backoff_max: float = 8.0, openai_client: AsyncOpenAI = None):
+        max_concurrency = max_concurrency or _max_concurrency()
+        self.timeout = timeout or _timeout()
+        self.max_retries = _max_retries() if max_retries is None else max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self.client = openai_client or AsyncOpenAI(
+            base_url=base_url,
+            api_key=api_key,
+            timeout=self.timeout,
+            max_retries=0,  # 重试由本类负责
+            http_client=httpx.AsyncClient(
+                limits=httpx.Limits(max_connections=max_concurrency, max_keepalive_connections=max_concurrency),
+                timeout=self.timeout,
+            ),
+        )
+
+    def _backoff(self, attempt: int) -> float:
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    async def chat_completion(self, timeout: float = None, **kwargs):
+        """
+        调用 chat.completions.create
+
+        Args:
+            timeout: 本次调用的超时(秒), 默认使用 LLM_TIMEOUT; 不包含排队等待的时间
+            kwargs: 传给 chat.completions.create 的参数
+        """
+        timeout = timeout or self.timeout
+        attempt = 0
+        while True:
+            async with self._semaphore:
+                try:
+                    return await self.client.chat.completions.create(timeout=timeout, **kwargs)
+                except RETRYABLE_ERRORS:
+                    if attempt >= self.max_retries:
+                        metrics.incr('llm.async.failed')
+                        raise
+            # 退避期间释放信号量, 让其他调用先执行
+            metrics.incr('llm.async.retries')
+            await asyncio.sleep(self._backoff(attempt))
+            attempt += 1
+
+    async def chat_completion_stream(self, timeout: float = None, **kwargs):
+        """
+        流式调用 chat.completions.create, 逐个产出 chunk
+
+        建立连接失败时按 chat_completion 的规则重试; 开始产出后不再重试(已产出的内容无法撤回)。
+        读完整个流之前一直占用并发名额。
+        """
+        timeout = timeout or self.timeout
+        attempt = 0
+        while True:
+            async with self._semaphore:
+                try:
+                    stream = await self.client.chat.completions.create(timeout=timeout, stream=True, **kwargs)
+                except RETRYABLE_ERRORS:
+                    if attempt >= self.max_retries:
+                        metrics.incr('llm.async.failed')
+                        raise
+                else:
+                    async with stream:
+                        async for chunk in stream:
+                            yield chunk
+                    return
+            metrics.incr('llm.async.retries')
+            await asyncio.sleep(self._backoff(attempt))
+            attempt += 1
+
+    async def aclose(self):
+        await self.client.close()
+
+
+# 信号量和 httpx 连接池都绑定创建它们的事件循环, 因此每个事件循环各用一个实例;
+# ASGI 部署下整个进程只有一个事件循环, 所有请求共享同一个连接池
+_async_clients = weakref.WeakKeyDictionary()
+
+
+def get_async_llm() -> AsyncLLMClient:
+    """获取当前事件循环共享的异步客户端(必须在协程中调用)"""
+    loop = asyncio.get_running_loop()
+    llm = _async_clients.get(loop)
+    if llm is None:
+        llm = _async_clients[loop] = AsyncLLMClient()
+    return llm
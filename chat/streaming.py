@@ -0,0 +1,87 @@
+# chat/streaming.py
+
+"""
+流式对话(SSE)的辅助工具
+
+模型以 chat.completion.chunk 逐块返回内容, 工具调用的名称和参数同样分散在多个块中,
+StreamedMessage 把它们拼回与非流式响应相同的 assistant 消息。
+"""
+
+import json
+from typing import Any, Dict, Optional
+
+from rest_framework.renderers import BaseRenderer
+
+
+def sse_event(event: str, data: Any) -> str:
+    """格式化一条 server-sent event"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+class EventStreamRenderer(BaseRenderer):
+    """
+    让 Accept: text/event-stream 的请求通过 DRF 的内容协商
+
+    只用于开始输出之前的错误响应(认证失败、参数错误等), 内容为一个 error 事件。
+    """
+    media_type = "text/event-stream"
+    format = "event-stream"
+    charset = "utf-8"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return sse_event("error", data).encode("utf-8")
+
+
+def tool_call_event(tool_call: Dict[str, Any]) -> Dict[str, Any]:
+    function = tool_call.get("function", {})
+    return {"id": tool_call.get("id"), "name": function.get("name"), "arguments": function.get("arguments")}
+
+
+def tool_result_event(tool_output: Dict[str, Any]) -> Dict[str, Any]:
+    result = json.loads(tool_output["content"])
+    return {
+        "id": tool_output["tool_call_id"],
+        "name": tool_output["name"],
+        "code": result.get("code"),
+        "message": result.get("message"),
+    }
+
+
+class StreamedMessage:
+    """累积流式响应的各个块"""
+
+    def __init__(self):
+        self.content_parts = []
+        self.tool_calls: Dict[int, Dict[str, Any]] = {}
+        self.usage = None
+
+    def feed(self, chunk) -> Optional[str]:
+        """处理一个块, 返回其中新增的文本(没有时为 None)"""
+        if chunk.usage is not None:
+            # stream_options.include_usage 时最后一个块只带用量
+            self.usage = chunk.usage
+        if not chunk.choices:
+            return None
+
+        delta = chunk.choices[0].delta
+        for part in delta.tool_calls or []:
+            tool_call = self.tool_calls.setdefault(part.index, {
+                "id": None, "type": "function", "function": {"name": "", "arguments": ""},
+            })
+            if part.id:
+                tool_call["id"] = part.id
+            if part.function is not None:
+                tool_call["function"]["name"] += part.function.name or ""
+                tool_call["function"]["arguments"] += part.function.arguments or ""
+
+        if delta.content:
+            self.content_parts.append(delta.content)
+            return delta.content
+        return None
+
+    def message(self) -> Dict[str, Any]:
+        """拼接完成的 assistant 消息, 格式与 clean_message 的结果相同"""
+        message: Dict[str, Any] = {"role": "assistant", "content": "".join(self.content_parts) or None}
+        if self.tool_calls:
+            message["tool_calls"] = [self.tool_calls[index] for index in sorted(self.tool_calls)]
+        return message
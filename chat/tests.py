@@ -1,3 +1,207 @@
+import json
+import threading
+import time
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
 from django.test import TestCase
 
-# Create your tests here.
+from information.models import Information
+from information.services import get_user_info, update_user_info
+from .tools import ToolExecutor
+
+
+def tool_call(call_id, name, **arguments):
+    return {"id": call_id, "type": "function", "function": {"name": name, "arguments": json.dumps(arguments)}}
+
+
+def output_ids(outputs):
+    return [output["tool_call_id"] for output in outputs]
+
+
+class FakeTools:
+    """记录调用顺序的假工具: get_* 为只读工具, 其余按修改处理"""
+
+    def __init__(self):
+        self.log = []
+        self.lock = threading.Lock()
+        # 两个只读调用都开始执行后才能继续, 串行执行时会超时
+        self.barrier = threading.Barrier(2, timeout=5)
+
+    def _record(self, event):
+        with self.lock:
+            self.log.append(event)
+
+    def read(self, name):
+        def tool(user_id, tag, delay=0.0, wait=False, fail=False):
+            self._record(("start", tag))
+            if wait:
+                self.barrier.wait()
+            time.sleep(delay)
+            self._record(("end", tag))
+            if fail:
+                return {"code": 400, "message": f"{tag} 失败", "data": None}
+            return {"code": 200, "message": "ok", "data": {"tag": tag, "tool": name}}
+        return tool
+
+    def write(self, name):
+        def tool(user_id, tag, fail=False):
+            self._record(("start", tag))
+            self._record(("end", tag))
+            if fail:
+                return {"code": 400, "message": f"{tag} 失败", "data": None}
+            return {"code": 200, "message": "ok", "data": {"tag": tag, "tool": name}}
+        return tool
+
+    def tools(self):
+        return {
+            "get_user_info": self.read("get_user_info"),
+            "get_user_plans": self.read("get_user_plans"),
+            "update_user_info": self.write("update_user_info"),
+            "delete_plan": self.write("delete_plan"),
+        }
+
+    def position(self, event, tag):
+        return self.log.index((event, tag))
+
+    def started(self):
+        return [tag for event, tag in self.log if event == "start"]
+
+
+class ToolExecutorTests(TestCase):
+    def setUp(self):
+        self.fake = FakeTools()
+        patcher = mock.patch.dict("chat.tools.AVAILABLE_TOOLS", self.fake.tools())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.executor = ToolExecutor(user_id=1)
+
+    def test_batches_group_consecutive_reads(self):
+        calls = [
+            tool_call("r1", "get_user_info", tag="r1"),
+            tool_call("r2", "get_user_plans", tag="r2"),
+            tool_call("w1", "update_user_info", tag="w1"),
+            tool_call("w2", "delete_plan", tag="w2"),
+            tool_call("r3", "get_user_info", tag="r3"),
+        ]
+        batches = self.executor.batches(calls)
+        self.assertEqual([[call["id"] for call in batch] for batch in batches], [["r1", "r2"], ["w1"], ["w2"], ["r3"]])
+
+    def test_mixed_sequence_runs_in_order(self):
+        calls = [
+            # r1 先开始但最后结束, 也不影响输出顺序
+            tool_call("r1", "get_user_info", tag="r1", delay=0.1, wait=True),
+            tool_call("r2", "get_user_plans", tag="r2", wait=True),
+            tool_call("w1", "update_user_info", tag="w1"),
+            tool_call("r3", "get_user_info", tag="r3-after-write"),
+        ]
+        outputs, error = self.executor.run(calls)
+
+        self.assertIsNone(error)
+        self.assertEqual(output_ids(outputs), ["r1", "r2", "w1", "r3"])
+        self.assertEqual([json.loads(output["content"])["data"]["tag"] for output in outputs],
+                         ["r1", "r2", "w1", "r3-after-write"])
+        # 两个只读调用并行执行, 修改调用在它们都结束后才开始, 之后的只读调用在修改结束后才开始
+        log = self.fake
+        self.assertGreater(log.position("start", "w1"), log.position("end", "r1"))
+        self.assertGreater(log.position("start", "w1"), log.position("end", "r2"))
+        self.assertGreater(log.position("start", "r3-after-write"), log.position("end", "w1"))
+
+    def test_error_stops_later_calls(self):
+        calls = [
+            tool_call("r1", "get_user_info", tag="r1"),
+            tool_call("w1", "update_user_info", tag="w1", fail=True),
+            tool_call("r2", "get_user_plans", tag="r2"),
+            tool_call("w2", "delete_plan", tag="w2"),
+        ]
+        outputs, error = self.executor.run(calls)
+
+        self.assertEqual(output_ids(outputs), ["r1"])
+        self.assertEqual(error[0]["message"], "w1 失败")
+        self.assertEqual(self.fake.started(), ["r1", "w1"])
+
+    def test_error_in_read_batch_returns_first_error_in_order(self):
+        calls = [
+            tool_call("r1", "get_user_info", tag="r1"),
+            tool_call("r2", "get_user_plans", tag="r2", fail=True),
+            tool_call("r3", "get_user_info", tag="r3", fail=True),
+            tool_call("w1", "update_user_info", tag="w1"),
+        ]
+        outputs, error = self.executor.run(calls)
+
+        self.assertEqual(output_ids(outputs), ["r1"])
+        self.assertEqual(error[0]["message"], "r2 失败")
+        self.assertNotIn("w1", self.fake.started())
+
+    def test_unknown_tool_is_an_error(self):
+        outputs, error = self.executor.run([tool_call("x1", "drop_tables")])
+        self.assertEqual(outputs, [])
+        self.assertEqual(error[1], 400)
+
+
+class ToolMemoTests(TestCase):
+    """同一请求内只读工具结果的缓存, 以及修改工具执行后的失效"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user(username='memo', password='password123')
+        Information.objects.create(user=cls.user, height=170, weight=60, age=30, gender='M')
+
+    def setUp(self):
+        cache.clear()
+        self.executor = ToolExecutor(self.user.id)
+
+    def _weight(self, outputs):
+        return json.loads(outputs[-1]["content"])["data"]["weight"]
+
+    def test_update_invalidates_cached_read(self):
+        get_info = mock.Mock(wraps=get_user_info)
+        with mock.patch.dict("chat.tools.AVAILABLE_TOOLS", {"get_user_info": get_info}):
+            outputs, _ = self.executor.run([tool_call("r1", "get_user_info", attributes=["weight"])])
+            self.assertEqual(self._weight(outputs), 60)
+
+            # 参数相同时直接复用缓存的结果, 输出使用本次调用的 id
+            outputs, _ = self.executor.run([tool_call("r2", "get_user_info", attributes=["weight"])])
+            self.assertEqual(get_info.call_count, 1)
+            self.assertEqual(output_ids(outputs), ["r2"])
+
+            # 个人信息快照在事务提交后才失效
+            with self.captureOnCommitCallbacks(execute=True):
+                _, error = self.executor.run([tool_call("w1", "update_user_info", weight=70)])
+            self.assertIsNone(error)
+
+            outputs, _ = self.executor.run([tool_call("r3", "get_user_info", attributes=["weight"])])
+            self.assertEqual(get_info.call_count, 2)
+            self.assertEqual(self._weight(outputs), 70)
+
+    def test_write_only_invalidates_affected_reads(self):
+        fake = FakeTools()
+        get_plans = mock.Mock(wraps=fake.read("get_user_plans"))
+        get_info = mock.Mock(wraps=fake.read("get_user_info"))
+        tools = {"get_user_info": get_info, "get_user_plans": get_plans, "update_user_info": update_user_info}
+        with mock.patch.dict("chat.tools.AVAILABLE_TOOLS", tools):
+            reads = [tool_call("r1", "get_user_info", tag="info"), tool_call("r2", "get_user_plans", tag="plans")]
+            self.executor.run(reads)
+            self.executor.run([tool_call("w1", "update_user_info", weight=65)])
+            self.executor.run(reads)
+
+        self.assertEqual(get_info.call_count, 2)
+        self.assertEqual(get_plans.call_count, 1)
+
+    def test_write_missing_from_invalidates_clears_everything(self):
+        fake = FakeTools()
+        get_plans = mock.Mock(wraps=fake.read("get_user_plans"))
+        get_info = mock.Mock(wraps=fake.read("get_user_info"))
+        tools = {"get_user_info": get_info, "get_user_plans": get_plans, "reset_profile": fake.write("reset_profile")}
+        with mock.patch.dict("chat.tools.AVAILABLE_TOOLS", tools):
+            reads = [tool_call("r1", "get_user_info", tag="info"), tool_call("r2", "get_user_plans", tag="plans")]
+            self.executor.run(reads)
+            self.executor.run(reads)
+            self.assertEqual((get_info.call_count, get_plans.call_count), (1, 1))
+
+            _, error = self.executor.run([tool_call("w1", "reset_profile", tag="reset")])
+            self.assertIsNone(error)
+            self.executor.run(reads)
+
+        self.assertEqual((get_info.call_count, get_plans.call_count), (2, 2))
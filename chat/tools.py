@@ -0,0 +1,232 @@
+# chat/tools.py
+
+"""
+AI 对话可调用的工具及其执行
+
+模型一次回复中常同时发出多个工具调用。只读工具之间互不影响, 连续的只读调用在线程池中并行执行;
+修改数据的工具按模型给出的顺序逐个执行, 并且同一用户的修改(包括该用户同时进行的其他对话)互斥,
+后面的只读调用一定能看到前面修改的结果。
+
+同一次请求中模型常在多轮里重复查询相同的信息, 只读工具的结果按 (工具, 参数) 缓存在本次请求的
+ToolExecutor 中, 相同的调用直接复用; 修改数据的工具执行后, 清除受其影响的只读工具的缓存。
+"""
+
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional, Tuple
+
+from django.conf import settings
+from django.db import connection
+from rest_framework import status
+
+from core import metrics
+from core.types import ServiceResult
+from information.services import update_user_info, get_user_info
+from plan.services import create_or_update_plans, get_user_plans, delete_plan, delete_all_plans, create_bulk_plans
+
+# 将所有 AI 可用工具放入一个字典
+AVAILABLE_TOOLS = {
+    "update_user_info": update_user_info,
+    "get_user_info": get_user_info,
+    "create_or_update_plans": create_or_update_plans,
+    "get_user_plans": get_user_plans,
+    "delete_plan": delete_plan,
+    "delete_all_plans": delete_all_plans,
+    "create_bulk_plans": create_bulk_plans,
+}
+
+# 只读工具, 其余工具都视为会修改数据(新增的工具默认按修改处理)
+READ_ONLY_TOOLS = frozenset({"get_user_info", "get_user_plans"})
+
+# 修改工具会使哪些只读工具的缓存结果失效(未列出的工具清除全部缓存)
+INVALIDATES = {
+    "update_user_info": frozenset({"get_user_info"}),
+    "create_or_update_plans": frozenset({"get_user_plans"}),
+    "create_bulk_plans": frozenset({"get_user_plans"}),
+    "delete_plan": frozenset({"get_user_plans"}),
+    "delete_all_plans": frozenset({"get_user_plans"}),
+}
+
+# 按用户 id 分段的锁, 同一用户的修改在进程内串行执行
+_MUTATION_LOCKS = [threading.Lock() for _ in range(64)]
+
+_pool = None
+_pool_lock = threading.Lock()
+
+ToolError = Tuple[Dict[str, Any], int]
+ToolResult = Tuple[Optional[Dict[str, Any]], Optional[ToolError]]
+
+
+def _get_pool() -> ThreadPoolExecutor:
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ThreadPoolExecutor(
+                    max_workers=getattr(settings, 'CHAT_TOOL_WORKERS', 4),
+                    thread_name_prefix='chat-tool',
+                )
+    return _pool
+
+
+def _tool_name(tool_call: Dict[str, Any]) -> Optional[str]:
+    return tool_call.get("function", {}).get("name")
+
+
+def is_read_only(tool_call: Dict[str, Any]) -> bool:
+    return _tool_name(tool_call) in READ_ONLY_TOOLS
+
+
+def _memo_key(tool_call: Dict[str, Any]) -> Optional[Tuple[str, str]]:
+    """(工具名, 规范化的参数), 参数无法解析时返回 None(不缓存, 交给 run_tool_call 报错)"""
+    function = tool_call.get("function", {})
+    try:
+        args = json.loads(function.get("arguments", "{}"))
+    except (TypeError, json.JSONDecodeError):
+        return None
+    return function.get("name"), json.dumps(args, sort_keys=True, ensure_ascii=False)
+
+
+def run_tool_call(tool_call: Dict[str, Any], user_id: int) -> ToolResult:
+    """
+    执行一次工具调用(同步, 会访问数据库)
+
+    Returns:
+        (工具输出消息, 错误), 错误为 (响应内容, HTTP 状态码), 成功时为 None
+    """
+    function_name = _tool_name(tool_call)
+    tool_function = AVAILABLE_TOOLS.get(function_name)
+
+    if not tool_function:
+        return None, ({"code": 400, "message": f"错误：AI试图调用未知工具'{function_name}'", "data": None}, status.HTTP_400_BAD_REQUEST)
+
+    try:
+        function_args_str = tool_call.get("function", {}).get("arguments", "{}")
+        function_args = json.loads(function_args_str)
+    except json.JSONDecodeError:
+        return None, ({"code": 500, "message": "AI内部错误：生成的工具参数格式不正确"}, status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+    function_args['user_id'] = user_id
+
+    result_from_tool: ServiceResult = tool_function(**function_args)
+
+    if result_from_tool['code'] not in [200, 201]:
+        return None, (result_from_tool, status.HTTP_400_BAD_REQUEST)
+
+    return {
+        "tool_call_id": tool_call.get("id"),
+        "role": "tool",
+        "name": function_name,
+        "content": json.dumps(result_from_tool, ensure_ascii=False)
+    }, None
+
+
+class ToolExecutor:
+    """执行一轮对话中某个用户的工具调用, 每次请求使用一个实例(只读结果的缓存随请求结束丢弃)"""
+
+    def __init__(self, user_id: int):
+        self.user_id = user_id
+        self._memo: Dict[Tuple[str, str], str] = {}
+
+    def batches(self, tool_calls: List[Dict[str, Any]]) -> List[List[Dict[str, Any]]]:
+        """按顺序分组: 连续的只读调用为一组, 每个修改调用单独一组"""
+        batches: List[List[Dict[str, Any]]] = []
+        for tool_call in tool_calls:
+            if is_read_only(tool_call) and batches and is_read_only(batches[-1][0]):
+                batches[-1].append(tool_call)
+            else:
+                batches.append([tool_call])
+        return batches
+
+    def _run_in_worker(self, tool_call: Dict[str, Any]):
+        try:
+            return run_tool_call(tool_call, self.user_id)
+        finally:
+            # 工作线程不经过请求结束的清理, 自行关闭数据库连接
+            connection.close()
+
+    def _run_reads(self, batch: List[Dict[str, Any]]) -> List[ToolResult]:
+        """执行一组只读调用: 已缓存或组内重复的调用不再执行, 其余并行执行"""
+        keys = [_memo_key(tool_call) for tool_call in batch]
+        pending = {}  # 需要执行的调用: 键 -> 调用, 参数无法解析的调用以下标为键
+        for index, (tool_call, key) in enumerate(zip(batch, keys)):
+            if key is None:
+                pending[index] = tool_call
+            elif key not in self._memo and key not in pending:
+                pending[key] = tool_call
+
+        if len(pending) > 1:
+            fresh = dict(zip(pending, _get_pool().map(self._run_in_worker, pending.values())))
+        else:
+            fresh = {key: run_tool_call(tool_call, self.user_id) for key, tool_call in pending.items()}
+
+        results = []
+        for index, (tool_call, key) in enumerate(zip(batch, keys)):
+            if key is None:
+                results.append(fresh[index])
+            elif key in self._memo:
+                metrics.incr('chat.tool_cache.hit')
+                results.append(({
+                    "tool_call_id": tool_call.get("id"),
+                    "role": "tool",
+                    "name": key[0],
+                    "content": self._memo[key],
+                }, None))
+            else:
+                tool_output, error = fresh[key]
+                if error is None:
+                    self._memo[key] = tool_output["content"]
+                    metrics.incr('chat.tool_cache.miss')
+                    tool_output = dict(tool_output, tool_call_id=tool_call.get("id"))
+                results.append((tool_output, error))
+        return results
+
+    def _run_write(self, tool_call: Dict[str, Any]) -> ToolResult:
+        try:
+            with _MUTATION_LOCKS[self.user_id % len(_MUTATION_LOCKS)]:
+                return run_tool_call(tool_call, self.user_id)
+        finally:
+            affected = INVALIDATES.get(_tool_name(tool_call), READ_ONLY_TOOLS)
+            self._memo = {key: content for key, content in self._memo.items() if key[0] not in affected}
+
+    def run_batch(self, batch: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], Optional[ToolError]]:
+        """
+        执行一组调用
+
+        Returns:
+            (按调用顺序的工具输出消息, 错误); 有调用失败时返回按顺序的第一个错误
+        """
+        if is_read_only(batch[0]):
+            results = self._run_reads(batch)
+        else:
+            results = [self._run_write(batch[0])]
+
+        outputs = []
+        for tool_output, error in results:
+            if error:
+                return outputs, error
+            outputs.append(tool_output)
+        return outputs, None
+
+    @contextmanager
+    def phase(self):
+        """记录一次工具执行阶段(模型一次回复中的所有调用)的总耗时"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            metrics.observe('chat.tools', time.perf_counter() - started)
+
+    def run(self, tool_calls: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], Optional[ToolError]]:
+        """执行模型一次回复中的所有调用, 返回 (工具输出消息, 错误); 出错时输出包含出错调用之前的所有成功调用"""
+        outputs = []
+        with self.phase():
+            for batch in self.batches(tool_calls):
+                batch_outputs, error = self.run_batch(batch)
+                outputs.extend(batch_outputs)
+                if error:
+                    return outputs, error
+        return outputs, None
@@ -1,6 +1,14 @@
+from django.conf import settings
 from django.urls import path
 from . import views
 
+# ASGI 部署时可切换为异步视图, 接口地址不变
+chat_entry = views.achat_view if settings.LLM_ASYNC_VIEWS else views.chat_view
+chat_stream_entry = views.achat_stream_view if settings.LLM_ASYNC_VIEWS else views.chat_stream_view
+
 urlpatterns = [
-    path('', views.chat_view, name='chat_prototype'),
-]
\ No newline at end of file
+    path('', chat_entry, name='chat_prototype'),
+    path('stream/', chat_stream_entry, name='chat-stream'),
+    path('conversations/', views.conversation_list_view, name='conversation-list'),
+    path('conversations/<uuid:conversation_id>/', views.conversation_detail_view, name='conversation-detail'),
+]
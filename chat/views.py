@@ -1,29 +1,34 @@
 import json
-from openai import OpenAI
-from typing import cast, List, Dict, Any, Optional
+from typing import cast, List, Dict, Any, AsyncIterator, Iterator, Optional, Tuple
 
-from rest_framework.decorators import api_view, permission_classes, authentication_classes
+from asgiref.sync import sync_to_async
+from django.db import transaction
+from django.http import JsonResponse, StreamingHttpResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
+
+from rest_framework.decorators import api_view, permission_classes, authentication_classes, renderer_classes
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.authentication import TokenAuthentication
+from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
 from rest_framework import status
-from openai.types.chat import ChatCompletionMessageParam
-
-from information.services import update_user_info, get_user_info
-from plan.services import create_or_update_plans, get_user_plans, delete_plan, delete_all_plans,create_bulk_plans
-from core.types import ServiceResult
-from .services import client
-
-# 将所有 AI 可用工具放入一个字典
-AVAILABLE_TOOLS = {
-    "update_user_info": update_user_info,
-    "get_user_info": get_user_info,
-    "create_or_update_plans": create_or_update_plans,
-    "get_user_plans": get_user_plans,
-    "delete_plan": delete_plan,
-    "delete_all_plans": delete_all_plans,
-    "create_bulk_plans": create_bulk_plans, 
-}
+from openai.types.chat import ChatCompletionMessageParam, ChatCompletionToolParam
+
+from core import metrics
+from core.auth import aauthenticate_token
+from .context import count_tokens, load_context, message_tokens, summary_message, trim_history
+from .conversations import (
+    append_messages, clean_message, create_conversation, get_conversation, get_or_create_legacy_conversation,
+    load_window, serialize_conversation,
+)
+from .models import Conversation
+from .services import get_sync_client, get_async_llm
+from .tools import ToolExecutor
+from .streaming import EventStreamRenderer, StreamedMessage, sse_event, tool_call_event, tool_result_event
+
+CHAT_MODEL = "gpt-4o-mini"  # 使用OpenAI兼容模型
+MAX_TURNS = 5
 
 # 编写所有工具的 JSON 定义
 tools_definition = [
@@ -146,12 +151,8 @@ tools_definition = [
     }
 ]
 
-def rebuild_and_validate_messages(history: List[Dict[str, Any]], new_user_message: str) -> Optional[List[ChatCompletionMessageParam]]:
-    """
-    接收前端传来的历史记录和新消息，将其重构为 OpenAI API 能接受的干净格式。
-    """
-    # --- 这是最核心的修改：重写系统提示 ---
-    system_prompt = """你是一个积极主动、效率极高的顶级私人健康教练,能够主动提供健康计划和建议,包括饮食和运动,给出计划和建议的时候,要充分考虑用户的个人情况,在相关回复中体现出来你考虑的用户的情况,给出专业依据!!!
+# --- 这是最核心的修改：重写系统提示 ---
+SYSTEM_PROMPT = """你是一个积极主动、效率极高的顶级私人健康教练,能够主动提供健康计划和建议,包括饮食和运动,给出计划和建议的时候,要充分考虑用户的个人情况,在相关回复中体现出来你考虑的用户的情况,给出专业依据!!!
 
     **你的核心行为准则：**
     1.  **主动性**: 当用户提出模糊的请求，特别是第一次要求“制定计划”时，**你绝不能反问用户要细节**。你必须主动地、像一个专家一样，为用户生成一个全面、均衡的、为期一周的默认健康计划。
@@ -170,7 +171,12 @@ def rebuild_and_validate_messages(history: List[Dict[str, Any]], new_user_messag
 
     请严格遵循以上规则，始终选择最高效的工具来完成任务。"""
 
-    rebuilt_messages: List[ChatCompletionMessageParam] = [{"role": "system", "content": system_prompt}]
+
+def rebuild_and_validate_messages(history: List[Dict[str, Any]], new_user_message: str) -> Optional[List[ChatCompletionMessageParam]]:
+    """
+    接收前端传来的历史记录和新消息，将其重构为 OpenAI API 能接受的干净格式。
+    """
+    rebuilt_messages: List[ChatCompletionMessageParam] = [{"role": "system", "content": SYSTEM_PROMPT}]
 
     for msg in history:
         if not isinstance(msg, dict) or "role" not in msg:
@@ -195,6 +201,147 @@ def rebuild_and_validate_messages(history: List[Dict[str, Any]], new_user_messag
     return rebuilt_messages
 
 
+class ChatTurn:
+    """
+    一轮对话: 所属对话(首轮为 None, 成功后才创建)、发给模型的消息列表、本轮消息的起始位置,
+    以及旧客户端带来的历史(不保存, 只用于在响应中返回完整的 history); 不是旧客户端时为 None
+    """
+
+    def __init__(self, user_id: int, user_message: str, conversation: Optional[Conversation],
+                 messages: List[ChatCompletionMessageParam], client_history: Optional[List[Dict[str, Any]]]):
+        self.user_id = user_id
+        self.user_message = user_message
+        self.conversation = conversation
+        self.messages = messages
+        self.client_history = client_history
+        self.turn_start = len(messages) - 1  # 本轮的用户消息
+        self.model_calls = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+
+    def record_usage(self, response):
+        """累计本轮各次模型调用的 token 用量(服务未返回用量时按消息估算提示部分)"""
+        self.model_calls += 1
+        usage = getattr(response, 'usage', None)
+        if usage is not None:
+            self.prompt_tokens += usage.prompt_tokens
+            self.completion_tokens += usage.completion_tokens
+        else:
+            self.prompt_tokens += sum(message_tokens(message) for message in self.messages)
+
+
+def _start_turn(user_id: int, data) -> Tuple[Optional[Tuple[Dict[str, Any], int]], Optional[ChatTurn]]:
+    """
+    校验请求体, 加载对话历史并构造发给模型的消息列表
+
+    Returns:
+        (错误, 本轮对话), 错误为 (响应内容, HTTP 状态码), 校验通过时为 None
+    """
+    try:
+        user_message = data.get('message')
+        conversation_id = data.get('conversation_id')
+        if not user_message:
+            return ({"code": 300, "message": "message 字段不能为空", "data": None}, status.HTTP_400_BAD_REQUEST), None
+
+        # 系统提示和本轮用户消息总会发给模型, 历史只能使用剩余的预算
+        reserved_tokens = count_tokens(SYSTEM_PROMPT) + count_tokens(str(user_message))
+
+        client_history = None
+        if 'history' in data:
+            # 兼容旧客户端: 本地保存的历史不写入服务端, 只在响应中加上本轮消息原样返回
+            rebuilt = rebuild_and_validate_messages(data.get('history') or [], str(user_message))
+            if rebuilt is None:
+                return ({"code": 400, "message": "历史记录格式无法处理", "data": None}, status.HTTP_400_BAD_REQUEST), None
+            client_history = rebuilt[1:-1]
+
+        conversation = None
+        summary = ""
+        if conversation_id:
+            conversation = get_conversation(user_id, conversation_id)
+            if conversation is None:
+                return ({"code": 404, "message": "对话不存在", "data": None}, status.HTTP_404_NOT_FOUND), None
+            summary, history = load_context(conversation, reserved_tokens)
+        else:
+            # 没有对话ID时旧客户端的历史作为本轮的临时上下文, 只把预算内的部分发给模型
+            history = trim_history(client_history or [], reserved_tokens)
+
+        messages = rebuild_and_validate_messages(history, str(user_message))
+        if messages is None:
+            return ({"code": 400, "message": "历史记录格式无法处理", "data": None}, status.HTTP_400_BAD_REQUEST), None
+        if summary:
+            messages.insert(1, summary_message(summary))
+    except Exception as e:
+        return ({"code": 400, "message": f"请求体解析或消息重构时出错: {e}", "data": None}, status.HTTP_400_BAD_REQUEST), None
+    return None, ChatTurn(user_id, str(user_message), conversation, messages, client_history)
+
+
+def _finish_turn(turn: ChatTurn, reply: Optional[str]) -> Dict[str, Any]:
+    """保存本轮消息, 返回只包含本轮消息的响应内容"""
+    new_messages = [clean_message(message) for message in turn.messages[turn.turn_start:]]
+    with transaction.atomic():
+        if turn.conversation is None:
+            if turn.client_history is not None:
+                turn.conversation = get_or_create_legacy_conversation(turn.user_id, turn.user_message)
+            else:
+                turn.conversation = create_conversation(turn.user_id, turn.user_message)
+        append_messages(turn.conversation, new_messages)
+
+    metrics.incr('chat.model_calls', turn.model_calls)
+    metrics.incr('chat.prompt_tokens', turn.prompt_tokens)
+    metrics.incr('chat.completion_tokens', turn.completion_tokens)
+    data = {
+        "reply": reply,
+        "conversation_id": str(turn.conversation.id),
+        "messages": new_messages,
+        "usage": {
+            "model_calls": turn.model_calls,
+            "prompt_tokens": turn.prompt_tokens,
+            "completion_tokens": turn.completion_tokens,
+        },
+    }
+    if turn.client_history is not None:
+        # 旧客户端仍按完整历史渲染: 客户端发来的历史(而不是发给模型的窗口)加上本轮消息
+        data["history"] = turn.messages[:1] + turn.client_history + new_messages
+    return {"code": 200, "message": "获取成功", "data": data}
+
+
+def _completion_kwargs(messages: List[ChatCompletionMessageParam]) -> Dict[str, Any]:
+    return {
+        "model": CHAT_MODEL,
+        "messages": messages,
+        "tools": cast(List[ChatCompletionToolParam], tools_definition),
+        "tool_choice": "auto",
+    }
+
+
+TURN_LIMIT_ERROR = {"code": 500, "message": "处理超时，AI交互超过最大轮次限制", "data": None}
+
+
+def _service_error(e: Exception) -> Dict[str, Any]:
+    import traceback
+    traceback.print_exc()
+    return {"code": 500, "message": f"与AI服务通信时发生严重错误: {str(e)}", "data": None}
+
+
+async def _aprepare_turn(request) -> Tuple[Optional[JsonResponse], Any, Optional[ChatTurn]]:
+    """异步视图不经过 DRF: 自行完成 Token 认证和请求体解析, 返回 (错误响应, 用户, 本轮对话)"""
+    user = await aauthenticate_token(request)
+    if user is None:
+        return JsonResponse({"detail": "身份认证信息未提供或无效。"}, status=status.HTTP_401_UNAUTHORIZED), None, None
+
+    try:
+        data = json.loads(request.body or b"{}")
+        if not isinstance(data, dict):
+            raise ValueError("请求体必须是JSON对象")
+    except ValueError as e:
+        return JsonResponse({"code": 400, "message": f"请求体解析或消息重构时出错: {e}", "data": None}, status=status.HTTP_400_BAD_REQUEST), None, None
+
+    error, turn = await sync_to_async(_start_turn)(user.id, data)
+    if error:
+        return JsonResponse(error[0], status=error[1]), None, None
+    return None, user, turn
+
+
 @api_view(['POST'])
 @authentication_classes([TokenAuthentication])
 @permission_classes([IsAuthenticated])
@@ -202,69 +349,234 @@ def chat_view(request):
     """
     处理与 AI 的对话请求，支持并行工具调用。
     """
+    error, turn = _start_turn(request.user.id, request.data)
+    if error:
+        return Response(error[0], status=error[1])
+
+    messages = turn.messages
+    executor = ToolExecutor(request.user.id)
     try:
-        user_message = request.data.get('message')
-        history = request.data.get('history', [])
-        if not user_message:
-            return Response({"code": 300, "message": "message 字段不能为空", "data": None}, status=status.HTTP_400_BAD_REQUEST)
-        messages = rebuild_and_validate_messages(history, user_message)
-        if messages is None:
-            return Response({"code": 400, "message": "历史记录格式无法处理", "data": None}, status=status.HTTP_400_BAD_REQUEST)
+        client = get_sync_client()
+        for _ in range(MAX_TURNS):
+            response = client.chat.completions.create(**_completion_kwargs(messages))
+            turn.record_usage(response)
+            response_message_dict = clean_message(response.choices[0].message.model_dump())
+            messages.append(response_message_dict)
+
+            if not response_message_dict.get("tool_calls"):
+                payload = _finish_turn(turn, response_message_dict.get("content"))
+                return Response(payload, status=status.HTTP_200_OK)
+
+            tool_outputs, error = executor.run(response_message_dict["tool_calls"])
+            if error:
+                return Response(error[0], status=error[1])
+
+            messages.extend(tool_outputs)
+
+        return Response(TURN_LIMIT_ERROR, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
     except Exception as e:
-        return Response({"code": 400, "message": f"请求体解析或消息重构时出错: {e}", "data": None}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(_service_error(e), status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
-    MAX_TURNS = 5
+
+@csrf_exempt
+@require_POST
+async def achat_view(request):
+    """
+    chat_view 的异步版本(ASGI 部署且 LLM_ASYNC_VIEWS=True 时使用)
+
+    等待模型响应期间不占用工作线程; 工具函数仍是同步的数据库操作, 交给 ToolExecutor 在线程中执行。
+    """
+    error_response, user, turn = await _aprepare_turn(request)
+    if error_response is not None:
+        return error_response
+
+    messages = turn.messages
+    run_tools = sync_to_async(ToolExecutor(user.id).run)
     try:
-        from openai.types.chat import ChatCompletionToolParam
+        llm = get_async_llm()
+        for _ in range(MAX_TURNS):
+            response = await llm.chat_completion(**_completion_kwargs(messages))
+            turn.record_usage(response)
+            response_message_dict = clean_message(response.choices[0].message.model_dump())
+            messages.append(response_message_dict)
+
+            if not response_message_dict.get("tool_calls"):
+                payload = await sync_to_async(_finish_turn)(turn, response_message_dict.get("content"))
+                return JsonResponse(payload, status=status.HTTP_200_OK)
+
+            tool_outputs, error = await run_tools(response_message_dict["tool_calls"])
+            if error:
+                return JsonResponse(error[0], status=error[1])
+
+            messages.extend(tool_outputs)
+
+        return JsonResponse(TURN_LIMIT_ERROR, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+    except Exception as e:
+        return JsonResponse(_service_error(e), status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+def _stream_kwargs(messages: List[ChatCompletionMessageParam]) -> Dict[str, Any]:
+    # 最后一个块附带本次调用的 token 用量
+    return dict(_completion_kwargs(messages), stream_options={"include_usage": True})
+
+
+def _event_stream_response(events) -> StreamingHttpResponse:
+    response = StreamingHttpResponse(events, content_type="text/event-stream; charset=utf-8")
+    response["Cache-Control"] = "no-cache"
+    # 避免 nginx 等反向代理缓冲, 每个事件立即送达客户端
+    response["X-Accel-Buffering"] = "no"
+    return response
+
+
+def _chat_events(turn: ChatTurn, user_id: int) -> Iterator[str]:
+    """逐块调用模型并执行工具, 产出 SSE 事件; 出错时以 error 事件结束(此时响应头已经发出)"""
+    messages = turn.messages
+    executor = ToolExecutor(user_id)
+    try:
+        client = get_sync_client()
+        for _ in range(MAX_TURNS):
+            streamed = StreamedMessage()
+            with client.chat.completions.create(stream=True, **_stream_kwargs(messages)) as stream:
+                for chunk in stream:
+                    content = streamed.feed(chunk)
+                    if content:
+                        yield sse_event("delta", {"content": content})
+            turn.record_usage(streamed)
+            response_message_dict = streamed.message()
+            messages.append(response_message_dict)
+
+            if not response_message_dict.get("tool_calls"):
+                payload = _finish_turn(turn, response_message_dict.get("content"))
+                yield sse_event("reply", payload["data"])
+                return
+
+            tool_outputs = []
+            with executor.phase():
+                for batch in executor.batches(response_message_dict["tool_calls"]):
+                    for tool_call in batch:
+                        yield sse_event("tool_start", tool_call_event(tool_call))
+                    batch_outputs, error = executor.run_batch(batch)
+                    for tool_output in batch_outputs:
+                        yield sse_event("tool_end", tool_result_event(tool_output))
+                    if error:
+                        yield sse_event("error", error[0])
+                        return
+                    tool_outputs.extend(batch_outputs)
+
+            messages.extend(tool_outputs)
+
+        yield sse_event("error", TURN_LIMIT_ERROR)
+
+    except Exception as e:
+        yield sse_event("error", _service_error(e))
 
+
+async def _achat_events(turn: ChatTurn, user_id: int) -> AsyncIterator[str]:
+    """_chat_events 的异步版本"""
+    messages = turn.messages
+    executor = ToolExecutor(user_id)
+    run_batch = sync_to_async(executor.run_batch)
+    try:
+        llm = get_async_llm()
         for _ in range(MAX_TURNS):
-            response = client.chat.completions.create(
-                model="gpt-4o-mini",  # 使用OpenAI兼容模型
-                messages=messages,
-                tools=cast(List[ChatCompletionToolParam], tools_definition),
-                tool_choice="auto",
-            )
-            response_message_dict = response.choices[0].message.model_dump()
+            streamed = StreamedMessage()
+            async for chunk in llm.chat_completion_stream(**_stream_kwargs(messages)):
+                content = streamed.feed(chunk)
+                if content:
+                    yield sse_event("delta", {"content": content})
+            turn.record_usage(streamed)
+            response_message_dict = streamed.message()
             messages.append(response_message_dict)
-            
+
             if not response_message_dict.get("tool_calls"):
-                final_reply = response_message_dict.get("content")
-                response_data = {"code": 200, "message": "获取成功", "data": {"reply": final_reply, "history": messages}}
-                return Response(response_data, status=status.HTTP_200_OK)
+                payload = await sync_to_async(_finish_turn)(turn, response_message_dict.get("content"))
+                yield sse_event("reply", payload["data"])
+                return
 
             tool_outputs = []
-            for tool_call in response_message_dict["tool_calls"]:
-                function_name = tool_call.get("function", {}).get("name")
-                tool_function = AVAILABLE_TOOLS.get(function_name)
-
-                if not tool_function:
-                    return Response({"code": 400, "message": f"错误：AI试图调用未知工具'{function_name}'", "data": None}, status=status.HTTP_400_BAD_REQUEST)
-
-                try:
-                    function_args_str = tool_call.get("function", {}).get("arguments", "{}")
-                    function_args = json.loads(function_args_str)
-                except json.JSONDecodeError:
-                     return Response({"code": 500, "message": "AI内部错误：生成的工具参数格式不正确"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
-
-                function_args['user_id'] = request.user.id
-                
-                result_from_tool: ServiceResult = tool_function(**function_args)
-                
-                if result_from_tool['code'] not in [200, 201]:
-                    return Response(result_from_tool, status=status.HTTP_400_BAD_REQUEST)
-
-                tool_outputs.append({
-                    "tool_call_id": tool_call.get("id"),
-                    "role": "tool",
-                    "name": function_name,
-                    "content": json.dumps(result_from_tool, ensure_ascii=False)
-                })
+            with executor.phase():
+                for batch in executor.batches(response_message_dict["tool_calls"]):
+                    for tool_call in batch:
+                        yield sse_event("tool_start", tool_call_event(tool_call))
+                    batch_outputs, error = await run_batch(batch)
+                    for tool_output in batch_outputs:
+                        yield sse_event("tool_end", tool_result_event(tool_output))
+                    if error:
+                        yield sse_event("error", error[0])
+                        return
+                    tool_outputs.extend(batch_outputs)
 
             messages.extend(tool_outputs)
 
-        return Response({"code": 500, "message": "处理超时，AI交互超过最大轮次限制", "data": None}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        yield sse_event("error", TURN_LIMIT_ERROR)
 
     except Exception as e:
-        import traceback
-        traceback.print_exc()
-        return Response({"code": 500, "message": f"与AI服务通信时发生严重错误: {str(e)}", "data": None}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
\ No newline at end of file
+        yield sse_event("error", _service_error(e))
+
+
+@api_view(['POST'])
+@authentication_classes([TokenAuthentication])
+@permission_classes([IsAuthenticated])
+@renderer_classes([JSONRenderer, EventStreamRenderer])
+def chat_stream_view(request):
+    """
+    chat_view 的流式版本: 以 server-sent events 逐步返回
+
+    事件: delta(模型输出的文本片段)、tool_start / tool_end(工具开始执行 / 执行完成)、
+    reply(最终结果, 内容与 chat_view 响应的 data 相同)、error(出错, 之后不再有事件)。
+    认证失败、请求体校验失败、对话不存在等在开始输出之前发现的错误以对应的 HTTP 状态码返回,
+    内容为 JSON(Accept 为 text/event-stream 时为一个 error 事件)。
+    """
+    error, turn = _start_turn(request.user.id, request.data)
+    if error:
+        return Response(error[0], status=error[1])
+    return _event_stream_response(_chat_events(turn, request.user.id))
+
+
+@csrf_exempt
+@require_POST
+async def achat_stream_view(request):
+    """chat_stream_view 的异步版本(ASGI 部署且 LLM_ASYNC_VIEWS=True 时使用)"""
+    error_response, user, turn = await _aprepare_turn(request)
+    if error_response is not None:
+        return error_response
+    return _event_stream_response(_achat_events(turn, user.id))
+
+
+@api_view(['GET'])
+@authentication_classes([TokenAuthentication])
+@permission_classes([IsAuthenticated])
+def conversation_list_view(request):
+    """当前用户的对话列表, 按最近更新时间倒序"""
+    conversations = Conversation.objects.filter(user=request.user)
+    return Response(
+        {"code": 200, "message": "获取成功", "data": [serialize_conversation(item) for item in conversations]},
+        status=status.HTTP_200_OK,
+    )
+
+
+@api_view(['GET', 'DELETE'])
+@authentication_classes([TokenAuthentication])
+@permission_classes([IsAuthenticated])
+def conversation_detail_view(request, conversation_id):
+    """GET: 对话最近的消息(?limit=条数, 默认 CHAT_HISTORY_WINDOW); DELETE: 删除对话"""
+    conversation = get_conversation(request.user.id, conversation_id)
+    if conversation is None:
+        return Response({"code": 404, "message": "对话不存在", "data": None}, status=status.HTTP_404_NOT_FOUND)
+
+    if request.method == 'DELETE':
+        conversation.delete()
+        return Response({"code": 200, "message": "删除成功", "data": None}, status=status.HTTP_200_OK)
+
+    try:
+        limit = int(request.query_params.get('limit', 0)) or None
+    except ValueError:
+        return Response({"code": 400, "message": "limit 必须是整数", "data": None}, status=status.HTTP_400_BAD_REQUEST)
+    if limit is not None and limit < 0:
+        return Response({"code": 400, "message": "limit 必须是正整数", "data": None}, status=status.HTTP_400_BAD_REQUEST)
+
+    data = serialize_conversation(conversation)
+    data["messages"] = load_window(conversation, limit)
+    return Response({"code": 200, "message": "获取成功", "data": data}, status=status.HTTP_200_OK)
@@ -0,0 +1,28 @@
+# core/auth.py
+
+"""
+异步视图使用的 Token 认证
+
+DRF 的 APIView / api_view 不支持 async 视图, 异步视图是普通的 Django 视图,
+需要自行按 TokenAuthentication 的规则解析 "Authorization: Token <key>" 请求头。
+"""
+
+from typing import Optional
+
+from asgiref.sync import sync_to_async
+from rest_framework.authtoken.models import Token
+
+
+def _get_token_user(key: str):
+    token = Token.objects.select_related('user').filter(key=key).first()
+    if token is None or not token.user.is_active:
+        return None
+    return token.user
+
+
+async def aauthenticate_token(request) -> Optional[object]:
+    """返回请求头中 Token 对应的有效用户, 未提供或无效时返回 None"""
+    parts = request.headers.get('Authorization', '').split()
+    if len(parts) != 2 or parts[0].lower() != 'token':
+        return None
+    return await sync_to_async(_get_token_user)(parts[1])
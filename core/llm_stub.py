@@ -0,0 +1,221 @@
+# core/llm_stub.py
+
+"""
+本地 OpenAI 兼容桩服务, 用于基准测试和压测, 不访问付费的远程 API
+
+在后台线程中监听 127.0.0.1 的端口(默认随机), 对 POST .../chat/completions 返回固定内容:
+带 tools 的对话请求返回一句文字回复, 其他请求返回符合食物识别/营养计算格式的 JSON。
+可以模拟模型延迟、上行带宽(按请求体大小额外等待)和按比例出现的错误响应(429/5xx),
+错误按固定随机种子出现, 相同参数下多次运行的结果一致。
+请求带 stream=true 时以 SSE 分块返回同样的内容(延迟计入首个数据块之前)。
+
+进程内使用:
+    with StubLLMServer(latency=0.5, bandwidth_mbps=20) as server:
+        client = OpenAI(base_url=server.base_url, api_key="stub")
+
+独立运行(其他进程通过 OPENAI_BASE_URL 指向它):
+    python manage.py run_llm_stub --port 8765 --latency 0.5
+"""
+
+import json
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, Optional
+
+# 默认返回的内容: 一份符合食物识别/营养计算输出格式的 JSON
+DEFAULT_CONTENT = json.dumps({
+    "foods": [
+        {"name": "白米饭", "weight": 150, "calories": 174.0, "protein": 3.9, "carbs": 38.9, "fat": 0.5, "note": ""},
+        {"name": "水煮西兰花", "weight": 100, "calories": 34.0, "protein": 2.8, "carbs": 6.6, "fat": 0.4, "note": ""},
+    ],
+    "total": {"total_calories": 208.0, "total_protein": 6.7, "total_carbs": 45.5, "total_fat": 0.9},
+    "analysis_time": "2025-01-01 12:00:00",
+}, ensure_ascii=False)
+
+# 对话请求(带 tools)默认返回的回复
+DEFAULT_CHAT_REPLY = "好的，我已经根据您的情况整理好了建议，您可以在计划页面查看详情。"
+
+# 流式响应每个数据块包含的字符数
+STREAM_CHUNK_CHARS = 8
+
+
+def default_responder(payload: Dict[str, Any]) -> str:
+    return DEFAULT_CHAT_REPLY if payload.get("tools") else DEFAULT_CONTENT
+
+
+class _StubHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # 默认的 listen backlog 只有5, 并发压测时多余的连接会被丢弃并在1秒后重连, 拉高延迟
+    request_queue_size = 1024
+
+
+class StubLLMServer:
+    """
+    Args:
+        latency: 每个请求固定等待的秒数(模拟模型推理时间)
+        bandwidth_mbps: 模拟的上行带宽(Mbit/s), 请求体越大等待越久; None 表示不限制
+        responder: 根据请求 JSON 返回 assistant 消息内容的函数, 默认为 default_responder
+        error_rate: 返回错误响应的请求比例(0-1)
+        error_status: 错误响应的状态码, 如 429(限流)、500、503
+        seed: 决定哪些请求出错的随机种子
+        host / port: 监听地址, port 为 0 时使用随机端口
+    """
+
+    def __init__(self, latency: float = 0.0, bandwidth_mbps: Optional[float] = None,
+                 responder: Callable[[Dict[str, Any]], str] = None, error_rate: float = 0.0,
+                 error_status: int = 500, seed: int = 0, host: str = "127.0.0.1", port: int = 0):
+        self.latency = latency
+        self.bandwidth_mbps = bandwidth_mbps
+        self.responder = responder or default_responder
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.host = host
+        self.port = port
+        self.request_count = 0
+        self.error_count = 0
+        self.bytes_received = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = None
+        self._thread = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self) -> "StubLLMServer":
+        self._server = _StubHTTPServer((self.host, self.port), self._handler_class())
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def serve_forever(self):
+        """阻塞当前线程直到 KeyboardInterrupt, 然后停止服务"""
+        if self._server is None:
+            self.start()
+        try:
+            self._thread.join()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.stop()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def _delay_for(self, body_size: int) -> float:
+        delay = self.latency
+        if self.bandwidth_mbps:
+            delay += body_size * 8 / (self.bandwidth_mbps * 1_000_000)
+        return delay
+
+    def _completion(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        content = self.responder(payload)
+        # 粗略按 4 个字符 1 个 token 返回用量, 便于观察上下文长度的变化
+        prompt_tokens = len(json.dumps(payload.get("messages", []), ensure_ascii=False)) // 4
+        completion_tokens = len(content) // 4
+        return {
+            "id": f"chatcmpl-{uuid.uuid4().hex}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": payload.get("model", "stub"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": content},
+                "finish_reason": "stop",
+            }],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+            },
+        }
+
+    def _completion_chunks(self, payload: Dict[str, Any]):
+        """把完整响应拆成 chat.completion.chunk 数据块"""
+        completion = self._completion(payload)
+        content = completion["choices"][0]["message"]["content"]
+
+        def chunk(delta, finish_reason=None, choices=True):
+            return {
+                "id": completion["id"],
+                "object": "chat.completion.chunk",
+                "created": completion["created"],
+                "model": completion["model"],
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}] if choices else [],
+            }
+
+        yield chunk({"role": "assistant", "content": ""})
+        for start in range(0, len(content), STREAM_CHUNK_CHARS):
+            yield chunk({"content": content[start:start + STREAM_CHUNK_CHARS]})
+        yield chunk({}, finish_reason="stop")
+        if (payload.get("stream_options") or {}).get("include_usage"):
+            yield dict(chunk({}, choices=False), usage=completion["usage"])
+
+    def _handler_class(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+                with stub._lock:
+                    stub.request_count += 1
+                    stub.bytes_received += len(body)
+                    failed = stub.error_rate > 0 and stub._random.random() < stub.error_rate
+                    if failed:
+                        stub.error_count += 1
+
+                if not self.path.endswith("/chat/completions"):
+                    self._send(404, {"error": {"message": f"unknown path {self.path}"}})
+                    return
+
+                time.sleep(stub._delay_for(len(body)))
+                if failed:
+                    self._send(stub.error_status, {"error": {
+                        "message": "stub error", "type": "server_error" if stub.error_status >= 500 else "rate_limit",
+                    }})
+                    return
+                payload = json.loads(body or b"{}")
+                if payload.get("stream"):
+                    self._send_stream(stub._completion_chunks(payload))
+                else:
+                    self._send(200, stub._completion(payload))
+
+            def _send(self, status: int, data: Dict[str, Any]):
+                content = json.dumps(data, ensure_ascii=False).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(content)))
+                self.end_headers()
+                self.wfile.write(content)
+
+            def _send_stream(self, chunks):
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Connection", "close")
+                self.end_headers()
+                for chunk in chunks:
+                    self.wfile.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode("utf-8"))
+                    self.wfile.flush()
+                self.wfile.write(b"data: [DONE]\n\n")
+                self.close_connection = True
+
+            def log_message(self, format, *args):
+                pass  # 不输出访问日志
+
+        return Handler
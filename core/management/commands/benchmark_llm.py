@@ -0,0 +1,128 @@
+# core/management/commands/benchmark_llm.py
+
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from chat.services import override_llm_endpoint
+from chat.views import chat_view
+from core.llm_stub import StubLLMServer
+from core.metrics import summarize
+from nutrition.imaging import Image
+from nutrition.services import FoodAnalysisService, NutritionCalculationService
+from user.models import User
+
+TARGETS = ('analyze', 'calculate', 'chat')
+
+
+class Command(BaseCommand):
+    help = ('在指定并发下压测食物识别、营养计算和AI对话的调用路径, 输出 p50/p95/p99 延迟和吞吐量'
+            '(默认使用进程内桩服务, 不调用付费API)')
+
+    def add_arguments(self, parser):
+        parser.add_argument('targets', nargs='*',
+                            help='要压测的路径: analyze / calculate / chat, 默认全部')
+        parser.add_argument('--requests', type=int, default=50, help='每个路径的请求数, 默认50')
+        parser.add_argument('--concurrency', type=int, default=10, help='并发数, 默认10')
+        parser.add_argument('--base-url', help='使用已运行的 OpenAI 兼容服务(如 run_llm_stub), 不提供时启动进程内桩服务')
+        parser.add_argument('--latency', type=float, default=0.5, help='进程内桩服务模拟的模型耗时(秒), 默认0.5')
+        parser.add_argument('--error-rate', type=float, default=0.0, help='进程内桩服务返回错误的比例(0-1), 默认0')
+        parser.add_argument('--error-status', type=int, default=500, help='进程内桩服务错误响应的状态码, 默认500')
+        parser.add_argument('--seed', type=int, default=0, help='进程内桩服务的随机种子, 默认0')
+
+    def handle(self, *args, **options):
+        targets = options['targets'] or list(TARGETS)
+        unknown = set(targets) - set(TARGETS)
+        if unknown:
+            raise CommandError(f"未知的压测路径: {', '.join(sorted(unknown))}, 可选 {', '.join(TARGETS)}")
+        total = max(1, options['requests'])
+        concurrency = max(1, options['concurrency'])
+
+        if options['base_url']:
+            server = None
+            base_url = options['base_url']
+        else:
+            server = StubLLMServer(latency=options['latency'], error_rate=options['error_rate'],
+                                   error_status=options['error_status'], seed=options['seed']).start()
+            base_url = server.base_url
+
+        # 压测中写入数据库的数据(压测账号及其对话)在结束时删除, 不留在项目数据库中
+        self.cleanups = []
+        try:
+            with override_llm_endpoint(base_url):
+                self.stdout.write(f'服务地址 {base_url}, 每个路径 {total} 个请求, 并发 {concurrency}')
+                for target in targets:
+                    self._report(target, *self._run(getattr(self, f'_prepare_{target}')(total), total, concurrency))
+        finally:
+            for cleanup in self.cleanups:
+                cleanup()
+            if server is not None:
+                server.stop()
+                self.stdout.write(f'桩服务共收到 {server.request_count} 个请求, 其中返回错误 {server.error_count} 个')
+
+    def _run(self, call, total, concurrency):
+        def timed(index):
+            started = time.perf_counter()
+            try:
+                ok = call(index)
+            except Exception:
+                ok = False
+            finally:
+                connection.close()
+            return time.perf_counter() - started, ok
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            outcomes = list(executor.map(timed, range(total)))
+        return outcomes, time.perf_counter() - started
+
+    def _report(self, target, outcomes, elapsed):
+        stats = summarize([latency for latency, _ in outcomes])
+        errors = sum(1 for _, ok in outcomes if not ok)
+        self.stdout.write(self.style.SUCCESS(
+            f"{target:<9} p50 {stats['p50_ms']:.0f}ms  p95 {stats['p95_ms']:.0f}ms  p99 {stats['p99_ms']:.0f}ms  "
+            f"max {stats['max_ms']:.0f}ms  吞吐 {len(outcomes) / elapsed:.1f} req/s  失败 {errors}/{len(outcomes)}"
+        ))
+
+    def _prepare_analyze(self, total):
+        # 直接调用预处理和模型调用, 不经过识别结果缓存(避免命中缓存, 也不写入数据库)
+        images = [self._sample_image(index) for index in range(min(total, 8))]
+
+        def call(index):
+            service = FoodAnalysisService()
+            image_base64, mime_type = service._prepare_image(images[index % len(images)])
+            return bool(service._analyze(image_base64, mime_type).get('success'))
+        return call
+
+    def _prepare_calculate(self, total):
+        # 每个请求使用不同的食物名称: 食物库中解析不到, 也不会被相同请求合并
+        def call(index):
+            result = NutritionCalculationService().calculate_nutrition([{"name": f"基准测试食物{index}", "weight": 100}])
+            return bool(result.get('success'))
+        return call
+
+    def _prepare_chat(self, total):
+        factory = APIRequestFactory()
+        # 每个请求都会创建一个对话, 使用本次压测专用的临时账号, 结束时连同其对话一起删除;
+        # 默认的桩回复不会调用工具, 不会修改其他数据
+        user = User.objects.create(username=f'llm-benchmark-{uuid.uuid4().hex[:12]}', is_active=False)
+        self.cleanups.append(lambda: User.objects.filter(pk=user.pk).delete())
+
+        def call(index):
+            request = factory.post('/api/chat/', {"message": f"帮我看看今天的饮食 #{index}"}, format='json')
+            force_authenticate(request, user=user)
+            return chat_view(request).status_code == 200
+        return call
+
+    def _sample_image(self, index):
+        if Image is None:
+            raise CommandError('压测 analyze 需要安装 Pillow')
+        noise = Image.effect_noise((1280, 960), 30 + index * 5)
+        output = BytesIO()
+        Image.merge('RGB', (noise, noise.rotate(180), noise)).save(output, format='JPEG', quality=90)
+        return output.getvalue()
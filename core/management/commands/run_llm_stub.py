@@ -0,0 +1,32 @@
+# core/management/commands/run_llm_stub.py
+
+from django.core.management.base import BaseCommand
+
+from core.llm_stub import StubLLMServer
+
+
+class Command(BaseCommand):
+    help = '在本机运行 OpenAI 兼容桩服务(返回固定内容), 将 OPENAI_BASE_URL 指向它即可在不调用付费API的情况下压测'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1', help='监听地址, 默认127.0.0.1')
+        parser.add_argument('--port', type=int, default=8765, help='监听端口, 默认8765')
+        parser.add_argument('--latency', type=float, default=0.5, help='每个请求模拟的模型耗时(秒), 默认0.5')
+        parser.add_argument('--bandwidth-mbps', type=float, default=None, help='模拟的上行带宽(Mbit/s), 默认不限制')
+        parser.add_argument('--error-rate', type=float, default=0.0, help='返回错误响应的请求比例(0-1), 默认0')
+        parser.add_argument('--error-status', type=int, default=500, help='错误响应的状态码, 默认500(限流可用429)')
+        parser.add_argument('--seed', type=int, default=0, help='决定哪些请求出错的随机种子, 默认0')
+
+    def handle(self, *args, **options):
+        server = StubLLMServer(
+            latency=options['latency'],
+            bandwidth_mbps=options['bandwidth_mbps'],
+            error_rate=options['error_rate'],
+            error_status=options['error_status'],
+            seed=options['seed'],
+            host=options['host'],
+            port=options['port'],
+        ).start()
+        self.stdout.write(self.style.SUCCESS(f'桩服务已启动: OPENAI_BASE_URL={server.base_url} (Ctrl+C 退出)'))
+        server.serve_forever()
+        self.stdout.write(f'共处理 {server.request_count} 个请求, 其中错误 {server.error_count} 个')
@@ -0,0 +1,98 @@
+# core/metrics.py
+
+"""
+进程内的简单计数器和耗时统计, 用于观察缓存命中率、接口延迟等运行指标
+
+数据只在当前进程内累加, 多进程部署时每个进程各自统计,
+通过 /api/core/metrics/ 查看的是处理该请求的进程的数据。
+"""
+
+import threading
+from collections import defaultdict, deque
+from typing import Any, Deque, Dict
+
+# 每个耗时指标保留的最近样本数, 用于计算分位数
+TIMING_SAMPLE_SIZE = 1000
+
+_counters: Dict[str, int] = defaultdict(int)
+_timings: Dict[str, Dict[str, Any]] = {}
+_lock = threading.Lock()
+
+
+def incr(name: str, amount: int = 1):
+    """计数器加一(或指定数量)"""
+    with _lock:
+        _counters[name] += amount
+
+
+def observe(name: str, seconds: float):
+    """记录一次耗时(秒)"""
+    with _lock:
+        timing = _timings.get(name)
+        if timing is None:
+            timing = _timings[name] = {
+                'count': 0,
+                'total': 0.0,
+                'max': 0.0,
+                'samples': deque(maxlen=TIMING_SAMPLE_SIZE),
+            }
+        timing['count'] += 1
+        timing['total'] += seconds
+        timing['max'] = max(timing['max'], seconds)
+        timing['samples'].append(seconds)
+
+
+def _percentile(sorted_samples, fraction: float) -> float:
+    index = min(len(sorted_samples) - 1, int(round(fraction * (len(sorted_samples) - 1))))
+    return sorted_samples[index]
+
+
+def summarize(samples) -> Dict[str, float]:
+    """汇总一组耗时样本(秒), 返回与 get_timings 相同格式的毫秒值"""
+    ordered = sorted(samples)
+    if not ordered:
+        return {'count': 0}
+    return {
+        'count': len(ordered),
+        'avg_ms': round(sum(ordered) / len(ordered) * 1000, 1),
+        'p50_ms': round(_percentile(ordered, 0.50) * 1000, 1),
+        'p95_ms': round(_percentile(ordered, 0.95) * 1000, 1),
+        'p99_ms': round(_percentile(ordered, 0.99) * 1000, 1),
+        'max_ms': round(ordered[-1] * 1000, 1),
+    }
+
+
+def get_counters() -> Dict[str, int]:
+    """返回所有计数器当前值的副本"""
+    with _lock:
+        return dict(_counters)
+
+
+def get_timings() -> Dict[str, Dict[str, float]]:
+    """
+    返回所有耗时指标的汇总(毫秒)
+
+    count/avg_ms/max_ms 覆盖全部样本, p50_ms/p95_ms/p99_ms 基于最近的样本
+    """
+    with _lock:
+        snapshot = {name: (timing['count'], timing['total'], timing['max'], sorted(timing['samples']))
+                    for name, timing in _timings.items()}
+
+    result = {}
+    for name, (count, total, max_value, samples) in snapshot.items():
+        result[name] = {
+            'count': count,
+            'avg_ms': round(total / count * 1000, 1),
+            'p50_ms': round(_percentile(samples, 0.50) * 1000, 1),
+            'p95_ms': round(_percentile(samples, 0.95) * 1000, 1),
+            'p99_ms': round(_percentile(samples, 0.99) * 1000, 1),
+            'max_ms': round(max_value * 1000, 1),
+        }
+    return result
+
+
+def reset_counters():
+    """清空所有计数器和耗时统计"""
+    with _lock:
+        _counters.clear()
+        _timings.clear()
@@ -0,0 +1,87 @@
+# core/singleflight.py
+
+"""
+相同请求合并(single-flight)
+
+同一个 key 的调用正在进行时, 后到的相同调用不再重复执行, 而是等待并共享第一个调用的结果
+(包括异常)。调用结束后 key 即被移除, 之后的调用会重新执行, 因此这不是缓存。
+
+同步调用(WSGI 的多个线程)和异步调用(ASGI 的同一事件循环)分别合并, 互不等待。
+合并情况记录在计数器 singleflight.<name>.leader(实际执行) 和 .shared(等待共享结果) 中。
+"""
+
+import asyncio
+import threading
+import weakref
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+from core import metrics
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    def __init__(self, name: str):
+        self.name = name
+        self._calls: Dict[Hashable, _Call] = {}
+        self._lock = threading.Lock()
+        # asyncio.Task 绑定事件循环, 每个事件循环各自合并
+        self._tasks = weakref.WeakKeyDictionary()
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Any:
+        """执行 fn(), 相同 key 的调用正在进行时等待其结果"""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            metrics.incr(f'singleflight.{self.name}.shared')
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        metrics.incr(f'singleflight.{self.name}.leader')
+        try:
+            call.result = fn()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    async def ado(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        do 的异步版本, fn 返回协程
+
+        fn() 在单独的任务中执行, 所有调用者(包括发起者)都通过 shield 等待该任务:
+        任何一个调用者被取消都不会取消正在执行的调用, 也不会影响其他调用者。
+        """
+        loop = asyncio.get_running_loop()
+        tasks = self._tasks.setdefault(loop, {})
+        task = tasks.get(key)
+        if task is not None:
+            metrics.incr(f'singleflight.{self.name}.shared')
+        else:
+            metrics.incr(f'singleflight.{self.name}.leader')
+            task = tasks[key] = loop.create_task(fn())
+            task.add_done_callback(lambda done: self._finish(tasks, key, done))
+        return await asyncio.shield(task)
+
+    @staticmethod
+    def _finish(tasks: Dict[Hashable, asyncio.Task], key: Hashable, task: asyncio.Task):
+        if tasks.get(key) is task:
+            del tasks[key]
+        if not task.cancelled():
+            # 调用者都已取消时避免 "exception was never retrieved" 警告
+            task.exception()
@@ -0,0 +1,11 @@
+# core/urls.py
+
+from django.urls import path
+from . import views
+
+app_name = 'core'
+
+urlpatterns = [
+    # 运行指标(仅管理员)
+    path('metrics/', views.metrics_view, name='metrics'),
+]
@@ -1,3 +1,42 @@
-from django.shortcuts import render
+# core/views.py
 
-# Create your views here.
+from django.http import JsonResponse
+from rest_framework.decorators import api_view, authentication_classes, permission_classes
+from rest_framework.authentication import TokenAuthentication, SessionAuthentication
+from rest_framework.permissions import IsAdminUser
+
+from .metrics import get_counters, get_timings, reset_counters
+from .types import ServiceResult
+
+
+@api_view(['GET', 'DELETE'])
+@authentication_classes([TokenAuthentication, SessionAuthentication])
+@permission_classes([IsAdminUser])
+def metrics_view(request):
+    """
+    查看(GET)或清空(DELETE)当前进程的运行计数器和耗时统计, 仅管理员可用
+
+    返回示例:
+    {
+        "code": 200,
+        "message": "获取运行指标成功",
+        "data": {
+            "counters": {
+                "diet.suggestion.hit": 120,
+                "diet.suggestion.miss": 8
+            },
+            "timings": {
+                "nutrition.analyze.latency": {"count": 20, "avg_ms": 1510.2, "p50_ms": 2400.3, "p95_ms": 3900.1, "p99_ms": 4100.0, "max_ms": 4100.0}
+            }
+        }
+    }
+    """
+    if request.method == 'DELETE':
+        reset_counters()
+
+    response_data: ServiceResult = {
+        "code": 200,
+        "message": "获取运行指标成功",
+        "data": {"counters": get_counters(), "timings": get_timings()}
+    }
+    return JsonResponse(response_data)
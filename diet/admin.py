@@ -1,7 +1,12 @@
 # diet/admin.py
 
 from django.contrib import admin
-from .models import FoodItem, MealRecord, MealFoodItem
+from .models import FoodItem, FoodAlias, MealRecord, MealFoodItem, DailyNutritionSummary
+
+
+class FoodAliasInline(admin.TabularInline):
+    model = FoodAlias
+    extra = 0
 
 
 @admin.register(FoodItem)
@@ -9,6 +14,14 @@ class FoodItemAdmin(admin.ModelAdmin):
     list_display = ['name', 'category', 'calories', 'protein', 'carbohydrates', 'fat']
     list_filter = ['category']
     search_fields = ['name', 'category']
+    inlines = [FoodAliasInline]
+
+
+@admin.register(FoodAlias)
+class FoodAliasAdmin(admin.ModelAdmin):
+    list_display = ['alias', 'food_item', 'created_at']
+    search_fields = ['alias', 'food_item__name']
+    raw_id_fields = ['food_item']
 
 
 class MealFoodItemInline(admin.TabularInline):
@@ -28,3 +41,10 @@ class MealRecordAdmin(admin.ModelAdmin):
 class MealFoodItemAdmin(admin.ModelAdmin):
     list_display = ['meal_record', 'food_item', 'weight', 'calories']
     list_filter = ['meal_record__meal_type']
+
+
+@admin.register(DailyNutritionSummary)
+class DailyNutritionSummaryAdmin(admin.ModelAdmin):
+    list_display = ['user', 'meal_date', 'total_calories', 'total_protein', 'total_carbs', 'total_fat', 'has_breakfast']
+    list_filter = ['meal_date', 'has_breakfast']
+    search_fields = ['user__username']
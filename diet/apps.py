@@ -6,4 +6,7 @@ from django.apps import AppConfig
 class DietConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'diet'
-    verbose_name = '饮食管理'
\ No newline at end of file
+    verbose_name = '饮食管理'
+
+    def ready(self):
+        from . import signals  # noqa: F401  注册信号处理函数
@@ -0,0 +1,134 @@
+# diet/importers.py
+
+"""
+食物营养成分表的流式导入工具
+
+支持 CSV 和 JSONL 两种格式, 逐行读取并按固定大小分块, 每块用一条
+INSERT ... ON CONFLICT (name) DO UPDATE 完成新增或更新, 内存占用与文件大小无关。
+"""
+
+import csv
+import json
+from itertools import islice
+from typing import Any, Dict, Iterable, Iterator, List, TextIO, Tuple
+
+from .models import FoodItem
+
+NUTRITION_FIELDS = ['calories', 'protein', 'carbohydrates', 'fat']
+UPDATE_FIELDS = ['category'] + NUTRITION_FIELDS + ['updated_at']
+
+# 常见食物成分表的列名别名 -> FoodItem 字段
+COLUMN_ALIASES = {
+    '食物名称': 'name',
+    '名称': 'name',
+    '食物分类': 'category',
+    '分类': 'category',
+    'energy': 'calories',
+    '热量': 'calories',
+    '能量': 'calories',
+    '蛋白质': 'protein',
+    'carbs': 'carbohydrates',
+    '碳水化合物': 'carbohydrates',
+    '脂肪': 'fat',
+}
+
+
+def _normalize_row(raw: Dict[str, Any], line_no: int) -> Dict[str, Any]:
+    """将一行原始数据转换为 FoodItem 字段字典, 数据不合法时抛出 ValueError"""
+    row = {COLUMN_ALIASES.get(str(key).strip(), str(key).strip()): value for key, value in raw.items()}
+
+    name = str(row.get('name') or '').strip()
+    if not name:
+        raise ValueError(f'第{line_no}行缺少食物名称')
+
+    food = {'name': name, 'category': str(row.get('category') or '其他').strip()}
+    for field in NUTRITION_FIELDS:
+        value = row.get(field)
+        if value in (None, ''):
+            if field == 'calories':
+                raise ValueError(f'第{line_no}行({name})缺少热量')
+            value = 0
+        try:
+            food[field] = float(value)
+        except (TypeError, ValueError):
+            raise ValueError(f'第{line_no}行({name})的{field}不是数字: {value!r}')
+    return food
+
+
+def iter_food_rows(stream: TextIO, file_format: str) -> Iterator[Dict[str, Any]]:
+    """
+    逐行读取食物数据
+
+    Args:
+        stream: 已打开的文本流
+        file_format: csv 或 jsonl
+    """
+    if file_format == 'csv':
+        # 表头占第1行, 数据从第2行开始
+        for line_no, raw in enumerate(csv.DictReader(stream), start=2):
+            yield _normalize_row(raw, line_no)
+    elif file_format == 'jsonl':
+        for line_no, line in enumerate(stream, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                raw = json.loads(line)
+            except json.JSONDecodeError as e:
+                raise ValueError(f'第{line_no}行不是合法的JSON: {e}')
+            yield _normalize_row(raw, line_no)
+    else:
+        raise ValueError(f'不支持的文件格式: {file_format}')
+
+
+def chunked(rows: Iterable[Dict[str, Any]], size: int) -> Iterator[List[Dict[str, Any]]]:
+    """按固定大小分块, 同一块内重名的食物以最后一行为准"""
+    iterator = iter(rows)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield list({row['name']: row for row in chunk}.values())
+
+
+def upsert_food_chunk(rows: List[Dict[str, Any]]) -> int:
+    """按名称新增或更新一块食物数据, 整块只执行一条 SQL"""
+    FoodItem.objects.bulk_create(
+        [FoodItem(**row) for row in rows],
+        update_conflicts=True,
+        unique_fields=['name'],
+        update_fields=UPDATE_FIELDS,
+    )
+    return len(rows)
+
+
+def diff_food_chunk(rows: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], List[Tuple[str, Dict[str, Tuple[Any, Any]]]], int]:
+    """
+    比较一块食物数据与数据库现有数据(只读, 用于试运行)
+
+    Returns:
+        (新增的食物, [(食物名称, {字段: (旧值, 新值)})], 无变化的数量)
+    """
+    existing = {
+        food['name']: food
+        for food in FoodItem.objects.filter(name__in=[row['name'] for row in rows]).values(
+            'name', 'category', *NUTRITION_FIELDS
+        )
+    }
+
+    created, changed, unchanged = [], [], 0
+    for row in rows:
+        current = existing.get(row['name'])
+        if current is None:
+            created.append(row)
+            continue
+        field_changes = {
+            field: (current[field], row[field])
+            for field in ['category'] + NUTRITION_FIELDS
+            if current[field] != row[field]
+        }
+        if field_changes:
+            changed.append((row['name'], field_changes))
+        else:
+            unchanged += 1
+    return created, changed, unchanged
@@ -0,0 +1,40 @@
+# diet/management/commands/backfill_daily_summary.py
+
+from datetime import datetime
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from diet.models import MealRecord, DailyNutritionSummary
+
+
+class Command(BaseCommand):
+    help = '根据餐次记录重建每日营养汇总表'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user-id', type=int, help='只重建指定用户的汇总')
+        parser.add_argument('--start-date', help='只重建该日期(YYYY-MM-DD)及之后的汇总')
+        parser.add_argument('--batch-size', type=int, default=1000, help='每批写入的记录数, 默认1000')
+
+    def handle(self, *args, **options):
+        meal_records = MealRecord.objects.all()
+        summaries = DailyNutritionSummary.objects.all()
+
+        if options.get('user_id'):
+            meal_records = meal_records.filter(user_id=options['user_id'])
+            summaries = summaries.filter(user_id=options['user_id'])
+
+        if options.get('start_date'):
+            try:
+                start_date = datetime.strptime(options['start_date'], '%Y-%m-%d').date()
+            except ValueError:
+                raise CommandError('日期格式错误,应为YYYY-MM-DD')
+            meal_records = meal_records.filter(meal_date__gte=start_date)
+            summaries = summaries.filter(meal_date__gte=start_date)
+
+        with transaction.atomic():
+            deleted_count, created_count = DailyNutritionSummary.rebuild(
+                meal_records, summaries, batch_size=options['batch_size']
+            )
+
+        self.stdout.write(self.style.SUCCESS(
+            f'已删除 {deleted_count} 条旧汇总, 重建 {created_count} 条每日营养汇总'
+        ))
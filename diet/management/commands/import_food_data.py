@@ -0,0 +1,92 @@
+# diet/management/commands/import_food_data.py
+
+import sys
+import time
+from pathlib import Path
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from diet.importers import iter_food_rows, chunked, upsert_food_chunk, diff_food_chunk
+from diet.models import FoodCatalogChange
+
+
+class Command(BaseCommand):
+    help = '从CSV/JSONL文件流式导入食物营养成分表(按名称新增或更新)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='数据文件路径, 使用 - 表示从标准输入读取')
+        parser.add_argument('--format', choices=['csv', 'jsonl'], help='文件格式, 默认根据扩展名判断')
+        parser.add_argument('--chunk-size', type=int, default=5000, help='每批写入的行数, 默认5000')
+        parser.add_argument('--encoding', default='utf-8-sig', help='文件编码, 默认utf-8-sig')
+        parser.add_argument('--dry-run', action='store_true', help='只比较差异, 不写入数据库')
+        parser.add_argument('--show-diff', type=int, default=20, help='试运行时最多显示的差异条数, 默认20')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        file_format = options['format']
+        if not file_format:
+            suffix = Path(path).suffix.lower()
+            file_format = {'.csv': 'csv', '.jsonl': 'jsonl', '.ndjson': 'jsonl'}.get(suffix)
+            if not file_format:
+                raise CommandError('无法根据扩展名判断文件格式, 请使用 --format 指定')
+
+        if options['chunk_size'] < 1:
+            raise CommandError('--chunk-size 必须大于0')
+
+        try:
+            if path == '-':
+                self._import(sys.stdin, file_format, options)
+            else:
+                with open(path, encoding=options['encoding'], newline='') as stream:
+                    self._import(stream, file_format, options)
+        except FileNotFoundError:
+            raise CommandError(f'文件不存在: {path}')
+        except ValueError as e:
+            raise CommandError(f'数据格式错误: {e}')
+
+    def _import(self, stream, file_format, options):
+        dry_run = options['dry_run']
+        show_diff = options['show_diff']
+
+        total = created_total = changed_total = unchanged_total = shown = written = 0
+        start = time.perf_counter()
+
+        try:
+            for chunk in chunked(iter_food_rows(stream, file_format), options['chunk_size']):
+                if dry_run:
+                    created, changed, unchanged = diff_food_chunk(chunk)
+                    created_total += len(created)
+                    changed_total += len(changed)
+                    unchanged_total += unchanged
+                    for row in created:
+                        if shown < show_diff:
+                            self.stdout.write(self.style.SUCCESS(f'+ {row["name"]} ({row["category"]})'))
+                            shown += 1
+                    for name, field_changes in changed:
+                        if shown < show_diff:
+                            details = ', '.join(f'{field}: {old} -> {new}' for field, (old, new) in field_changes.items())
+                            self.stdout.write(self.style.WARNING(f'~ {name}: {details}'))
+                            shown += 1
+                else:
+                    with transaction.atomic():
+                        written += upsert_food_chunk(chunk)
+
+                total += len(chunk)
+                elapsed = time.perf_counter() - start
+                self.stdout.write(f'已处理 {total} 行, {total / elapsed:.0f} 行/秒')
+        finally:
+            # 批量写入不会触发 FoodItem 信号, 记录一次整体变更使食物库缓存和搜索索引失效
+            # (中途出错时已提交的分块同样需要失效)
+            if written:
+                FoodCatalogChange.objects.create(action='reset')
+
+        elapsed = time.perf_counter() - start
+        rate = total / elapsed if elapsed > 0 else 0
+        if dry_run:
+            self.stdout.write(self.style.SUCCESS(
+                f'试运行完成: 共 {total} 行, 新增 {created_total}, 修改 {changed_total}, '
+                f'无变化 {unchanged_total}, 耗时 {elapsed:.2f}秒 ({rate:.0f} 行/秒)'
+            ))
+        else:
+            self.stdout.write(self.style.SUCCESS(
+                f'导入完成: 共 {total} 行, 耗时 {elapsed:.2f}秒 ({rate:.0f} 行/秒)'
+            ))
@@ -1,7 +1,7 @@
 # diet/management/commands/init_food_data.py
 
 from django.core.management.base import BaseCommand
-from diet.models import FoodItem
+from diet.models import FoodItem, FoodCatalogChange
 
 
 class Command(BaseCommand):
@@ -333,14 +333,22 @@ class Command(BaseCommand):
             {'name': '意面', 'category': '快餐', 'calories': 158, 'protein': 5.8, 'carbohydrates': 30.9, 'fat': 0.9},
         ]
 
-        created_count = 0
+        # 已存在的同名食物保持不变, 整批只执行一条 INSERT ... ON CONFLICT DO NOTHING
+        existing_names = set(
+            FoodItem.objects.filter(name__in=[food['name'] for food in foods_data]).values_list('name', flat=True)
+        )
+        new_foods = []
         for food_data in foods_data:
-            food, created = FoodItem.objects.get_or_create(
-                name=food_data['name'],
-                defaults=food_data
-            )
-            if created:
-                created_count += 1
-                self.stdout.write(self.style.SUCCESS(f'创建食物: {food.name}'))
+            if food_data['name'] not in existing_names:
+                existing_names.add(food_data['name'])
+                new_foods.append(FoodItem(**food_data))
 
-        self.stdout.write(self.style.SUCCESS(f'完成! 共创建 {created_count} 个食物'))
+        FoodItem.objects.bulk_create(new_foods, ignore_conflicts=True)
+        if new_foods:
+            # 批量写入不会触发 FoodItem 信号, 手动使食物库缓存失效
+            FoodCatalogChange.objects.create(action='reset')
+
+        for food in new_foods:
+            self.stdout.write(self.style.SUCCESS(f'创建食物: {food.name}'))
+
+        self.stdout.write(self.style.SUCCESS(f'完成! 共创建 {len(new_foods)} 个食物'))
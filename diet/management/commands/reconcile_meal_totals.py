@@ -0,0 +1,82 @@
+# diet/management/commands/reconcile_meal_totals.py
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Sum, Value, FloatField, Q
+from django.db.models.functions import Coalesce
+from diet.models import MealRecord, DailyNutritionSummary
+
+
+TOTAL_FIELDS = [
+    # (MealRecord 字段, MealFoodItem 字段)
+    ('total_calories', 'calories'),
+    ('total_protein', 'protein'),
+    ('total_carbs', 'carbohydrates'),
+    ('total_fat', 'fat'),
+]
+
+# 每次重建汇总的日期数(按 用户+日期 的 OR 条件查询, 避免条件过长)
+SUMMARY_DAYS_PER_QUERY = 100
+
+
+class Command(BaseCommand):
+    help = '校对餐次营养总计: 与食物项实际求和比较, 修正增量更新产生的偏差, 并重建受影响日期的每日营养汇总'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='只报告偏差, 不写入数据库')
+        parser.add_argument('--tolerance', type=float, default=0.01, help='允许的误差, 默认0.01')
+        parser.add_argument('--user-id', type=int, help='只校对指定用户')
+        parser.add_argument('--batch-size', type=int, default=500, help='每批修正的记录数, 默认500')
+
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+        tolerance = options['tolerance']
+        batch_size = options['batch_size']
+
+        # 一次查询得到每个餐次记录的总计和食物项实际求和
+        annotations = {
+            f'actual_{total_field}': Coalesce(Sum(f'food_items__{item_field}'), Value(0.0), output_field=FloatField())
+            for total_field, item_field in TOTAL_FIELDS
+        }
+        queryset = MealRecord.objects.annotate(**annotations).order_by('id')
+        if options.get('user_id'):
+            queryset = queryset.filter(user_id=options['user_id'])
+
+        checked = 0
+        drifted = []
+        for meal_record in queryset.iterator(chunk_size=batch_size):
+            checked += 1
+            changed = False
+            for total_field, _ in TOTAL_FIELDS:
+                actual = getattr(meal_record, f'actual_{total_field}')
+                if abs(getattr(meal_record, total_field) - actual) > tolerance:
+                    self.stdout.write(
+                        f"餐次 {meal_record.id} ({meal_record.meal_date} {meal_record.meal_type}) "
+                        f"{total_field}: 记录值 {getattr(meal_record, total_field)}, 实际值 {actual}"
+                    )
+                    setattr(meal_record, total_field, actual)
+                    changed = True
+            if changed:
+                drifted.append(meal_record)
+
+        affected_days = sorted({(meal_record.user_id, meal_record.meal_date) for meal_record in drifted})
+        if drifted and not dry_run:
+            fields = [total_field for total_field, _ in TOTAL_FIELDS]
+            with transaction.atomic():
+                MealRecord.objects.bulk_update(drifted, fields, batch_size=batch_size)
+                # 餐次总计变化后, 当日汇总也要按修正后的餐次重建
+                for start in range(0, len(affected_days), SUMMARY_DAYS_PER_QUERY):
+                    days = Q()
+                    for user_id, meal_date in affected_days[start:start + SUMMARY_DAYS_PER_QUERY]:
+                        days |= Q(user_id=user_id, meal_date=meal_date)
+                    DailyNutritionSummary.rebuild(
+                        MealRecord.objects.filter(days),
+                        DailyNutritionSummary.objects.filter(days),
+                        batch_size=batch_size,
+                    )
+
+        action = '发现' if dry_run else '已修正'
+        self.stdout.write(self.style.SUCCESS(
+            f'共检查 {checked} 条餐次记录, {action} {len(drifted)} 条存在偏差, '
+            f'涉及 {len(affected_days)} 天的每日营养汇总' + ('' if dry_run else '(已重建)')
+        ))
@@ -0,0 +1,46 @@
+# Generated by Django 5.1.7 on 2026-10-17 22:54
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('diet', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='mealfooditem',
+            name='food_item_name',
+            field=models.CharField(blank=True, max_length=200, null=True, verbose_name='食物名称'),
+        ),
+        migrations.AlterField(
+            model_name='mealfooditem',
+            name='food_item',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='diet.fooditem', verbose_name='食物信息'),
+        ),
+        migrations.CreateModel(
+            name='DailyNutritionSummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('meal_date', models.DateField(verbose_name='日期')),
+                ('total_calories', models.FloatField(default=0, verbose_name='总热量(kcal)')),
+                ('total_protein', models.FloatField(default=0, verbose_name='总蛋白质(g)')),
+                ('total_carbs', models.FloatField(default=0, verbose_name='总碳水化合物(g)')),
+                ('total_fat', models.FloatField(default=0, verbose_name='总脂肪(g)')),
+                ('has_breakfast', models.BooleanField(default=False, verbose_name='是否吃早餐')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='更新时间')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_nutrition_summaries', to=settings.AUTH_USER_MODEL, verbose_name='用户')),
+            ],
+            options={
+                'verbose_name': '每日营养汇总',
+                'verbose_name_plural': '每日营养汇总',
+                'ordering': ['-meal_date'],
+                'unique_together': {('user', 'meal_date')},
+            },
+        ),
+    ]
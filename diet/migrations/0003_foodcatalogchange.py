@@ -0,0 +1,26 @@
+# Generated by Django 5.1.7 on 2026-10-17 22:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('diet', '0002_mealfooditem_food_item_name_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FoodCatalogChange',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('food_id', models.BigIntegerField(blank=True, null=True, verbose_name='食物ID')),
+                ('action', models.CharField(choices=[('upsert', '新增/修改'), ('delete', '删除'), ('reset', '整体变更')], max_length=10, verbose_name='变更类型')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='变更时间')),
+            ],
+            options={
+                'verbose_name': '食物库变更',
+                'verbose_name_plural': '食物库变更',
+            },
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.1.7 on 2026-10-17 22:57
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def rename_duplicate_foods(apps, schema_editor):
+    """名称改为唯一前, 给重名食物(保留最早的一条)加上ID后缀"""
+    FoodItem = apps.get_model('diet', 'FoodItem')
+    duplicate_names = (
+        FoodItem.objects.values('name').annotate(name_count=Count('id')).filter(name_count__gt=1).values_list('name', flat=True)
+    )
+    for name in list(duplicate_names):
+        for food in FoodItem.objects.filter(name=name).order_by('id')[1:]:
+            food.name = f'{name} ({food.id})'
+            food.save(update_fields=['name'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('diet', '0003_foodcatalogchange'),
+    ]
+
+    operations = [
+        migrations.RunPython(rename_duplicate_foods, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='fooditem',
+            name='name',
+            field=models.CharField(max_length=200, unique=True, verbose_name='食物名称'),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.1.7 on 2026-10-17 23:08
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('diet', '0004_fooditem_name_unique'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FoodAlias',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('alias', models.CharField(max_length=200, unique=True, verbose_name='别名')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='创建时间')),
+                ('food_item', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='aliases', to='diet.fooditem', verbose_name='对应食物')),
+            ],
+            options={
+                'verbose_name': '食物别名',
+                'verbose_name_plural': '食物别名',
+            },
+        ),
+    ]
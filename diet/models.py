@@ -1,14 +1,16 @@
 # diet/models.py
 
 from django.db import models
+from django.db.models import F, Sum, Count, Q
 from django.conf import settings
+from django.utils import timezone
 
 
 class FoodItem(models.Model):
     """
     食物营养信息库
     """
-    name = models.CharField(max_length=200, verbose_name="食物名称", db_index=True)
+    name = models.CharField(max_length=200, verbose_name="食物名称", unique=True)
     category = models.CharField(max_length=50, verbose_name="食物分类")
 
     # 营养成分 (per 100g)
@@ -28,6 +30,61 @@ class FoodItem(models.Model):
         return f"{self.name} ({self.category})"
 
 
+class FoodAlias(models.Model):
+    """
+    食物别名(如"西蓝花" -> "西兰花", "白饭" -> "米饭")
+
+    名称解析时优先于模糊匹配, 用于把常见的俗称、错别字稳定地对应到食物库中的食物。
+    """
+    alias = models.CharField(max_length=200, unique=True, verbose_name="别名")
+    food_item = models.ForeignKey(
+        FoodItem,
+        on_delete=models.CASCADE,
+        related_name='aliases',
+        verbose_name="对应食物"
+    )
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="创建时间")
+
+    class Meta:
+        verbose_name = "食物别名"
+        verbose_name_plural = "食物别名"
+
+    def __str__(self):
+        return f"{self.alias} -> {self.food_item.name}"
+
+
+class FoodCatalogChange(models.Model):
+    """
+    食物库变更日志
+
+    每次 FoodItem 新增/修改/删除都会追加一条记录, 自增ID即食物库版本号。
+    客户端可凭旧版本号只拉取之后的变更; 批量导入等无法逐条记录的操作
+    写入一条 reset 记录, 表示更早的版本需要重新下载完整食物库。
+    """
+    ACTION_CHOICES = [
+        ('upsert', '新增/修改'),
+        ('delete', '删除'),
+        ('reset', '整体变更'),
+    ]
+
+    # 不使用外键: 食物被删除后仍需保留其ID
+    food_id = models.BigIntegerField(verbose_name="食物ID", null=True, blank=True)
+    action = models.CharField(max_length=10, choices=ACTION_CHOICES, verbose_name="变更类型")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="变更时间")
+
+    class Meta:
+        verbose_name = "食物库变更"
+        verbose_name_plural = "食物库变更"
+
+    def __str__(self):
+        return f"v{self.id} {self.get_action_display()} {self.food_id or ''}"
+
+    @classmethod
+    def current_version(cls) -> int:
+        """当前食物库版本号(没有任何变更时为0)"""
+        return cls.objects.order_by('-id').values_list('id', flat=True).first() or 0
+
+
 class MealRecord(models.Model):
     """
     用户餐次记录
@@ -85,6 +142,22 @@ class MealRecord(models.Model):
         self.total_fat = sum(item.fat for item in items)
         self.save(update_fields=['total_calories', 'total_protein', 'total_carbs', 'total_fat', 'updated_at'])
 
+    def apply_totals_delta(self, calories: float, protein: float, carbs: float, fat: float):
+        """
+        将单个食物项带来的营养变化量原子地累加到餐次总计上
+
+        使用 F() 表达式在数据库端完成 UPDATE ... SET total = total + delta,
+        不需要重新读取该餐次的全部食物项, 并发写入时也不会互相覆盖。
+        调用方应在同一事务中完成食物项的写入和本方法的调用。
+        """
+        MealRecord.objects.filter(pk=self.pk).update(
+            total_calories=F('total_calories') + calories,
+            total_protein=F('total_protein') + protein,
+            total_carbs=F('total_carbs') + carbs,
+            total_fat=F('total_fat') + fat,
+            updated_at=timezone.now(),
+        )
+
 
 class MealFoodItem(models.Model):
     """
@@ -135,3 +208,92 @@ class MealFoodItem(models.Model):
         self.protein = round(self.food_item.protein * ratio, 2)
         self.carbohydrates = round(self.food_item.carbohydrates * ratio, 2)
         self.fat = round(self.food_item.fat * ratio, 2)
+
+
+class DailyNutritionSummary(models.Model):
+    """
+    用户每日营养汇总(预聚合表)
+
+    由餐次写入接口在同一事务中增量维护, 饮食建议等按天统计的场景
+    直接读取该表, 不再对 MealRecord 做分组聚合。
+    """
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='daily_nutrition_summaries',
+        verbose_name="用户"
+    )
+
+    meal_date = models.DateField(verbose_name="日期")
+
+    # 当日所有餐次的营养总计
+    total_calories = models.FloatField(verbose_name="总热量(kcal)", default=0)
+    total_protein = models.FloatField(verbose_name="总蛋白质(g)", default=0)
+    total_carbs = models.FloatField(verbose_name="总碳水化合物(g)", default=0)
+    total_fat = models.FloatField(verbose_name="总脂肪(g)", default=0)
+
+    # 当日是否有早餐记录
+    has_breakfast = models.BooleanField(verbose_name="是否吃早餐", default=False)
+
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="更新时间")
+
+    class Meta:
+        verbose_name = "每日营养汇总"
+        verbose_name_plural = "每日营养汇总"
+        ordering = ['-meal_date']
+        unique_together = [['user', 'meal_date']]
+
+    def __str__(self):
+        return f"{self.user.username} - {self.meal_date} ({self.total_calories}kcal)"
+
+    @classmethod
+    def apply_delta(cls, user_id: int, meal_date, calories: float, protein: float, carbs: float, fat: float,
+                    is_breakfast: bool = False):
+        """
+        将某个餐次的营养变化量原子地累加到当日汇总上, 当日汇总不存在时先创建
+        """
+        summary, _ = cls.objects.get_or_create(user_id=user_id, meal_date=meal_date)
+        updates = {
+            'total_calories': F('total_calories') + calories,
+            'total_protein': F('total_protein') + protein,
+            'total_carbs': F('total_carbs') + carbs,
+            'total_fat': F('total_fat') + fat,
+            'updated_at': timezone.now(),
+        }
+        if is_breakfast:
+            updates['has_breakfast'] = True
+        cls.objects.filter(pk=summary.pk).update(**updates)
+
+    @classmethod
+    def rebuild(cls, meal_records, summaries, batch_size: int = 1000):
+        """
+        删除 summaries 中的汇总, 并按 meal_records 重新聚合生成
+
+        两个查询集应覆盖相同的用户和日期范围; 必须在调用方的事务中执行。
+
+        Returns:
+            (删除的旧汇总数, 新建的汇总数)
+        """
+        # 按用户和日期分组聚合, 一次查询得到所有汇总值
+        daily_stats = meal_records.order_by().values('user_id', 'meal_date').annotate(
+            daily_calories=Sum('total_calories'),
+            daily_protein=Sum('total_protein'),
+            daily_carbs=Sum('total_carbs'),
+            daily_fat=Sum('total_fat'),
+            breakfast_count=Count('id', filter=Q(meal_type='breakfast')),
+        )
+        new_summaries = [
+            cls(
+                user_id=stat['user_id'],
+                meal_date=stat['meal_date'],
+                total_calories=stat['daily_calories'] or 0,
+                total_protein=stat['daily_protein'] or 0,
+                total_carbs=stat['daily_carbs'] or 0,
+                total_fat=stat['daily_fat'] or 0,
+                has_breakfast=stat['breakfast_count'] > 0,
+            )
+            for stat in daily_stats.iterator()
+        ]
+        deleted_count, _ = summaries.delete()
+        cls.objects.bulk_create(new_summaries, batch_size=batch_size)
+        return deleted_count, len(new_summaries)
@@ -0,0 +1,247 @@
+# diet/search.py
+
+"""
+食物名称的进程内搜索索引
+
+索引由两部分组成:
+- 前缀表: 名称的前若干个字符 -> 文档, 用于"输入即搜索"的前缀匹配
+- 字符 n-gram 倒排表: 单字和双字 -> 文档, 适合没有分词的中文名称,
+  也能容忍错字、漏字等模糊输入
+
+另外收录食物别名(FoodAlias), 名称解析时按 精确名称 -> 别名 -> 模糊匹配 的顺序进行。
+
+索引记录构建时的食物库版本号, 版本号变化(见 FoodCatalogChange)后的
+下一次查询会整体重建, 多个进程之间也能各自感知到变更。
+"""
+
+import heapq
+import threading
+from collections import defaultdict
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+# 前缀表最多收录的前缀长度
+MAX_PREFIX_LENGTH = 8
+
+# n-gram 命中比例低于该值的候选不参与排序
+MIN_GRAM_COVERAGE = 0.5
+
+# 模糊匹配食物名称时要求的最低字符相似度(Dice系数)
+MIN_MATCH_SIMILARITY = 0.6
+
+
+def normalize_text(text: str) -> str:
+    """统一大小写并去掉所有空白(含全角空格)"""
+    return "".join((text or "").lower().split())
+
+
+def _ngrams(text: str) -> List[str]:
+    """单字 + 双字切分; 单字查询走单字倒排, 多字查询走双字倒排"""
+    if len(text) <= 1:
+        return [text] if text else []
+    return [text[i:i + 2] for i in range(len(text) - 1)]
+
+
+class FoodSearchIndex:
+    """
+    FoodItem 的前缀 + n-gram 搜索索引, 所有数据保存在内存中, 查询不访问数据库
+    """
+
+    def __init__(self):
+        self.docs: List[Dict[str, Any]] = []
+        self._names: List[str] = []
+        self._categories: List[str] = []
+        self._by_name: Dict[str, int] = {}
+        self._by_alias: Dict[str, int] = {}
+        self._prefix: Dict[str, List[int]] = defaultdict(list)
+        self._unigrams: Dict[str, List[int]] = defaultdict(list)
+        self._bigrams: Dict[str, List[int]] = defaultdict(list)
+
+    def build(self, rows: Iterable[Dict[str, Any]]) -> "FoodSearchIndex":
+        """
+        根据食物数据构建索引
+
+        Args:
+            rows: 食物字典序列, 至少包含 id/name/category 字段
+        """
+        for row in rows:
+            doc_id = len(self.docs)
+            name = normalize_text(row['name'])
+            category = normalize_text(row.get('category', ''))
+
+            self.docs.append(row)
+            self._names.append(name)
+            self._categories.append(category)
+            self._by_name.setdefault(name, doc_id)
+
+            for length in range(1, min(len(name), MAX_PREFIX_LENGTH) + 1):
+                self._prefix[name[:length]].append(doc_id)
+            for char in set(name + category):
+                self._unigrams[char].append(doc_id)
+            for gram in set(_ngrams(name) + _ngrams(category)):
+                self._bigrams[gram].append(doc_id)
+        return self
+
+    def add_aliases(self, aliases: Iterable[Tuple[str, int]]) -> "FoodSearchIndex":
+        """
+        收录食物别名
+
+        Args:
+            aliases: (别名, 食物ID) 序列, 食物ID不在索引中的别名会被忽略
+        """
+        doc_ids = {doc['id']: doc_id for doc_id, doc in enumerate(self.docs)}
+        for alias, food_id in aliases:
+            doc_id = doc_ids.get(food_id)
+            if doc_id is not None:
+                self._by_alias[normalize_text(alias)] = doc_id
+        return self
+
+    def __len__(self):
+        return len(self.docs)
+
+    def _score(self, doc_id: int, query: str, gram_hits: int, gram_total: int) -> float:
+        name = self._names[doc_id]
+        category = self._categories[doc_id]
+
+        if name == query:
+            score = 100.0
+        elif name.startswith(query):
+            score = 60.0
+        elif query in name:
+            score = 40.0
+        else:
+            score = 30.0 * gram_hits / gram_total
+
+        if category == query:
+            score += 10.0
+        # 同等匹配程度下, 名称越短越接近用户输入
+        return score - len(name) * 0.01
+
+    def match(self, name: str) -> Optional[Dict[str, Any]]:
+        """
+        将一个自由输入的食物名称解析为库中的食物, 无法解析时返回 None
+        """
+        return self.resolve(name)[0]
+
+    def resolve(self, name: str) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
+        """
+        将一个自由输入的食物名称解析为库中的食物, 并返回匹配方式
+
+        先按名称精确匹配, 再查别名; 都没有时在 n-gram 候选中选字符相似度(Dice系数)最高的一个,
+        例如"炒鸡胸肉" -> "鸡胸肉", "西蓝花" -> "西兰花"。相似度不足时返回 (None, None)。
+
+        Returns:
+            (食物字典, 匹配方式 exact/alias/fuzzy)
+        """
+        query = normalize_text(name)
+        if not query:
+            return None, None
+
+        doc_id = self._by_name.get(query)
+        if doc_id is not None:
+            return self.docs[doc_id], 'exact'
+
+        doc_id = self._by_alias.get(query)
+        if doc_id is not None:
+            return self.docs[doc_id], 'alias'
+
+        candidates = set()
+        for gram in set(_ngrams(query)):
+            candidates.update(self._bigrams.get(gram, ()))
+        if not candidates:
+            for char in set(query):
+                candidates.update(self._unigrams.get(char, ()))
+
+        query_chars = set(query)
+        query_grams = set(_ngrams(query))
+        best_key, best_doc = None, None
+        for doc_id in candidates:
+            doc_name = self._names[doc_id]
+            doc_chars = set(doc_name)
+            similarity = 2 * len(query_chars & doc_chars) / (len(query_chars) + len(doc_chars))
+            if similarity < MIN_MATCH_SIMILARITY:
+                continue
+            doc_grams = set(_ngrams(doc_name))
+            gram_similarity = 2 * len(query_grams & doc_grams) / (len(query_grams) + len(doc_grams))
+            key = (similarity, gram_similarity, -abs(len(doc_name) - len(query)))
+            if best_key is None or key > best_key:
+                best_key, best_doc = key, doc_id
+
+        if best_doc is None:
+            return None, None
+        return self.docs[best_doc], 'fuzzy'
+
+    def search(self, keyword: str, limit: int = 20, offset: int = 0) -> Tuple[int, List[Dict[str, Any]]]:
+        """
+        按相关度查询食物
+
+        Returns:
+            (命中总数, 当前页的食物字典列表)
+        """
+        query = normalize_text(keyword)
+        if not query:
+            return 0, []
+
+        scores: Dict[int, float] = {}
+
+        # 1. 前缀匹配
+        for doc_id in self._prefix.get(query[:MAX_PREFIX_LENGTH], ()):
+            if self._names[doc_id].startswith(query):
+                scores[doc_id] = self._score(doc_id, query, 0, 1)
+
+        # 2. n-gram 匹配
+        grams = _ngrams(query)
+        postings = self._unigrams if len(query) == 1 else self._bigrams
+        hits: Dict[int, int] = defaultdict(int)
+        for gram in set(grams):
+            for doc_id in postings.get(gram, ()):
+                hits[doc_id] += 1
+
+        gram_total = len(set(grams))
+        for doc_id, gram_hits in hits.items():
+            if doc_id in scores or gram_hits / gram_total < MIN_GRAM_COVERAGE:
+                continue
+            scores[doc_id] = self._score(doc_id, query, gram_hits, gram_total)
+
+        # 3. 双字完全没有命中时(如"西蓝花"/"西兰花"), 退化为单字重合度匹配
+        if not scores and len(query) > 1:
+            chars = set(query)
+            char_hits: Dict[int, int] = defaultdict(int)
+            for char in chars:
+                for doc_id in self._unigrams.get(char, ()):
+                    char_hits[doc_id] += 1
+            for doc_id, hit_count in char_hits.items():
+                if hit_count / len(chars) > MIN_GRAM_COVERAGE:
+                    scores[doc_id] = self._score(doc_id, query, hit_count, len(chars)) / 2
+
+        ranked = heapq.nsmallest(
+            offset + limit,
+            scores.items(),
+            key=lambda item: (-item[1], self._names[item[0]]),
+        )
+        return len(scores), [self.docs[doc_id] for doc_id, _ in ranked[offset:]]
+
+
+_index: Optional[FoodSearchIndex] = None
+_index_version = -1
+_index_lock = threading.Lock()
+
+
+def get_food_search_index() -> FoodSearchIndex:
+    """获取当前进程的食物搜索索引, 食物库版本号变化时从数据库重建"""
+    global _index, _index_version
+    from .models import FoodItem, FoodAlias, FoodCatalogChange
+
+    version = FoodCatalogChange.current_version()
+    if _index is not None and _index_version == version:
+        return _index
+
+    with _index_lock:
+        if _index is None or _index_version != version:
+            rows = FoodItem.objects.order_by('id').values(
+                'id', 'name', 'category', 'calories', 'protein', 'carbohydrates', 'fat'
+            )
+            index = FoodSearchIndex().build(rows.iterator(chunk_size=2000))
+            index.add_aliases(FoodAlias.objects.values_list('alias', 'food_item_id').iterator(chunk_size=2000))
+            _index = index
+            _index_version = version
+    return _index
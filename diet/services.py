@@ -1,12 +1,19 @@
 # diet/services.py
 
-from .models import FoodItem, MealRecord, MealFoodItem
-from information.models import Information
+from .models import FoodItem, MealRecord, MealFoodItem, DailyNutritionSummary, FoodCatalogChange
+from information.services import get_profile_snapshot
 from django.core.exceptions import ObjectDoesNotExist
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, Iterator, List, Optional, Tuple
 from core.types import ServiceResult
-from datetime import date, datetime
-from django.db.models import Sum
+from .search import get_food_search_index
+from datetime import date, datetime, timedelta
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+import json
+from django.db import transaction
+from django.db.models import Avg, Count, Max, Q
+from core import metrics
+import hashlib
 
 
 def calculate_recommended_macros(user_id: int) -> Optional[Dict[str, float]]:
@@ -23,25 +30,43 @@ def calculate_recommended_macros(user_id: int) -> Optional[Dict[str, float]]:
     - 1g 碳水化合物 = 4 kcal
     - 1g 脂肪 = 9 kcal
 
+    计算结果来自缓存的个人信息快照(见 information.services.get_profile_snapshot),
+    使用用户的每日推荐热量(可能是自定义值)。
+
     Returns:
         包含推荐蛋白质、碳水和脂肪克数的字典,如果用户信息不存在则返回None
     """
-    try:
-        info = Information.objects.get(user_id=user_id)
-        daily_calories = info.daily_calories  # 使用用户的每日推荐热量(可能是自定义值)
+    snapshot = get_profile_snapshot(user_id)
+    if snapshot is None:
+        return None
+    return dict(snapshot['macros'])
 
-        # 计算推荐的营养素克数
-        recommended_protein = round((daily_calories * 0.175) / 4, 1)  # 17.5%的热量来自蛋白质
-        recommended_carbs = round((daily_calories * 0.525) / 4, 1)    # 52.5%的热量来自碳水
-        recommended_fat = round((daily_calories * 0.275) / 9, 1)      # 27.5%的热量来自脂肪
 
-        return {
-            'protein': recommended_protein,
-            'carbohydrates': recommended_carbs,
-            'fat': recommended_fat,
-        }
-    except Information.DoesNotExist:
-        return None
+def _apply_meal_delta(meal_record: MealRecord, calories: float, protein: float, carbs: float, fat: float):
+    """
+    将营养变化量同时应用到餐次总计和当日营养汇总上
+
+    必须在调用方的事务中执行, 保证餐次记录、食物项和每日汇总三者一致。
+    """
+    meal_record.apply_totals_delta(calories, protein, carbs, fat)
+    DailyNutritionSummary.apply_delta(
+        meal_record.user_id,
+        meal_record.meal_date,
+        calories,
+        protein,
+        carbs,
+        fat,
+        is_breakfast=meal_record.meal_type == 'breakfast',
+    )
+
+
+FOOD_FIELDS = ('id', 'name', 'category', 'calories', 'protein', 'carbohydrates', 'fat')
+
+# 完整食物库响应的缓存时间(秒), 缓存键包含版本号, 过期只影响内存占用
+FOOD_CATALOG_CACHE_TIMEOUT = 24 * 60 * 60
+
+# 当前进程最近一次序列化的食物库: (版本号, JSON字节串)
+_food_catalog_bytes: Tuple[int, bytes] = (-1, b'')
 
 
 def get_all_foods() -> ServiceResult:
@@ -49,30 +74,133 @@ def get_all_foods() -> ServiceResult:
     获取所有食物列表
     """
     try:
-        foods = FoodItem.objects.all().order_by('category', 'name')
-        foods_data = []
-
-        for food in foods:
-            foods_data.append({
-                'id': food.id,
-                'name': food.name,
-                'category': food.category,
-                'calories': food.calories,
-                'protein': food.protein,
-                'carbohydrates': food.carbohydrates,
-                'fat': food.fat,
-            })
+        version = FoodCatalogChange.current_version()
+        foods_data = list(FoodItem.objects.order_by('category', 'name').values(*FOOD_FIELDS))
 
         return {
             "code": 200,
             "message": "获取食物列表成功",
-            "data": {"foods": foods_data}
+            "data": {"foods": foods_data, "version": version}
         }
     except Exception as e:
         print(f"获取食物列表时发生错误: {e}")
         return {"code": 500, "message": "服务器内部错误", "data": None}
 
 
+def get_food_catalog() -> Tuple[int, bytes]:
+    """
+    获取序列化好的完整食物库响应
+
+    食物库极少变化, 按版本号缓存 JSON 字节串: 先查进程内缓存, 再查 Django 缓存,
+    都没有时才查询数据库并序列化。
+
+    Returns:
+        (食物库版本号, get_all_foods 响应的 JSON 字节串)
+    """
+    global _food_catalog_bytes
+    version = FoodCatalogChange.current_version()
+    if _food_catalog_bytes[0] == version:
+        return _food_catalog_bytes
+
+    cache_key = f'diet:food_catalog:{version}'
+    payload = cache.get(cache_key)
+    if payload is None:
+        response_data = get_all_foods()
+        if response_data['code'] != 200:
+            raise RuntimeError(response_data['message'])
+        # 序列化期间版本号可能已变化, 以实际查询到的版本为准
+        version = response_data['data']['version']
+        cache_key = f'diet:food_catalog:{version}'
+        payload = json.dumps(response_data, ensure_ascii=False, cls=DjangoJSONEncoder).encode('utf-8')
+        cache.set(cache_key, payload, FOOD_CATALOG_CACHE_TIMEOUT)
+
+    _food_catalog_bytes = (version, payload)
+    return _food_catalog_bytes
+
+
+def get_food_catalog_changes(since_version: int) -> Optional[ServiceResult]:
+    """
+    获取某个版本之后的食物库变更
+
+    Args:
+        since_version: 客户端已有的食物库版本号
+
+    Returns:
+        包含变更食物和已删除食物ID的ServiceResult;
+        如果无法提供增量(版本号无效或期间发生过批量导入), 返回None, 调用方应返回完整食物库
+    """
+    changes = list(
+        FoodCatalogChange.objects.filter(id__gt=since_version).order_by('id').values_list('id', 'food_id', 'action')
+    )
+    version = changes[-1][0] if changes else FoodCatalogChange.current_version()
+
+    # 客户端版本号比服务端还新(如数据库被重建), 或期间有批量导入, 无法拼出增量
+    if since_version > version or any(action == 'reset' for _, _, action in changes):
+        return None
+
+    changed_ids = {food_id for _, food_id, _ in changes}
+    foods_data = list(FoodItem.objects.filter(id__in=changed_ids).values(*FOOD_FIELDS)) if changed_ids else []
+    deleted_ids = sorted(changed_ids - {food['id'] for food in foods_data})
+
+    return {
+        "code": 200,
+        "message": "获取食物库变更成功",
+        "data": {
+            "version": version,
+            "since_version": since_version,
+            "foods": foods_data,
+            "deleted_ids": deleted_ids,
+        }
+    }
+
+
+def search_foods(keyword: str, page: int = 1, page_size: int = 20) -> ServiceResult:
+    """
+    按名称/分类搜索食物(前缀 + n-gram 索引, 按相关度排序并分页)
+
+    Args:
+        keyword: 搜索关键词
+        page: 页码, 从1开始
+        page_size: 每页数量
+    """
+    try:
+        index = get_food_search_index()
+        total, foods = index.search(keyword, limit=page_size, offset=(page - 1) * page_size)
+
+        return {
+            "code": 200,
+            "message": "搜索食物成功",
+            "data": {
+                "foods": foods,
+                "total": total,
+                "page": page,
+                "page_size": page_size,
+            }
+        }
+    except Exception as e:
+        print(f"搜索食物时发生错误: {e}")
+        return {"code": 500, "message": "服务器内部错误", "data": None}
+
+
+def resolve_food_names(names: List[str]) -> Dict[str, Optional[Dict[str, Any]]]:
+    """
+    将一批自由输入的食物名称解析为食物库中的食物
+
+    全部名称在内存搜索索引中一次性完成匹配, 不会逐个查询数据库。
+    只接受名称精确匹配和别名匹配: 模糊匹配常把"炒鸡胸肉"解析为"鸡胸肉",
+    用原料数据覆盖用户记录的营养值会丢失烹饪带来的差异, 此时返回 None, 保留用户提交的数据。
+
+    Returns:
+        {原始名称: 食物字典(id/name/category及每100g营养) 或 None}
+    """
+    index = get_food_search_index()
+    resolved = {}
+    for name in set(names):
+        matched, match_type = index.resolve(name)
+        resolved[name] = matched if match_type in ('exact', 'alias') else None
+    return resolved
+
+
 def add_food_to_meal(user_id: int, meal_type: str, food_id: int, weight: float, meal_date: str = None) -> ServiceResult:
     """
     向指定餐次添加食物
@@ -97,24 +225,31 @@ def add_food_to_meal(user_id: int, meal_type: str, food_id: int, weight: float,
         else:
             meal_date_obj = date.today()
 
-        # 获取或创建餐次记录
-        meal_record, created = MealRecord.objects.get_or_create(
-            user_id=user_id,
-            meal_date=meal_date_obj,
-            meal_type=meal_type
-        )
-
-        # 创建食物项
-        meal_food_item = MealFoodItem(
-            meal_record=meal_record,
-            food_item=food,
-            weight=weight
-        )
-        meal_food_item.calculate_nutrition()  # 计算营养成分
-        meal_food_item.save()
+        with transaction.atomic():
+            # 获取或创建餐次记录
+            meal_record, created = MealRecord.objects.get_or_create(
+                user_id=user_id,
+                meal_date=meal_date_obj,
+                meal_type=meal_type
+            )
 
-        # 更新餐次总计
-        meal_record.calculate_totals()
+            # 创建食物项
+            meal_food_item = MealFoodItem(
+                meal_record=meal_record,
+                food_item=food,
+                weight=weight
+            )
+            meal_food_item.calculate_nutrition()  # 计算营养成分
+            meal_food_item.save()
+
+            # 增量更新餐次总计
+            _apply_meal_delta(
+                meal_record,
+                meal_food_item.calories,
+                meal_food_item.protein,
+                meal_food_item.carbohydrates,
+                meal_food_item.fat,
+            )
 
         return {
             "code": 200,
@@ -143,16 +278,24 @@ def remove_food_from_meal(user_id: int, meal_food_id: int) -> ServiceResult:
         meal_food_id: 餐次食物项ID
     """
     try:
-        meal_food_item = MealFoodItem.objects.get(
-            id=meal_food_id,
-            meal_record__user_id=user_id
-        )
+        with transaction.atomic():
+            # 锁定食物项: 并发删除同一项时只有一个能扣除其营养, 另一个等待后得到"不存在"
+            meal_food_item = MealFoodItem.objects.select_for_update(of=('self',)).select_related('meal_record').get(
+                id=meal_food_id,
+                meal_record__user_id=user_id
+            )
 
-        meal_record = meal_food_item.meal_record
-        meal_food_item.delete()
+            meal_record = meal_food_item.meal_record
+            meal_food_item.delete()
 
-        # 更新餐次总计
-        meal_record.calculate_totals()
+            # 增量更新餐次总计: 扣除被删除食物项的营养
+            _apply_meal_delta(
+                meal_record,
+                -meal_food_item.calories,
+                -meal_food_item.protein,
+                -meal_food_item.carbohydrates,
+                -meal_food_item.fat,
+            )
 
         return {
             "code": 200,
@@ -167,6 +310,74 @@ def remove_food_from_meal(user_id: int, meal_food_id: int) -> ServiceResult:
         return {"code": 500, "message": "服务器内部错误", "data": None}
 
 
+def _empty_meals() -> Dict[str, Dict[str, Any]]:
+    """一天中三个餐次的空数据"""
+    return {
+        meal_type: {'foods': [], 'total_calories': 0, 'total_protein': 0, 'total_carbs': 0, 'total_fat': 0}
+        for meal_type in ('breakfast', 'lunch', 'dinner')
+    }
+
+
+def _serialize_meal_food(food_item: MealFoodItem) -> Dict[str, Any]:
+    """将餐次中的食物项转换为响应字典"""
+    if food_item.food_item:
+        food_name = food_item.food_item.name
+        food_id = food_item.food_item.id
+    else:
+        food_name = food_item.food_item_name # 兜底避免空值
+        food_id = None  # 无对应食物时id为None
+    return {
+        'meal_food_id': food_item.id,
+        'food_id': food_id,
+        'name': food_name,
+        'weight': round(food_item.weight, 1),
+        'calories': round(food_item.calories, 1),
+        'protein': round(food_item.protein, 1),
+        'carbohydrates': round(food_item.carbohydrates, 1),
+        'fat': round(food_item.fat, 1),
+    }
+
+
+def _build_day_data(meal_date_obj: date, meal_records: List[MealRecord], foods_by_meal: Dict[int, List[Dict[str, Any]]]) -> Dict[str, Any]:
+    """
+    汇总某一天的餐次数据
+
+    Args:
+        meal_date_obj: 日期
+        meal_records: 该日期的餐次记录
+        foods_by_meal: {餐次记录ID: 已序列化的食物项列表}
+    """
+    meals_data = _empty_meals()
+
+    daily_total_calories = 0
+    daily_total_protein = 0
+    daily_total_carbs = 0
+    daily_total_fat = 0
+
+    for meal_record in meal_records:
+        meals_data[meal_record.meal_type] = {
+            'foods': foods_by_meal.get(meal_record.id, []),
+            'total_calories': round(meal_record.total_calories, 1),
+            'total_protein': round(meal_record.total_protein, 1),
+            'total_carbs': round(meal_record.total_carbs, 1),
+            'total_fat': round(meal_record.total_fat, 1),
+        }
+
+        daily_total_calories += meal_record.total_calories
+        daily_total_protein += meal_record.total_protein
+        daily_total_carbs += meal_record.total_carbs
+        daily_total_fat += meal_record.total_fat
+
+    return {
+        "date": meal_date_obj.strftime('%Y-%m-%d'),
+        "meals": meals_data,
+        "daily_total_calories": round(daily_total_calories, 1),
+        "daily_total_protein": round(daily_total_protein, 1),
+        "daily_total_carbs": round(daily_total_carbs, 1),
+        "daily_total_fat": round(daily_total_fat, 1),
+    }
+
+
 def get_daily_meals(user_id: int, meal_date: str = None) -> ServiceResult:
     """
     获取某天的所有餐次记录
@@ -186,71 +397,21 @@ def get_daily_meals(user_id: int, meal_date: str = None) -> ServiceResult:
             meal_date_obj = date.today()
 
         # 获取该日期的所有餐次
-        meal_records = MealRecord.objects.filter(
+        meal_records = list(MealRecord.objects.filter(
             user_id=user_id,
             meal_date=meal_date_obj
-        ).prefetch_related('food_items__food_item')
+        ).prefetch_related('food_items__food_item'))
 
         # 构建返回数据
-        meals_data = {
-            'breakfast': {'foods': [], 'total_calories': 0, 'total_protein': 0, 'total_carbs': 0, 'total_fat': 0},
-            'lunch': {'foods': [], 'total_calories': 0, 'total_protein': 0, 'total_carbs': 0, 'total_fat': 0},
-            'dinner': {'foods': [], 'total_calories': 0, 'total_protein': 0, 'total_carbs': 0, 'total_fat': 0},
+        foods_by_meal = {
+            meal_record.id: [_serialize_meal_food(food_item) for food_item in meal_record.food_items.all()]
+            for meal_record in meal_records
         }
-
-        daily_total_calories = 0
-        daily_total_protein = 0
-        daily_total_carbs = 0
-        daily_total_fat = 0
-
-        for meal_record in meal_records:
-            meal_type = meal_record.meal_type
-
-            # 获取该餐次的所有食物
-            foods_list = []
-            for food_item in meal_record.food_items.all():
-                if food_item.food_item:
-                    food_name = food_item.food_item.name
-                    food_id = food_item.food_item.id
-                else:
-                    food_name = food_item.food_item_name # 兜底避免空值
-                    food_id = None  # 无对应食物时id为None
-                foods_list.append({
-                    'meal_food_id': food_item.id,
-                    'food_id': food_id,
-                    'name': food_name,
-                    'weight': round(food_item.weight, 1),
-                    'calories': round(food_item.calories, 1),
-                    'protein': round(food_item.protein, 1),
-                    'carbohydrates': round(food_item.carbohydrates, 1),
-                    'fat': round(food_item.fat, 1),
-                })
-
-            meals_data[meal_type] = {
-                'foods': foods_list,
-                'total_calories': round(meal_record.total_calories, 1),
-                'total_protein': round(meal_record.total_protein, 1),
-                'total_carbs': round(meal_record.total_carbs, 1),
-                'total_fat': round(meal_record.total_fat, 1),
-            }
-
-            daily_total_calories += meal_record.total_calories
-            daily_total_protein += meal_record.total_protein
-            daily_total_carbs += meal_record.total_carbs
-            daily_total_fat += meal_record.total_fat
+        response_data = _build_day_data(meal_date_obj, meal_records, foods_by_meal)
 
         # 计算推荐的营养素配比
         recommended_macros = calculate_recommended_macros(user_id)
 
-        response_data = {
-            "date": meal_date_obj.strftime('%Y-%m-%d'),
-            "meals": meals_data,
-            "daily_total_calories": round(daily_total_calories, 1),
-            "daily_total_protein": round(daily_total_protein, 1),
-            "daily_total_carbs": round(daily_total_carbs, 1),
-            "daily_total_fat": round(daily_total_fat, 1),
-        }
-
         # 如果能获取到推荐值,则添加到响应中
         if recommended_macros:
             response_data["recommended_protein"] = recommended_macros['protein']
@@ -268,6 +429,84 @@ def get_daily_meals(user_id: int, meal_date: str = None) -> ServiceResult:
         return {"code": 500, "message": "服务器内部错误", "data": None}
 
 
+# 区间查询最多支持的天数
+MAX_MEAL_RANGE_DAYS = 366
+
+
+def parse_meal_range(start: Optional[str], end: Optional[str]) -> Tuple[Optional[ServiceResult], Optional[date], Optional[date]]:
+    """
+    校验餐次区间查询的起止日期
+
+    Returns:
+        (错误结果, 开始日期, 结束日期), 校验通过时错误结果为None
+    """
+    if not start or not end:
+        return {"code": 300, "message": "缺少必要参数: start, end", "data": None}, None, None
+    try:
+        start_date = datetime.strptime(start, '%Y-%m-%d').date()
+        end_date = datetime.strptime(end, '%Y-%m-%d').date()
+    except ValueError:
+        return {"code": 300, "message": "日期格式错误,应为YYYY-MM-DD", "data": None}, None, None
+
+    if end_date < start_date:
+        return {"code": 300, "message": "end不能早于start", "data": None}, None, None
+    if (end_date - start_date).days + 1 > MAX_MEAL_RANGE_DAYS:
+        return {"code": 300, "message": f"查询区间不能超过{MAX_MEAL_RANGE_DAYS}天", "data": None}, None, None
+    return None, start_date, end_date
+
+
+def iter_meals_in_range(user_id: int, start_date: date, end_date: date) -> Iterator[bytes]:
+    """
+    按天流式生成区间内的餐次记录JSON
+
+    无论区间多长都只执行固定数量的查询: 餐次记录一次性读取(每天最多3条),
+    食物项通过一个按日期排序的游标逐天消费, 每生成完一天就立即输出,
+    不需要在内存中拼出完整响应。
+    """
+    meal_records_by_date: Dict[date, List[MealRecord]] = {}
+    for meal_record in MealRecord.objects.filter(
+        user_id=user_id,
+        meal_date__gte=start_date,
+        meal_date__lte=end_date
+    ).order_by('meal_date', 'meal_type'):
+        meal_records_by_date.setdefault(meal_record.meal_date, []).append(meal_record)
+
+    food_items = MealFoodItem.objects.filter(
+        meal_record__user_id=user_id,
+        meal_record__meal_date__gte=start_date,
+        meal_record__meal_date__lte=end_date
+    ).select_related('meal_record', 'food_item').order_by('meal_record__meal_date', 'id').iterator(chunk_size=500)
+    pending_food = next(food_items, None)
+
+    header = {
+        "start_date": start_date.strftime('%Y-%m-%d'),
+        "end_date": end_date.strftime('%Y-%m-%d'),
+    }
+    recommended_macros = calculate_recommended_macros(user_id)
+    if recommended_macros:
+        header["recommended_protein"] = recommended_macros['protein']
+        header["recommended_carbs"] = recommended_macros['carbohydrates']
+        header["recommended_fat"] = recommended_macros['fat']
+
+    # 手动拼接外层结构, 逐天输出 days 数组中的元素
+    prefix = json.dumps({"code": 200, "message": "获取餐次记录成功", "data": header}, ensure_ascii=False)
+    yield (prefix[:-2] + ', "days": [').encode('utf-8')
+
+    current = start_date
+    while current <= end_date:
+        foods_by_meal: Dict[int, List[Dict[str, Any]]] = {}
+        while pending_food is not None and pending_food.meal_record.meal_date == current:
+            foods_by_meal.setdefault(pending_food.meal_record_id, []).append(_serialize_meal_food(pending_food))
+            pending_food = next(food_items, None)
+
+        day_data = _build_day_data(current, meal_records_by_date.get(current, []), foods_by_meal)
+        separator = '' if current == start_date else ', '
+        yield (separator + json.dumps(day_data, ensure_ascii=False)).encode('utf-8')
+        current += timedelta(days=1)
+
+    yield b']}}'
+
+
 def update_food_weight(user_id: int, meal_food_id: int, new_weight: float) -> ServiceResult:
     """
     更新餐次中食物的重量
@@ -278,18 +517,33 @@ def update_food_weight(user_id: int, meal_food_id: int, new_weight: float) -> Se
         new_weight: 新的重量(克)
     """
     try:
-        meal_food_item = MealFoodItem.objects.get(
-            id=meal_food_id,
-            meal_record__user_id=user_id
-        )
-
-        meal_food_item.weight = new_weight
-        meal_food_item.calculate_nutrition()  # 重新计算营养成分
-        meal_food_item.save()
+        with transaction.atomic():
+            # 锁定食物项(食物库外键可为空, 只锁本表): 并发修改同一项时依次读取旧值, 差值不会重复累加
+            meal_food_item = MealFoodItem.objects.select_for_update(of=('self',)).select_related(
+                'meal_record', 'food_item'
+            ).get(
+                id=meal_food_id,
+                meal_record__user_id=user_id
+            )
 
-        # 更新餐次总计
-        meal_record = meal_food_item.meal_record
-        meal_record.calculate_totals()
+            old_calories = meal_food_item.calories
+            old_protein = meal_food_item.protein
+            old_carbs = meal_food_item.carbohydrates
+            old_fat = meal_food_item.fat
+
+            meal_food_item.weight = new_weight
+            meal_food_item.calculate_nutrition()  # 重新计算营养成分
+            meal_food_item.save()
+
+            # 增量更新餐次总计: 只应用新旧营养值的差
+            meal_record = meal_food_item.meal_record
+            _apply_meal_delta(
+                meal_record,
+                meal_food_item.calories - old_calories,
+                meal_food_item.protein - old_protein,
+                meal_food_item.carbohydrates - old_carbs,
+                meal_food_item.fat - old_fat,
+            )
 
         return {
             "code": 200,
@@ -315,7 +569,8 @@ def batch_add_foods_to_meal(
     total_protein: float,
     total_carbs: float,
     total_fat: float,
-    foods: List[Dict[str, Any]]
+    foods: List[Dict[str, Any]],
+    resolve_foods: bool = False
 ) -> ServiceResult:
     """
     批量添加食物到餐次记录
@@ -334,6 +589,8 @@ def batch_add_foods_to_meal(
             - protein: 蛋白质
             - carbohydrates: 碳水化合物
             - fat: 脂肪
+        resolve_foods: 是否将食物名称匹配到食物库; 名称或别名完全匹配的食物会关联FoodItem,
+            营养成分按食物库数据在服务端重新计算, 餐次总计随之修正(模糊匹配不关联, 保留提交的数据)
 
     Returns:
         ServiceResult: 包含操作结果的字典
@@ -354,32 +611,9 @@ def batch_add_foods_to_meal(
         if not foods or not isinstance(foods, list):
             return {"code": 300, "message": "foods参数必须为非空数组", "data": None}
 
-        # 获取或创建餐次记录
-        meal_record, created = MealRecord.objects.get_or_create(
-            user_id=user_id,
-            meal_date=meal_date_obj,
-            meal_type=meal_type,
-            defaults={
-                'total_calories': total_calories,
-                'total_protein': total_protein,
-                'total_carbs': total_carbs,
-                'total_fat': total_fat,
-            }
-        )
-
-        # 如果餐次记录已存在,更新总计
-        if not created:
-            meal_record.total_calories = total_calories
-            meal_record.total_protein = total_protein
-            meal_record.total_carbs = total_carbs
-            meal_record.total_fat = total_fat
-            meal_record.save()
-
-        # 批量创建食物项
-        meal_food_items = []
+        # 验证每个食物项的必需字段
+        required_fields = ['name', 'weight', 'calories', 'protein', 'carbohydrates', 'fat']
         for food_data in foods:
-            # 验证必需字段
-            required_fields = ['name', 'weight', 'calories', 'protein', 'carbohydrates', 'fat']
             missing_fields = [field for field in required_fields if field not in food_data]
             if missing_fields:
                 return {
@@ -388,8 +622,12 @@ def batch_add_foods_to_meal(
                     "data": None
                 }
 
+        # 构建食物项(解析名称只访问内存索引, 放在事务之外)
+        resolved = resolve_food_names([food_data['name'] for food_data in foods]) if resolve_foods else {}
+        meal_food_items = []
+        resolved_foods = []
+        for food_data in foods:
             meal_food_item = MealFoodItem(
-                meal_record=meal_record,
                 food_item=None,  # 不关联FoodItem
                 food_item_name=food_data['name'],
                 weight=food_data['weight'],
@@ -398,10 +636,51 @@ def batch_add_foods_to_meal(
                 carbohydrates=food_data['carbohydrates'],
                 fat=food_data['fat']
             )
+
+            matched = resolved.get(food_data['name'])
+            if matched:
+                # 以食物库数据为准重新计算, 并把差值计入餐次总计
+                meal_food_item.food_item = FoodItem(**matched)
+                meal_food_item.weight = float(food_data['weight'])
+                meal_food_item.calculate_nutrition()
+                total_calories += meal_food_item.calories - float(food_data['calories'])
+                total_protein += meal_food_item.protein - float(food_data['protein'])
+                total_carbs += meal_food_item.carbohydrates - float(food_data['carbohydrates'])
+                total_fat += meal_food_item.fat - float(food_data['fat'])
+                resolved_foods.append({
+                    "name": food_data['name'],
+                    "food_id": matched['id'],
+                    "matched_name": matched['name'],
+                    "calories": meal_food_item.calories,
+                })
             meal_food_items.append(meal_food_item)
 
-        # 批量插入数据库
-        MealFoodItem.objects.bulk_create(meal_food_items)
+        total_calories = round(total_calories, 2)
+        total_protein = round(total_protein, 2)
+        total_carbs = round(total_carbs, 2)
+        total_fat = round(total_fat, 2)
+
+        with transaction.atomic():
+            # 获取或创建餐次记录(总计统一由下方的增量更新写入)
+            meal_record, created = MealRecord.objects.select_for_update().get_or_create(
+                user_id=user_id,
+                meal_date=meal_date_obj,
+                meal_type=meal_type
+            )
+
+            # 餐次总计以客户端提交的值为准, 换算成相对原总计的变化量
+            _apply_meal_delta(
+                meal_record,
+                total_calories - meal_record.total_calories,
+                total_protein - meal_record.total_protein,
+                total_carbs - meal_record.total_carbs,
+                total_fat - meal_record.total_fat,
+            )
+
+            # 批量插入数据库
+            for meal_food_item in meal_food_items:
+                meal_food_item.meal_record = meal_record
+            MealFoodItem.objects.bulk_create(meal_food_items)
 
         return {
             "code": 200,
@@ -415,6 +694,7 @@ def batch_add_foods_to_meal(
                 "total_protein": total_protein,
                 "total_carbs": total_carbs,
                 "total_fat": total_fat,
+                "resolved_foods": resolved_foods,
             }
         }
 
@@ -425,40 +705,68 @@ def batch_add_foods_to_meal(
         return {"code": 500, "message": "服务器内部错误", "data": None}
 
 
+# 饮食建议缓存的兜底有效期(秒); 输入数据变化时指纹随之变化, 旧结果自然失效
+DIET_SUGGESTION_CACHE_TIMEOUT = 60 * 60 * 24
+
+
+def _diet_suggestion_cache_key(user_id: int, days: int, end_date: date, window: Dict[str, Any], profile_version: str) -> str:
+    """
+    根据生成建议所依赖的全部输入计算缓存键
+
+    指纹包含: 用户、天数、统计区间、区间内每日汇总的条数和最近更新时间、个人信息快照版本。
+    每次餐次写入都会更新当日汇总的 updated_at, 因此任何饮食记录变化都会得到新的键。
+    """
+    latest = window['latest'].isoformat() if window['latest'] else ''
+    fingerprint = f"{user_id}:{days}:{end_date.isoformat()}:{window['day_count']}:{latest}:{profile_version}"
+    return "diet:suggestion:" + hashlib.sha1(fingerprint.encode('utf-8')).hexdigest()
+
+
 def get_diet_suggestion(user_id: int, days: int = 7) -> ServiceResult:
     """
     根据用户最近的饮食记录和健康信息生成饮食建议(返回一整段文字)
 
+    生成结果按输入数据指纹缓存, 饮食记录和个人信息都没有变化时直接返回缓存的建议。
+
     Args:
         user_id: 用户ID
         days: 分析最近多少天的数据,默认7天
     """
     try:
-        from datetime import timedelta
-        from django.db.models import Avg, Sum
 
-        # 获取用户健康信息
-        try:
-            user_info = Information.objects.get(user_id=user_id)
-        except Information.DoesNotExist:
+        # 获取用户健康信息及推荐营养素(同一份缓存快照)
+        user_info = get_profile_snapshot(user_id)
+        if user_info is None:
             return {"code": 400, "message": "请先完善个人健康信息", "data": None}
-
-        # 计算推荐营养素
-        recommended_macros = calculate_recommended_macros(user_id)
-        if not recommended_macros:
-            return {"code": 400, "message": "无法计算推荐营养素配比", "data": None}
+        recommended_macros = user_info['macros']
 
         # 获取最近N天的饮食记录
         end_date = date.today()
         start_date = end_date - timedelta(days=days-1)
 
-        meal_records = MealRecord.objects.filter(
+        # 一次条件聚合同时得到缓存指纹和统计值: 记录天数、最近更新时间、
+        # 日均热量/三大营养素、吃了早餐的天数, 查询次数与统计天数无关
+        window = DailyNutritionSummary.objects.filter(
             user_id=user_id,
             meal_date__gte=start_date,
             meal_date__lte=end_date
+        ).aggregate(
+            day_count=Count('id'),
+            latest=Max('updated_at'),
+            avg_calories=Avg('total_calories'),
+            avg_protein=Avg('total_protein'),
+            avg_carbs=Avg('total_carbs'),
+            avg_fat=Avg('total_fat'),
+            breakfast_count=Count('id', filter=Q(has_breakfast=True)),
         )
 
-        if not meal_records.exists():
+        cache_key = _diet_suggestion_cache_key(user_id, days, end_date, window, user_info['version'])
+        cached_data = cache.get(cache_key)
+        if cached_data is not None:
+            metrics.incr('diet.suggestion.hit')
+            return {"code": 200, "message": "生成饮食建议成功", "data": cached_data}
+        metrics.incr('diet.suggestion.miss')
+
+        if not window['day_count']:
             return {
                 "code": 400,
                 "message": f"最近{days}天没有饮食记录,请先添加饮食记录",
@@ -466,20 +774,13 @@ def get_diet_suggestion(user_id: int, days: int = 7) -> ServiceResult:
             }
 
         # 统计分析
-        daily_stats = meal_records.values('meal_date').annotate(
-            daily_calories=Sum('total_calories'),
-            daily_protein=Sum('total_protein'),
-            daily_carbs=Sum('total_carbs'),
-            daily_fat=Sum('total_fat')
-        )
-
-        avg_calories = sum(d['daily_calories'] for d in daily_stats) / len(daily_stats) if daily_stats else 0
-        avg_protein = sum(d['daily_protein'] for d in daily_stats) / len(daily_stats) if daily_stats else 0
-        avg_carbs = sum(d['daily_carbs'] for d in daily_stats) / len(daily_stats) if daily_stats else 0
-        avg_fat = sum(d['daily_fat'] for d in daily_stats) / len(daily_stats) if daily_stats else 0
+        avg_calories = window['avg_calories']
+        avg_protein = window['avg_protein']
+        avg_carbs = window['avg_carbs']
+        avg_fat = window['avg_fat']
 
         # 分析各餐次情况
-        breakfast_count = meal_records.filter(meal_type='breakfast').count()
+        breakfast_count = window['breakfast_count']
 
         # 生成建议文本
         suggestion_parts = []
@@ -488,7 +789,7 @@ def get_diet_suggestion(user_id: int, days: int = 7) -> ServiceResult:
         suggestion_parts.append(f"根据您最近{days}天的饮食记录分析:")
 
         # 1. 热量建议
-        target_calories = user_info.daily_calories
+        target_calories = user_info['daily_calories']
         calorie_diff = avg_calories - target_calories
         calorie_diff_percent = (calorie_diff / target_calories * 100) if target_calories > 0 else 0
 
@@ -543,12 +844,13 @@ def get_diet_suggestion(user_id: int, days: int = 7) -> ServiceResult:
             suggestion_parts.append("\n建议规律吃早餐,早餐对新陈代谢和一天的精力都很重要。")
 
         # 6. 根据健康目标的建议
-        if user_info.target:
-            if "减肥" in user_info.target or "减脂" in user_info.target:
+        target = user_info['target']
+        if target:
+            if "减肥" in target or "减脂" in target:
                 suggestion_parts.append("\n针对您的减脂目标:建议控制总热量摄入,增加蛋白质比例,适量运动,避免过度节食。")
-            elif "增肌" in user_info.target:
+            elif "增肌" in target:
                 suggestion_parts.append("\n针对您的增肌目标:建议适当提高蛋白质摄入(1.6-2.2g/kg体重),配合力量训练。")
-            elif "维持" in user_info.target:
+            elif "维持" in target:
                 suggestion_parts.append("\n针对您的维持目标:继续保持均衡饮食和规律运动习惯即可。")
 
         # 结尾
@@ -557,12 +859,13 @@ def get_diet_suggestion(user_id: int, days: int = 7) -> ServiceResult:
         # 合并成一整段文字
         suggestion_text = "".join(suggestion_parts)
 
+        response_data = {"suggestion": suggestion_text}
+        cache.set(cache_key, response_data, DIET_SUGGESTION_CACHE_TIMEOUT)
+
         return {
             "code": 200,
             "message": "生成饮食建议成功",
-            "data": {
-                "suggestion": suggestion_text
-            }
+            "data": response_data
         }
 
     except Exception as e:
@@ -0,0 +1,25 @@
+# diet/signals.py
+
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from .models import FoodItem, FoodAlias, FoodCatalogChange
+
+
+@receiver(post_save, sender=FoodItem)
+def food_item_saved(sender, instance, **kwargs):
+    """食物新增或修改后记录变更, 食物库版本号随之递增"""
+    FoodCatalogChange.objects.create(food_id=instance.id, action='upsert')
+
+
+@receiver(post_delete, sender=FoodItem)
+def food_item_deleted(sender, instance, **kwargs):
+    """食物删除后记录变更, 食物库版本号随之递增"""
+    FoodCatalogChange.objects.create(food_id=instance.id, action='delete')
+
+
+@receiver(post_save, sender=FoodAlias)
+@receiver(post_delete, sender=FoodAlias)
+def food_alias_changed(sender, instance, **kwargs):
+    """别名变化会影响名称解析, 同样递增食物库版本号使搜索索引重建"""
+    FoodCatalogChange.objects.create(food_id=instance.food_item_id, action='upsert')
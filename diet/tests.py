@@ -0,0 +1,68 @@
+from datetime import date, timedelta
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase
+
+from information.models import Information
+from .models import DailyNutritionSummary
+from .services import get_diet_suggestion
+
+
+class DietSuggestionQueryCountTests(TestCase):
+    """饮食建议的查询次数与统计天数无关: 个人信息快照 1 次(已缓存时 0 次) + 每日汇总聚合 1 次"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user(username='suggestion', password='password123')
+        Information.objects.create(user=cls.user, height=170, weight=65, age=30, gender='M', target='减脂')
+        today = date.today()
+        DailyNutritionSummary.objects.bulk_create([
+            DailyNutritionSummary(
+                user=cls.user,
+                meal_date=today - timedelta(days=offset),
+                total_calories=1800 + offset * 10,
+                total_protein=70,
+                total_carbs=230,
+                total_fat=60,
+                has_breakfast=offset % 2 == 0,
+            )
+            for offset in range(30)
+        ])
+
+    def setUp(self):
+        cache.clear()
+
+    def test_query_count_for_each_window(self):
+        for days in (1, 7, 30):
+            with self.subTest(days=days):
+                cache.clear()
+
+                # 个人信息和建议都未缓存
+                with self.assertNumQueries(2):
+                    result = get_diet_suggestion(self.user.id, days)
+                self.assertEqual(result['code'], 200)
+                self.assertIn(f"最近{days}天", result['data']['suggestion'])
+
+                # 建议已缓存: 只需聚合一次计算指纹
+                with self.assertNumQueries(1):
+                    cached = get_diet_suggestion(self.user.id, days)
+                self.assertEqual(cached['data'], result['data'])
+
+    def test_profile_cached_suggestion_miss(self):
+        get_diet_suggestion(self.user.id, 7)
+        for days in (1, 30):
+            with self.subTest(days=days):
+                with self.assertNumQueries(1):
+                    result = get_diet_suggestion(self.user.id, days)
+                self.assertEqual(result['code'], 200)
+
+    def test_new_record_invalidates_cached_suggestion(self):
+        first = get_diet_suggestion(self.user.id, 7)['data']['suggestion']
+        summary = DailyNutritionSummary.objects.get(user=self.user, meal_date=date.today())
+        summary.total_calories = 4000
+        summary.save()
+
+        with self.assertNumQueries(1):
+            second = get_diet_suggestion(self.user.id, 7)['data']['suggestion']
+        self.assertNotEqual(first, second)
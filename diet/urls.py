@@ -9,6 +9,9 @@ urlpatterns = [
     # 获取所有食物列表
     path('foods/', views.get_foods_view, name='get_foods'),
 
+    # 搜索食物(分页)
+    path('foods/search/', views.search_foods_view, name='search_foods'),
+
     # 添加食物到餐次
     path('add_food/', views.add_food_view, name='add_food'),
 
@@ -21,6 +24,9 @@ urlpatterns = [
     # 获取每日餐次记录
     path('daily_meals/', views.get_daily_meals_view, name='daily_meals'),
 
+    # 获取日期区间内的餐次记录
+    path('meals/range/', views.get_meals_range_view, name='meals_range'),
+
     # 更新食物重量
     path('update_weight/', views.update_food_weight_view, name='update_weight'),
 
@@ -1,17 +1,21 @@
 # diet/views.py
 
 import json
-from django.http import JsonResponse
+from django.http import JsonResponse, HttpResponse, HttpResponseNotModified, StreamingHttpResponse
 from django.views.decorators.csrf import csrf_exempt
 from rest_framework.decorators import api_view, authentication_classes, permission_classes
 from rest_framework.authentication import TokenAuthentication, SessionAuthentication
 from rest_framework.permissions import IsAuthenticated
 
 from .services import (
-    get_all_foods,
+    get_food_catalog,
+    get_food_catalog_changes,
+    search_foods,
     add_food_to_meal,
     remove_food_from_meal,
     get_daily_meals,
+    parse_meal_range,
+    iter_meals_in_range,
     update_food_weight,
     get_diet_suggestion,
     batch_add_foods_to_meal
@@ -20,14 +24,20 @@ from core.types import ServiceResult
 
 
 @csrf_exempt
-@api_view(['POST'])
+@api_view(['GET', 'POST'])
 @authentication_classes([TokenAuthentication, SessionAuthentication])
 @permission_classes([IsAuthenticated])
 def get_foods_view(request):
     """
     获取所有食物列表
 
-    请求参数: 无
+    请求参数:
+    {
+        "since_version": 12  # 可选,客户端已有的食物库版本号,传入时只返回之后的变更
+    }
+    GET 请求时 since_version 通过查询参数传递。
+
+    响应头带有 ETag(对应食物库版本号), 客户端携带 If-None-Match 且食物库未变化时返回304。
 
     返回示例:
     {
@@ -43,13 +53,130 @@ def get_foods_view(request):
                     "protein": 2.6,
                     ...
                 }
-            ]
+            ],
+            "version": 12
+        }
+    }
+
+    增量返回示例:
+    {
+        "code": 200,
+        "message": "获取食物库变更成功",
+        "data": {
+            "version": 15,
+            "since_version": 12,
+            "foods": [...],  # 新增或修改过的食物
+            "deleted_ids": [8]
         }
     }
     """
-    response_data = get_all_foods()
-    http_status = 200 if response_data['code'] == 200 else 400
-    return JsonResponse(response_data, status=http_status)
+    try:
+        if request.method == 'GET':
+            since_version = request.GET.get('since_version')
+        else:
+            data = json.loads(request.body) if request.body else {}
+            since_version = data.get('since_version')
+
+        if since_version is not None:
+            response_data = get_food_catalog_changes(int(since_version))
+            if response_data is not None:
+                response = JsonResponse(response_data)
+                response['ETag'] = f'"food-catalog-{response_data["data"]["version"]}"'
+                return response
+
+        version, payload = get_food_catalog()
+    except (json.JSONDecodeError, ValueError, TypeError) as e:
+        response_data: ServiceResult = {
+            "code": 400,
+            "message": f"请求格式错误: {e}",
+            "data": None
+        }
+        return JsonResponse(response_data, status=400)
+    except Exception as e:
+        print(f"获取食物列表时发生错误: {e}")
+        response_data: ServiceResult = {"code": 500, "message": "服务器内部错误", "data": None}
+        return JsonResponse(response_data, status=400)
+
+    etag = f'"food-catalog-{version}"'
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH', '')
+    if etag in [tag.strip() for tag in if_none_match.split(',')]:
+        response = HttpResponseNotModified()
+    else:
+        response = HttpResponse(payload, content_type='application/json')
+    response['ETag'] = etag
+    return response
+
+
+@csrf_exempt
+@api_view(['POST'])
+@authentication_classes([TokenAuthentication, SessionAuthentication])
+@permission_classes([IsAuthenticated])
+def search_foods_view(request):
+    """
+    搜索食物(分页)
+
+    请求参数:
+    {
+        "keyword": "鸡",
+        "page": 1,  # 可选,默认1
+        "page_size": 20  # 可选,默认20,最大100
+    }
+
+    返回示例:
+    {
+        "code": 200,
+        "message": "搜索食物成功",
+        "data": {
+            "foods": [
+                {
+                    "id": 23,
+                    "name": "鸡胸肉",
+                    "category": "肉类",
+                    "calories": 133,
+                    "protein": 19.4,
+                    ...
+                }
+            ],
+            "total": 5,
+            "page": 1,
+            "page_size": 20
+        }
+    }
+    """
+    try:
+        data = json.loads(request.body) if request.body else {}
+        keyword = data.get('keyword')
+
+        if not keyword or not isinstance(keyword, str):
+            response_data: ServiceResult = {
+                "code": 300,
+                "message": "缺少必要参数: keyword",
+                "data": None
+            }
+            return JsonResponse(response_data, status=400)
+
+        page = int(data.get('page', 1))
+        page_size = int(data.get('page_size', 20))
+        if page < 1 or page_size < 1 or page_size > 100:
+            response_data: ServiceResult = {
+                "code": 300,
+                "message": "page必须大于0, page_size必须在1-100之间",
+                "data": None
+            }
+            return JsonResponse(response_data, status=400)
+
+        response_data = search_foods(keyword=keyword, page=page, page_size=page_size)
+
+        http_status = 200 if response_data['code'] == 200 else 400
+        return JsonResponse(response_data, status=http_status)
+
+    except (json.JSONDecodeError, ValueError, TypeError) as e:
+        response_data: ServiceResult = {
+            "code": 400,
+            "message": f"请求格式错误: {e}",
+            "data": None
+        }
+        return JsonResponse(response_data, status=400)
 
 
 @csrf_exempt
@@ -238,6 +365,53 @@ def get_daily_meals_view(request):
         return JsonResponse(response_data, status=400)
 
 
+@csrf_exempt
+@api_view(['GET'])
+@authentication_classes([TokenAuthentication, SessionAuthentication])
+@permission_classes([IsAuthenticated])
+def get_meals_range_view(request):
+    """
+    获取日期区间内每天的餐次记录(用于周/月统计图表)
+
+    查询参数:
+        start: 开始日期(YYYY-MM-DD)
+        end: 结束日期(YYYY-MM-DD), 区间最多366天
+
+    返回示例:
+    {
+        "code": 200,
+        "message": "获取餐次记录成功",
+        "data": {
+            "start_date": "2025-10-01",
+            "end_date": "2025-10-07",
+            "recommended_protein": 87.5,
+            "recommended_carbs": 262.5,
+            "recommended_fat": 61.1,
+            "days": [
+                {
+                    "date": "2025-10-01",
+                    "meals": {"breakfast": {...}, "lunch": {...}, "dinner": {...}},
+                    "daily_total_calories": 1500,
+                    ...
+                }
+            ]
+        }
+    }
+    没有记录的日期同样返回, 餐次为空。响应按天流式输出。
+    """
+    error, start_date, end_date = parse_meal_range(
+        request.GET.get('start'),
+        request.GET.get('end')
+    )
+    if error:
+        return JsonResponse(error, status=400)
+
+    return StreamingHttpResponse(
+        iter_meals_in_range(request.user.id, start_date, end_date),
+        content_type='application/json; charset=utf-8'
+    )
+
+
 @csrf_exempt
 @api_view(['POST'])
 @authentication_classes([TokenAuthentication, SessionAuthentication])
@@ -426,7 +600,8 @@ def batch_add_foods_view(request):
                 "carbohydrates": 0,
                 "fat": 3.6
             }
-        ]
+        ],
+        "resolve_foods": true  # 可选,将名称或别名与食物库完全匹配的食物关联到食物库并在服务端重新计算营养,默认false
     }
 
     返回示例:
@@ -441,7 +616,10 @@ def batch_add_foods_view(request):
             "total_calories": 366,
             "total_protein": 37.3,
             "total_carbs": 43.3,
-            "total_fat": 4.2
+            "total_fat": 4.2,
+            "resolved_foods": [
+                {"name": "米饭", "food_id": 1, "matched_name": "米饭", "calories": 174.0}
+            ]
         }
     }
     """
@@ -456,6 +634,7 @@ def batch_add_foods_view(request):
         total_carbs = data.get('total_carbs')
         total_fat = data.get('total_fat')
         foods = data.get('foods')
+        resolve_foods = bool(data.get('resolve_foods', False))
 
         # 验证必需参数
         if not all([meal_type, meal_date, foods]):
@@ -501,7 +680,8 @@ def batch_add_foods_view(request):
             total_protein=float(total_protein),
             total_carbs=float(total_carbs),
             total_fat=float(total_fat),
-            foods=foods
+            foods=foods,
+            resolve_foods=resolve_foods
         )
 
         http_status = 200 if response_data['code'] == 200 else 400
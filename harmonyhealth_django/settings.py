@@ -32,6 +32,7 @@ INSTALLED_APPS = [
     'plan.apps.PlanConfig',
     'chat.apps.ChatConfig',
     'diet.apps.DietConfig',
+    'nutrition.apps.NutritionConfig',
 ]
 
 MIDDLEWARE = [
@@ -71,6 +72,78 @@ DATABASES = {
     }
 }
 
+# 缓存: 默认使用进程内缓存; 多进程/多实例部署时设置 REDIS_URL 改用 Redis 共享缓存
+# (使用 Redis 需额外安装 redis 包)
+REDIS_URL = os.environ.get('REDIS_URL')
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'harmonyhealth',
+        }
+    }
+
+# 使用进程内缓存时个人信息快照的有效期(秒); 进程内缓存无法跨 worker 失效, 这是其他 worker 读到旧信息的最长时间
+PROFILE_LOCAL_CACHE_TIMEOUT = int(os.environ.get('PROFILE_LOCAL_CACHE_TIMEOUT', 60))
+
+# 上传文件小于该大小(字节)时保存在内存中直接处理, 超过时才写入临时文件, 默认10MB
+FILE_UPLOAD_MAX_MEMORY_SIZE = int(os.environ.get('FILE_UPLOAD_MAX_MEMORY_SIZE', 10 * 1024 * 1024))
+
+# 调用视觉模型前的图片预处理: 最长边像素、输出格式(JPEG/WEBP)、编码质量
+NUTRITION_IMAGE_MAX_EDGE = int(os.environ.get('NUTRITION_IMAGE_MAX_EDGE', 1536))
+NUTRITION_IMAGE_FORMAT = os.environ.get('NUTRITION_IMAGE_FORMAT', 'JPEG')
+NUTRITION_IMAGE_QUALITY = int(os.environ.get('NUTRITION_IMAGE_QUALITY', 85))
+
+# 批量图片识别: 单次最多图片数、同时进行的识别数
+NUTRITION_BATCH_MAX_IMAGES = int(os.environ.get('NUTRITION_BATCH_MAX_IMAGES', 10))
+NUTRITION_BATCH_CONCURRENCY = int(os.environ.get('NUTRITION_BATCH_CONCURRENCY', 4))
+
+# 异步图片识别任务(mode=async): 最多执行次数、截止时间(秒)、结果保留时间(秒)、
+# 工作进程领取任务后的期限(秒, 超过后视为异常退出, 任务可被重新领取)、首次重试间隔(秒)
+NUTRITION_JOB_MAX_ATTEMPTS = int(os.environ.get('NUTRITION_JOB_MAX_ATTEMPTS', 3))
+NUTRITION_JOB_DEADLINE = int(os.environ.get('NUTRITION_JOB_DEADLINE', 300))
+NUTRITION_JOB_RESULT_TTL = int(os.environ.get('NUTRITION_JOB_RESULT_TTL', 60 * 60 * 24))
+# 领取期限默认按 LLM_TIMEOUT 和 LLM_MAX_RETRIES 推算(见 nutrition.jobs.min_lease), 设置得更短时不生效
+NUTRITION_JOB_LEASE = int(os.environ['NUTRITION_JOB_LEASE']) if os.environ.get('NUTRITION_JOB_LEASE') else None
+NUTRITION_JOB_RETRY_DELAY = int(os.environ.get('NUTRITION_JOB_RETRY_DELAY', 5))
+# 异步任务回调地址允许的主机(逗号分隔, 规则同 ALLOWED_HOSTS, 不接受 *), 未设置时不允许提交回调地址
+NUTRITION_CALLBACK_ALLOWED_HOSTS = [
+    host.strip() for host in os.environ.get('NUTRITION_CALLBACK_ALLOWED_HOSTS', '').split(',') if host.strip()
+]
+
+# 模型返回的营养结果按该比例以 DEBUG 级别记录日志(需将 NUTRITION_LOG_LEVEL 设为 DEBUG)
+NUTRITION_LOG_SAMPLE_RATE = float(os.environ.get('NUTRITION_LOG_SAMPLE_RATE', 0.01))
+
+# 食物图片识别结果缓存: 有效期(秒)、最大条数、近似图片允许的感知哈希汉明距离(0-3)
+IMAGE_ANALYSIS_CACHE_TTL = int(os.environ.get('IMAGE_ANALYSIS_CACHE_TTL', 60 * 60 * 24 * 30))
+IMAGE_ANALYSIS_CACHE_MAX_ENTRIES = int(os.environ.get('IMAGE_ANALYSIS_CACHE_MAX_ENTRIES', 10000))
+IMAGE_ANALYSIS_PHASH_DISTANCE = int(os.environ.get('IMAGE_ANALYSIS_PHASH_DISTANCE', 3))
+
+# 大模型调用: 每个进程(事件循环)的最大并发数、单次调用超时(秒)、失败重试次数
+LLM_MAX_CONCURRENCY = int(os.environ.get('LLM_MAX_CONCURRENCY', 100))
+LLM_TIMEOUT = float(os.environ.get('LLM_TIMEOUT', 60))
+LLM_MAX_RETRIES = int(os.environ.get('LLM_MAX_RETRIES', 2))
+# 使用 ASGI 部署时设为 True, 识别/计算/对话接口改用异步视图, 等待模型时不占用工作线程
+LLM_ASYNC_VIEWS = os.environ.get('LLM_ASYNC_VIEWS', 'False') == 'True'
+
+# AI 对话: 查看对话时默认返回的最近消息条数
+CHAT_HISTORY_WINDOW = int(os.environ.get('CHAT_HISTORY_WINDOW', 40))
+# AI 对话上下文: 原文保留的最近轮数、历史加系统提示的 token 预算,
+# 更早的轮次压缩为摘要, 未超预算时至少移出多少轮才重新生成摘要, 以及摘要的最大 token 数
+CHAT_KEEP_TURNS = int(os.environ.get('CHAT_KEEP_TURNS', 6))
+CHAT_CONTEXT_TOKENS = int(os.environ.get('CHAT_CONTEXT_TOKENS', 6000))
+CHAT_SUMMARY_BATCH = int(os.environ.get('CHAT_SUMMARY_BATCH', 2))
+CHAT_SUMMARY_MAX_TOKENS = int(os.environ.get('CHAT_SUMMARY_MAX_TOKENS', 400))
+# AI 对话: 并行执行只读工具(查询信息、计划)的线程数
+CHAT_TOOL_WORKERS = int(os.environ.get('CHAT_TOOL_WORKERS', 4))
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
@@ -107,4 +180,21 @@ REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.AllowAny',
     ],
-}
\ No newline at end of file
+}
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'nutrition': {
+            'handlers': ['console'],
+            'level': os.environ.get('NUTRITION_LOG_LEVEL', 'WARNING'),
+            'propagate': False,
+        },
+    },
+}
@@ -25,4 +25,5 @@ urlpatterns = [
     path('api/chat/', include('chat.urls')),
     path('api/diet/', include('diet.urls')),
     path('api/nutrition/', include('nutrition.urls')),
+    path('api/core/', include('core.urls')),
 ]
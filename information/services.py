@@ -1,12 +1,112 @@
 # information/services.py
 
+import hashlib
+import json
 from .models import Information
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import transaction
 from django.core.exceptions import ObjectDoesNotExist
 from typing import Dict, Any, List, Optional
 from core.types import ServiceResult
 
 ALLOWED_FIELDS = {'height', 'weight', 'age', 'target', 'information', 'gender', 'target_calories'}
 
+# 个人信息快照在缓存中的有效期(秒); 信息变更时由信号主动失效, 这里只是兜底
+PROFILE_CACHE_TIMEOUT = 60 * 60 * 24
+# 使用进程内缓存时的有效期(秒): 失效只对当前进程生效, 其他 worker 最多读到这么久之前的快照
+PROFILE_LOCAL_CACHE_TIMEOUT = 60
+
+# 三大营养素占每日热量的比例和每克热量(kcal)
+MACRO_RATIOS = {
+    'protein': (0.175, 4),        # 蛋白质 15-20%, 取中间值17.5%
+    'carbohydrates': (0.525, 4),  # 碳水化合物 50-55%, 取中间值52.5%
+    'fat': (0.275, 9),            # 脂肪 25-30%, 取中间值27.5%
+}
+
+
+def _profile_cache_key(user_id: int) -> str:
+    return f"information:profile:{user_id}"
+
+
+def _profile_cache_timeout() -> int:
+    if isinstance(caches['default'], LocMemCache):
+        return getattr(settings, 'PROFILE_LOCAL_CACHE_TIMEOUT', PROFILE_LOCAL_CACHE_TIMEOUT)
+    return PROFILE_CACHE_TIMEOUT
+
+
+def calculate_macros(daily_calories: float) -> Dict[str, float]:
+    """根据每日热量计算推荐的三大营养素克数"""
+    return {
+        name: round((daily_calories * ratio) / kcal_per_gram, 1)
+        for name, (ratio, kcal_per_gram) in MACRO_RATIOS.items()
+    }
+
+
+def _build_profile_snapshot(info_obj: Information) -> Dict[str, Any]:
+    """将个人信息及其计算值展开为可缓存的字典"""
+    daily_calories = info_obj.daily_calories
+    snapshot = {
+        # 基本信息
+        "height": info_obj.height,
+        "weight": info_obj.weight,
+        "age": info_obj.age,
+        "gender": info_obj.gender,
+        "gender_display": info_obj.get_gender_display(),
+        "target": info_obj.target,
+        "information": info_obj.Information,
+        "target_calories": info_obj.target_calories,
+        "username": info_obj.user.username,
+
+        # 计算属性
+        "bmi": info_obj.bmi,
+        "bmi_category": info_obj.bmi_category,
+        "bmr": info_obj.bmr,
+        "daily_calories": daily_calories,
+        "macros": calculate_macros(daily_calories),
+    }
+    # 按内容计算的版本号, 供依赖个人信息的其他缓存使用: 信息不变时各进程、各次重建得到的版本号相同
+    content = json.dumps(snapshot, sort_keys=True, ensure_ascii=False, default=str)
+    snapshot["version"] = hashlib.sha1(content.encode('utf-8')).hexdigest()
+    return snapshot
+
+
+def get_profile_snapshot(user_id: int) -> Optional[Dict[str, Any]]:
+    """
+    获取用户个人信息快照(基本信息 + BMI/BMR/每日热量/推荐营养素)
+
+    快照保存在 Django 缓存中, Information 保存或删除时由信号失效,
+    diet、information、chat 等服务都通过这里读取个人信息, 不再各自查询数据库。
+    进程内缓存(未配置 REDIS_URL)无法跨进程失效, 此时快照只保留 PROFILE_LOCAL_CACHE_TIMEOUT 秒。
+
+    Returns:
+        快照字典, 用户信息记录不存在时返回None
+    """
+    cache_key = _profile_cache_key(user_id)
+    snapshot = cache.get(cache_key)
+    if snapshot is not None:
+        return snapshot
+
+    try:
+        info_obj = Information.objects.select_related('user').get(user_id=user_id)
+    except Information.DoesNotExist:
+        return None
+
+    snapshot = _build_profile_snapshot(info_obj)
+    cache.set(cache_key, snapshot, _profile_cache_timeout())
+    return snapshot
+
+
+def invalidate_profile_snapshot(user_id: int):
+    """
+    删除用户的个人信息快照, 下一次读取时重新计算
+
+    在事务提交后才删除: 提交前删除的话, 并发的读取可能把尚未提交时的旧数据重新写入缓存。
+    """
+    cache_key = _profile_cache_key(user_id)
+    transaction.on_commit(lambda: cache.delete(cache_key))
+
 
 # --- 核心修正点 ---
 # 修改了函数签名，让它能接收任意关键字参数
@@ -56,8 +156,10 @@ def get_user_info(user_id: int, attributes: Optional[List[str]] = None) -> Servi
     如果 attributes 未提供，则返回所有信息。
     """
     try:
-        info_obj = Information.objects.get(user_id=user_id)
-        
+        snapshot = get_profile_snapshot(user_id)
+        if snapshot is None:
+            raise ObjectDoesNotExist
+
         if not attributes:
             attributes_to_fetch = list(ALLOWED_FIELDS)
         else:
@@ -66,7 +168,7 @@ def get_user_info(user_id: int, attributes: Optional[List[str]] = None) -> Servi
         results_data = {}
         for field in attributes_to_fetch:
             if field in ALLOWED_FIELDS:
-                results_data[field] = getattr(info_obj, field, None)
+                results_data[field] = snapshot.get(field)
         
         if not results_data:
             return {"code": 400, "message": "请求查询的字段均不被支持。", "data": None}
@@ -85,18 +187,12 @@ def get_health_metrics(user_id: int) -> ServiceResult:
     获取用户的健康指标，包括BMI、BMR和每日推荐热量
     """
     try:
-        info_obj = Information.objects.get(user_id=user_id)
+        snapshot = get_profile_snapshot(user_id)
+        if snapshot is None:
+            raise ObjectDoesNotExist
 
-        metrics_data = {
-            'bmi': info_obj.bmi,
-            'bmi_category': info_obj.bmi_category,
-            'bmr': info_obj.bmr,
-            'daily_calories': info_obj.daily_calories,
-            'height': info_obj.height,
-            'weight': info_obj.weight,
-            'age': info_obj.age,
-            'gender': info_obj.gender,
-        }
+        metrics_fields = ['bmi', 'bmi_category', 'bmr', 'daily_calories', 'height', 'weight', 'age', 'gender']
+        metrics_data = {field: snapshot[field] for field in metrics_fields}
 
         return {"code": 200, "message": "健康指标获取成功", "data": metrics_data}
 
@@ -119,29 +215,20 @@ def get_all_user_info(user_id: int, days: int = 7) -> ServiceResult:
         包含所有用户信息和饮食建议的ServiceResult
     """
     try:
-        info_obj = Information.objects.get(user_id=user_id)
+        snapshot = get_profile_snapshot(user_id)
+        if snapshot is None:
+            raise ObjectDoesNotExist
 
         # 构建完整的用户信息数据
-        user_info_data = {
+        user_info_fields = [
             # 基本信息
-            "height": info_obj.height,
-            "weight": info_obj.weight,
-            "age": info_obj.age,
-            "gender": info_obj.gender,
-            "gender_display": info_obj.get_gender_display(),  # 中文显示
-            "target": info_obj.target,
-            "information": info_obj.Information,
-            "target_calories": info_obj.target_calories,
-
+            "height", "weight", "age", "gender", "gender_display", "target", "information", "target_calories",
             # 计算属性
-            "bmi": info_obj.bmi,
-            "bmi_category": info_obj.bmi_category,
-            "bmr": info_obj.bmr,
-            "daily_calories": info_obj.daily_calories,
-
+            "bmi", "bmi_category", "bmr", "daily_calories",
             # 用户名
-            "username": info_obj.user.username,
-        }
+            "username",
+        ]
+        user_info_data = {field: snapshot[field] for field in user_info_fields}
 
         # 获取饮食建议
         from diet.services import get_diet_suggestion
@@ -0,0 +1,22 @@
+# information/signals.py
+
+from django.conf import settings
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from .models import Information
+from .services import invalidate_profile_snapshot
+
+
+@receiver(post_save, sender=Information)
+@receiver(post_delete, sender=Information)
+def information_changed(sender, instance, **kwargs):
+    """个人信息变更后失效缓存的快照(在事务提交后删除)"""
+    invalidate_profile_snapshot(instance.user_id)
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def user_saved(sender, instance, created, **kwargs):
+    """快照中包含用户名, 用户信息修改后同样需要失效"""
+    if not created:
+        invalidate_profile_snapshot(instance.pk)
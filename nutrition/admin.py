@@ -0,0 +1,19 @@
+# nutrition/admin.py
+
+from django.contrib import admin
+from .models import AnalysisJob, ImageAnalysisCache
+
+
+@admin.register(ImageAnalysisCache)
+class ImageAnalysisCacheAdmin(admin.ModelAdmin):
+    list_display = ['sha256', 'phash', 'hit_count', 'created_at', 'last_accessed_at']
+    search_fields = ['sha256', 'phash']
+    readonly_fields = ['created_at', 'last_accessed_at']
+
+
+@admin.register(AnalysisJob)
+class AnalysisJobAdmin(admin.ModelAdmin):
+    list_display = ['id', 'status', 'attempts', 'created_at', 'finished_at', 'callback_status']
+    list_filter = ['status']
+    exclude = ['image']
+    readonly_fields = ['created_at', 'started_at', 'finished_at']
@@ -0,0 +1,7 @@
+from django.apps import AppConfig
+
+
+class NutritionConfig(AppConfig):
+    default_auto_field = 'django.db.models.BigAutoField'
+    name = 'nutrition'
+    verbose_name = '营养分析'
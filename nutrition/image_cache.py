@@ -0,0 +1,158 @@
+# nutrition/image_cache.py
+
+"""
+食物图片识别结果的内容寻址缓存
+
+- 精确匹配: 图片字节的 SHA-256 相同
+- 近似匹配: 图片的 dHash 感知哈希汉明距离不超过阈值(需要安装 Pillow, 未安装时只做精确匹配)
+
+缓存条目超过有效期后不再命中; 总条数超过上限时按最近访问时间淘汰最久未使用的条目。
+"""
+
+import hashlib
+from datetime import timedelta
+from io import BytesIO
+from typing import Any, Dict, Optional, Tuple
+
+from django.conf import settings
+from django.db import DatabaseError, IntegrityError
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import ImageAnalysisCache
+
+try:
+    from PIL import Image
+except ImportError:  # Pillow 为可选依赖
+    Image = None
+
+# dHash 的边长, 得到 8x8=64 位哈希
+DHASH_SIZE = 8
+PHASH_BANDS = 4
+
+
+def _ttl() -> timedelta:
+    return timedelta(seconds=getattr(settings, 'IMAGE_ANALYSIS_CACHE_TTL', 60 * 60 * 24 * 30))
+
+
+def _max_entries() -> int:
+    return getattr(settings, 'IMAGE_ANALYSIS_CACHE_MAX_ENTRIES', 10000)
+
+
+def _max_distance() -> int:
+    # 分段索引只能保证找到汉明距离小于分段数的候选
+    return min(getattr(settings, 'IMAGE_ANALYSIS_PHASH_DISTANCE', 3), PHASH_BANDS - 1)
+
+
+def content_hash(image_bytes: bytes) -> str:
+    return hashlib.sha256(image_bytes).hexdigest()
+
+
+def perceptual_hash(image_bytes: bytes) -> str:
+    """
+    计算图片的 dHash(差异哈希), 返回16位十六进制字符串
+
+    缩放为 9x8 灰度图后比较每行相邻像素的明暗, 对重新压缩、缩放、轻微调色不敏感。
+    未安装 Pillow 或图片无法解析时返回空字符串。
+    """
+    if Image is None:
+        return ""
+    try:
+        with Image.open(BytesIO(image_bytes)) as image:
+            pixels = list(image.convert('L').resize((DHASH_SIZE + 1, DHASH_SIZE)).getdata())
+    except Exception:
+        return ""
+
+    value = 0
+    for row in range(DHASH_SIZE):
+        offset = row * (DHASH_SIZE + 1)
+        for col in range(DHASH_SIZE):
+            value = (value << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return f"{value:016x}"
+
+
+def _bands(phash: str) -> Dict[str, str]:
+    width = len(phash) // PHASH_BANDS
+    return {f'phash_{i}': phash[i * width:(i + 1) * width] for i in range(PHASH_BANDS)}
+
+
+def _hamming(a: str, b: str) -> int:
+    return bin(int(a, 16) ^ int(b, 16)).count('1')
+
+
+def _touch(entry_id: int):
+    try:
+        ImageAnalysisCache.objects.filter(pk=entry_id).update(
+            last_accessed_at=timezone.now(),
+            hit_count=F('hit_count') + 1
+        )
+    except DatabaseError as e:
+        # 访问时间只影响淘汰顺序, 更新失败(如 SQLite 写锁冲突)不影响命中
+        print(f"更新图片识别缓存访问时间失败：{e}")
+
+
+def lookup(sha256: str, phash: str) -> Tuple[Optional[Dict[str, Any]], str]:
+    """
+    查找缓存的识别结果
+
+    Returns:
+        (识别结果, 命中类型), 命中类型为 hit(精确)、near(近似) 或 miss
+    """
+    fresh = ImageAnalysisCache.objects.filter(created_at__gte=timezone.now() - _ttl())
+
+    entry = fresh.filter(sha256=sha256).values('id', 'result').first()
+    if entry:
+        _touch(entry['id'])
+        return entry['result'], 'hit'
+
+    if phash:
+        band_filter = Q()
+        for field, value in _bands(phash).items():
+            band_filter |= Q(**{field: value})
+        candidates = fresh.filter(band_filter).exclude(phash='').values('id', 'phash', 'result')
+
+        best, best_distance = None, _max_distance() + 1
+        for candidate in candidates:
+            distance = _hamming(phash, candidate['phash'])
+            if distance < best_distance:
+                best, best_distance = candidate, distance
+        if best:
+            _touch(best['id'])
+            return best['result'], 'near'
+
+    return None, 'miss'
+
+
+def store(sha256: str, phash: str, result: Dict[str, Any]):
+    """保存识别结果, 并清理过期和超出容量的条目"""
+    try:
+        ImageAnalysisCache.objects.update_or_create(
+            sha256=sha256,
+            defaults={'phash': phash, 'result': result, 'created_at': timezone.now(),
+                      'last_accessed_at': timezone.now(), **_bands(phash)},
+        )
+    except IntegrityError:
+        # 并发请求已经写入了同一张图片
+        return
+    except DatabaseError as e:
+        # 缓存写入失败不影响本次识别结果
+        print(f"保存图片识别缓存失败：{e}")
+        return
+    try:
+        evict()
+    except DatabaseError as e:
+        print(f"清理图片识别缓存失败：{e}")
+
+
+def evict() -> int:
+    """删除过期条目, 并按最近访问时间淘汰超出容量上限的条目, 返回删除的数量"""
+    deleted, _ = ImageAnalysisCache.objects.filter(created_at__lt=timezone.now() - _ttl()).delete()
+
+    overflow = ImageAnalysisCache.objects.count() - _max_entries()
+    if overflow > 0:
+        stale_ids = list(
+            ImageAnalysisCache.objects.order_by('last_accessed_at').values_list('id', flat=True)[:overflow]
+        )
+        evicted, _ = ImageAnalysisCache.objects.filter(id__in=stale_ids).delete()
+        deleted += evicted
+    return deleted
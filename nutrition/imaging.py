@@ -0,0 +1,107 @@
+# nutrition/imaging.py
+
+"""
+调用视觉模型前的图片预处理
+
+手机拍摄的原图通常有 4-12MB, 直接以 data URL 发送会增加上传时间、token 消耗和延迟。
+这里先解码图片, 按配置的最长边缩小, 去掉 EXIF 等元数据(按 EXIF 方向摆正后再丢弃),
+再以目标质量重新编码为 JPEG 或 WebP。
+
+需要安装 Pillow; 未安装或图片无法解析时返回 None, 调用方应直接使用原图。
+"""
+
+import time
+from io import BytesIO
+from typing import NamedTuple, Optional
+
+from django.conf import settings
+
+from core import metrics
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # Pillow 为可选依赖
+    Image = ImageOps = None
+
+# 输出格式 -> data URL 使用的 MIME 类型
+OUTPUT_MIME_TYPES = {'JPEG': 'image/jpeg', 'WEBP': 'image/webp'}
+
+
+class PreparedImage(NamedTuple):
+    data: bytes
+    mime_type: str
+
+
+def _max_edge() -> int:
+    return getattr(settings, 'NUTRITION_IMAGE_MAX_EDGE', 1536)
+
+
+def _output_format() -> str:
+    image_format = str(getattr(settings, 'NUTRITION_IMAGE_FORMAT', 'JPEG')).upper()
+    return image_format if image_format in OUTPUT_MIME_TYPES else 'JPEG'
+
+
+def _quality() -> int:
+    return getattr(settings, 'NUTRITION_IMAGE_QUALITY', 85)
+
+
+def preprocess_image(image_bytes, max_edge: int = None, image_format: str = None,
+                     quality: int = None) -> Optional[PreparedImage]:
+    """
+    缩小并重新编码图片
+
+    Args:
+        image_bytes: 原始图片内容(bytes / memoryview)
+        max_edge: 最长边像素, 默认取 settings.NUTRITION_IMAGE_MAX_EDGE
+        image_format: JPEG 或 WEBP, 默认取 settings.NUTRITION_IMAGE_FORMAT
+        quality: 编码质量(1-100), 默认取 settings.NUTRITION_IMAGE_QUALITY
+
+    Returns:
+        处理后的图片; 无法处理, 或原图已经足够小且不含元数据时返回 None
+    """
+    if Image is None:
+        return None
+
+    max_edge = max_edge or _max_edge()
+    image_format = (image_format or _output_format()).upper()
+    quality = quality or _quality()
+
+    started = time.perf_counter()
+    try:
+        with Image.open(BytesIO(image_bytes)) as image:
+            has_metadata = bool(image.info.get('exif') or image.info.get('icc_profile') or image.getexif())
+            needs_resize = max(image.size) > max_edge
+
+            # JPEG 可以在解码时直接按 1/2、1/4、1/8 缩小, 大图解码速度快得多
+            if needs_resize and image.format == 'JPEG':
+                image.draft('RGB', (max_edge, max_edge))
+
+            image = ImageOps.exif_transpose(image)
+            if image.mode not in ('RGB', 'L'):
+                # 透明背景铺白色, 避免转换为 RGB 后变黑
+                background = Image.new('RGB', image.size, (255, 255, 255))
+                rgba = image.convert('RGBA')
+                background.paste(rgba, mask=rgba.getchannel('A'))
+                image = background
+            if max(image.size) > max_edge:
+                image.thumbnail((max_edge, max_edge), Image.Resampling.LANCZOS)
+
+            output = BytesIO()
+            # 不传 exif/icc_profile, 重新编码后即不含原图元数据
+            image.save(output, format=image_format, quality=quality, optimize=image_format == 'JPEG')
+    except Exception as e:
+        print(f"图片预处理失败, 使用原图：{e}")
+        return None
+
+    data = output.getvalue()
+    elapsed = time.perf_counter() - started
+    metrics.observe('nutrition.preprocess.latency', elapsed)
+
+    # 重新编码反而更大且原图不含元数据时(如已经压缩过的小图), 保留原图
+    if len(data) >= len(image_bytes) and not needs_resize and not has_metadata:
+        metrics.incr('nutrition.preprocess.skipped')
+        return None
+
+    metrics.incr('nutrition.preprocess.bytes_in', len(image_bytes))
+    metrics.incr('nutrition.preprocess.bytes_out', len(data))
+    return PreparedImage(data, OUTPUT_MIME_TYPES[image_format])
@@ -0,0 +1,234 @@
+# nutrition/jobs.py
+
+"""
+基于数据库的异步图片识别任务
+
+- 识别接口以 mode=async 提交时调用 create_job 保存图片, 立即返回任务ID
+- run_analysis_worker 命令启动的工作线程通过 claim_job 原子地领取任务并执行 run_job
+- 识别失败(模型调用出错)时按指数退避重新排队, 超过最多执行次数或截止时间后记为失败
+- 完成后清空图片内容, 结果保留 NUTRITION_JOB_RESULT_TTL 秒, 过期后由 purge_expired 删除
+- 提交时提供了回调地址的任务, 完成后向该地址 POST 任务状态(与轮询接口返回的格式相同);
+  回调地址的主机必须在 NUTRITION_CALLBACK_ALLOWED_HOSTS 中, 避免服务端被用来请求内网地址
+
+执行中的任务带有领取期限, 工作进程异常退出后, 期限过后任务会被重新领取。
+"""
+
+from datetime import timedelta
+from typing import Any, Dict, Optional
+from urllib.parse import urlsplit
+
+import httpx
+from django.conf import settings
+from django.db.models import F, Q
+from django.http.request import validate_host
+from django.utils import timezone
+
+from .models import AnalysisJob
+from .services import FoodAnalysisService
+
+CALLBACK_ATTEMPTS = 3
+# 模型调用重试之间退避等待的上限(秒, 与 openai SDK 相同)
+LLM_BACKOFF_MAX = 8.0
+# 模型调用之外(读取图片、预处理、保存结果)预留的时间(秒)
+LEASE_MARGIN = 30.0
+
+
+def _max_attempts() -> int:
+    return getattr(settings, 'NUTRITION_JOB_MAX_ATTEMPTS', 3)
+
+
+def _deadline() -> timedelta:
+    return timedelta(seconds=getattr(settings, 'NUTRITION_JOB_DEADLINE', 300))
+
+
+def _result_ttl() -> timedelta:
+    return timedelta(seconds=getattr(settings, 'NUTRITION_JOB_RESULT_TTL', 60 * 60 * 24))
+
+
+def min_lease() -> float:
+    """
+    执行一次任务可能的最长时间(秒)
+
+    模型调用每次都超时并用尽重试(LLM_TIMEOUT × (LLM_MAX_RETRIES + 1)), 加上重试之间的退避等待
+    和图片预处理等其他耗时。领取期限短于它时, 执行中的任务可能被其他工作进程重复领取。
+    """
+    retries = getattr(settings, 'LLM_MAX_RETRIES', 2)
+    return getattr(settings, 'LLM_TIMEOUT', 60.0) * (retries + 1) + LLM_BACKOFF_MAX * retries + LEASE_MARGIN
+
+
+def _lease() -> timedelta:
+    # 未配置 NUTRITION_JOB_LEASE 或配置得过短时使用 min_lease()
+    return timedelta(seconds=max(getattr(settings, 'NUTRITION_JOB_LEASE', None) or 0, min_lease()))
+
+
+def _retry_delay(attempts: int) -> timedelta:
+    return timedelta(seconds=min(60, getattr(settings, 'NUTRITION_JOB_RETRY_DELAY', 5) * 2 ** (attempts - 1)))
+
+
+def callback_allowed(url: str) -> bool:
+    """
+    回调地址的主机是否在 NUTRITION_CALLBACK_ALLOWED_HOSTS 中
+
+    规则同 ALLOWED_HOSTS(".example.com" 匹配其所有子域名), 但不接受 "*"; 未配置时不允许任何回调。
+    """
+    allowed_hosts = [host for host in getattr(settings, 'NUTRITION_CALLBACK_ALLOWED_HOSTS', []) if host != '*']
+    try:
+        parts = urlsplit(url)
+    except ValueError:
+        return False
+    return parts.scheme in ('http', 'https') and bool(parts.hostname) and validate_host(parts.hostname, allowed_hosts)
+
+
+def create_job(user, image_bytes, mime_type: str = "image/jpeg", callback_url: str = "") -> AnalysisJob:
+    """保存图片并创建等待执行的识别任务, 任务属于提交它的用户"""
+    now = timezone.now()
+    return AnalysisJob.objects.create(
+        user=user,
+        image=bytes(image_bytes),
+        mime_type=mime_type,
+        callback_url=callback_url or "",
+        max_attempts=_max_attempts(),
+        next_attempt_at=now,
+        deadline=now + _deadline(),
+    )
+
+
+def get_job(user_id: int, job_id) -> Optional[AnalysisJob]:
+    """查询用户自己提交的任务, 不存在、属于其他用户或结果已过期时返回 None"""
+    return AnalysisJob.objects.defer('image').filter(
+        Q(expires_at__isnull=True) | Q(expires_at__gt=timezone.now()),
+        pk=job_id,
+        user_id=user_id,
+    ).first()
+
+
+def serialize_job(job: AnalysisJob) -> Dict[str, Any]:
+    data = {
+        "job_id": str(job.id),
+        "status": job.status,
+        "attempts": job.attempts,
+        "created_at": job.created_at.isoformat(),
+        "finished_at": job.finished_at.isoformat() if job.finished_at else None,
+    }
+    if job.status == AnalysisJob.STATUS_SUCCEEDED:
+        data["result"] = job.result
+    elif job.status == AnalysisJob.STATUS_FAILED:
+        data["error"] = job.error
+    return data
+
+
+def _claimable(now) -> Q:
+    # 到达执行时间的等待任务, 或领取期限已过(工作进程异常退出)的执行中任务
+    return (Q(status=AnalysisJob.STATUS_PENDING, next_attempt_at__lte=now)
+            | Q(status=AnalysisJob.STATUS_RUNNING, lease_expires_at__lt=now))
+
+
+def claim_job() -> Optional[AnalysisJob]:
+    """
+    领取一个可执行的任务
+
+    先读出候选任务, 再用带相同条件的 UPDATE 逐个尝试领取, 只有更新成功(影响1行)的
+    工作线程拿到任务, 多个工作进程同时领取也不会重复执行。
+    """
+    now = timezone.now()
+    candidates = list(
+        AnalysisJob.objects.filter(_claimable(now)).order_by('next_attempt_at').values_list('id', flat=True)[:10]
+    )
+    for job_id in candidates:
+        claimed = AnalysisJob.objects.filter(_claimable(now), pk=job_id).update(
+            status=AnalysisJob.STATUS_RUNNING,
+            attempts=F('attempts') + 1,
+            started_at=now,
+            lease_expires_at=now + _lease(),
+        )
+        if claimed:
+            return AnalysisJob.objects.get(pk=job_id)
+    return None
+
+
+def _finish(job: AnalysisJob, status: str, result: Dict[str, Any] = None, error: str = "") -> bool:
+    """
+    记录任务的最终状态并清空图片
+
+    只有仍持有该任务(执行次数未变)时才更新, 返回是否更新成功
+    """
+    now = timezone.now()
+    updated = AnalysisJob.objects.filter(pk=job.pk, attempts=job.attempts).update(
+        status=status,
+        result=result,
+        error=error,
+        image=b"",
+        lease_expires_at=None,
+        finished_at=now,
+        expires_at=now + _result_ttl(),
+    )
+    if updated:
+        job.status, job.result, job.error, job.finished_at = status, result, error, now
+    return bool(updated)
+
+
+def run_job(job: AnalysisJob, service: FoodAnalysisService = None) -> str:
+    """执行已领取的任务, 返回执行后的状态"""
+    if job.attempts > job.max_attempts:
+        # 多次在执行中丢失(工作进程异常退出), 不再重试
+        finished = _finish(job, AnalysisJob.STATUS_FAILED, error="任务执行次数超过上限")
+    elif timezone.now() >= job.deadline:
+        finished = _finish(job, AnalysisJob.STATUS_FAILED, error="任务超过截止时间")
+    else:
+        service = service or FoodAnalysisService()
+        try:
+            result = service.analyze_image(bytes(job.image), mime_type=job.mime_type)
+        except Exception as e:
+            result = {"error": f"图片识别失败：{str(e)}"}
+
+        if result.get("success"):
+            finished = _finish(job, AnalysisJob.STATUS_SUCCEEDED, result=result)
+        else:
+            error = result.get("error", "识别失败")
+            retry_at = timezone.now() + _retry_delay(job.attempts)
+            if job.attempts < job.max_attempts and retry_at < job.deadline:
+                AnalysisJob.objects.filter(pk=job.pk, attempts=job.attempts).update(
+                    status=AnalysisJob.STATUS_PENDING,
+                    error=error,
+                    next_attempt_at=retry_at,
+                    lease_expires_at=None,
+                )
+                return AnalysisJob.STATUS_PENDING
+            finished = _finish(job, AnalysisJob.STATUS_FAILED, error=error)
+
+    if finished and job.callback_url:
+        send_callback(job)
+    return job.status
+
+
+def send_callback(job: AnalysisJob):
+    """
+    向回调地址 POST 任务状态, 失败时重试, 结果记录在 callback_status 中
+
+    发送前重新检查允许的主机(配置可能在任务提交后变更), 不跟随重定向。
+    """
+    if not callback_allowed(job.callback_url):
+        AnalysisJob.objects.filter(pk=job.pk).update(callback_status="回调地址不在允许的主机列表中")
+        return
+
+    status = ""
+    for _ in range(CALLBACK_ATTEMPTS):
+        try:
+            response = httpx.post(
+                job.callback_url,
+                json=serialize_job(job),
+                timeout=getattr(settings, 'NUTRITION_JOB_CALLBACK_TIMEOUT', 10),
+                follow_redirects=False,
+            )
+            status = str(response.status_code)
+            if response.is_success:
+                break
+        except httpx.HTTPError as e:
+            status = f"{type(e).__name__}: {e}"[:100]
+    AnalysisJob.objects.filter(pk=job.pk).update(callback_status=status)
+
+
+def purge_expired() -> int:
+    """删除结果已过期的任务, 返回删除的数量"""
+    deleted, _ = AnalysisJob.objects.filter(expires_at__lt=timezone.now()).delete()
+    return deleted
@@ -0,0 +1,92 @@
+# nutrition/management/commands/benchmark_image_preprocessing.py
+
+import statistics
+import time
+from io import BytesIO
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+from openai import OpenAI
+
+from core.llm_stub import StubLLMServer
+from nutrition.imaging import Image
+from nutrition.services import FoodAnalysisService
+
+
+class Command(BaseCommand):
+    help = '对比图片预处理前后调用视觉模型的端到端耗时(使用本地桩服务, 不访问远程API)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('paths', nargs='*', help='样例图片路径, 不提供时生成模拟手机照片')
+        parser.add_argument('--generate', type=int, default=3, help='未提供图片时生成的模拟照片数量, 默认3')
+        parser.add_argument('--repeat', type=int, default=3, help='每张图片重复测试的次数, 默认3')
+        parser.add_argument('--latency', type=float, default=0.5, help='桩服务模拟的模型耗时(秒), 默认0.5')
+        parser.add_argument('--bandwidth-mbps', type=float, default=20.0, help='桩服务模拟的上行带宽(Mbit/s), 默认20')
+
+    def handle(self, *args, **options):
+        if Image is None:
+            raise CommandError('图片预处理需要安装 Pillow')
+
+        samples = self._load_samples(options['paths'], options['generate'])
+        repeat = max(1, options['repeat'])
+
+        with StubLLMServer(latency=options['latency'], bandwidth_mbps=options['bandwidth_mbps']) as server:
+            service = FoodAnalysisService(llm_client=OpenAI(base_url=server.base_url, api_key='stub', max_retries=0))
+
+            baseline_total = optimized_total = 0.0
+            for name, image_bytes in samples:
+                baseline = self._measure(service, image_bytes, preprocess=False, repeat=repeat)
+                optimized = self._measure(service, image_bytes, preprocess=True, repeat=repeat)
+                baseline_total += baseline['latency']
+                optimized_total += optimized['latency']
+
+                self.stdout.write(
+                    f"{name}: {len(image_bytes) / 1024:.0f}KB -> {optimized['size'] / 1024:.0f}KB, "
+                    f"原图 {baseline['latency'] * 1000:.0f}ms, 预处理后 {optimized['latency'] * 1000:.0f}ms "
+                    f"(其中预处理 {optimized['prepare'] * 1000:.0f}ms)"
+                )
+
+        saved = baseline_total - optimized_total
+        percent = saved / baseline_total * 100 if baseline_total else 0
+        self.stdout.write(self.style.SUCCESS(
+            f"共 {len(samples)} 张图片, 平均每张节省 {saved / len(samples) * 1000:.0f}ms ({percent:.1f}%)"
+        ))
+
+    def _load_samples(self, paths, count):
+        if paths:
+            samples = []
+            for path in paths:
+                try:
+                    samples.append((Path(path).name, Path(path).read_bytes()))
+                except OSError as e:
+                    raise CommandError(f'无法读取图片 {path}: {e}')
+            return samples
+
+        # 生成带噪点的 4032x3024 照片, 体积接近手机原图
+        samples = []
+        for index in range(max(1, count)):
+            noise = Image.effect_noise((4032, 3024), 40 + index * 10)
+            image = Image.merge('RGB', (noise, noise.rotate(180), noise.transpose(Image.Transpose.FLIP_LEFT_RIGHT)))
+            output = BytesIO()
+            image.save(output, format='JPEG', quality=95)
+            samples.append((f'generated-{index + 1}.jpg', output.getvalue()))
+        return samples
+
+    def _measure(self, service, image_bytes, preprocess, repeat):
+        latencies, prepare_times = [], []
+        size = len(image_bytes)
+        for _ in range(repeat):
+            started = time.perf_counter()
+            image_base64, mime_type = service._prepare_image(image_bytes, preprocess=preprocess)
+            prepared = time.perf_counter()
+            result = service._analyze(image_base64, mime_type)
+            if not result.get('success'):
+                raise CommandError(f"桩服务调用失败: {result.get('error')}")
+            latencies.append(time.perf_counter() - started)
+            prepare_times.append(prepared - started)
+            size = len(image_base64) * 3 // 4
+        return {
+            'latency': statistics.median(latencies),
+            'prepare': statistics.median(prepare_times),
+            'size': size,
+        }
@@ -0,0 +1,80 @@
+# nutrition/management/commands/run_analysis_worker.py
+
+import signal
+import threading
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from nutrition.jobs import claim_job, min_lease, purge_expired, run_job
+
+# 清理过期任务的间隔(秒)
+PURGE_INTERVAL = 600
+
+
+class Command(BaseCommand):
+    help = '执行异步图片识别任务的工作进程(从数据库领取任务, 可同时运行多个进程)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=4, help='同时执行的任务数(工作线程数), 默认4')
+        parser.add_argument('--poll-interval', type=float, default=1.0, help='没有任务时的轮询间隔(秒), 默认1')
+        parser.add_argument('--once', action='store_true', help='执行完当前所有可执行的任务后退出')
+
+    def handle(self, *args, **options):
+        self.stopping = threading.Event()
+        self.once = options['once']
+        self.poll_interval = options['poll_interval']
+
+        if threading.current_thread() is threading.main_thread():
+            signal.signal(signal.SIGTERM, lambda *_: self.stopping.set())
+
+        configured_lease = getattr(settings, 'NUTRITION_JOB_LEASE', None)
+        if configured_lease and configured_lease < min_lease():
+            self.stderr.write(
+                f'NUTRITION_JOB_LEASE={configured_lease} 短于一次任务可能的最长执行时间, '
+                f'改用 {min_lease():.0f} 秒(LLM_TIMEOUT × (LLM_MAX_RETRIES + 1) 加重试退避和余量)'
+            )
+
+        purged = purge_expired()
+        if purged:
+            self.stdout.write(f'已清理{purged}个过期任务')
+
+        workers = [
+            threading.Thread(target=self._work, name=f'analysis-worker-{index}', daemon=True)
+            for index in range(max(1, options['concurrency']))
+        ]
+        for worker in workers:
+            worker.start()
+        self.stdout.write(f'图片识别工作进程已启动, 工作线程{len(workers)}个')
+
+        last_purge = time.monotonic()
+        try:
+            while any(worker.is_alive() for worker in workers):
+                if time.monotonic() - last_purge > PURGE_INTERVAL:
+                    purge_expired()
+                    last_purge = time.monotonic()
+                for worker in workers:
+                    worker.join(timeout=1)
+        except KeyboardInterrupt:
+            self.stopping.set()
+        # 等待正在执行的任务完成
+        for worker in workers:
+            worker.join()
+        self.stdout.write('图片识别工作进程已退出')
+
+    def _work(self):
+        try:
+            while not self.stopping.is_set():
+                job = claim_job()
+                if job is None:
+                    if self.once:
+                        return
+                    self.stopping.wait(self.poll_interval)
+                    continue
+
+                status = run_job(job)
+                self.stdout.write(f'任务 {job.id} 第{job.attempts}次执行: {status}')
+        finally:
+            connection.close()
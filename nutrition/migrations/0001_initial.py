@@ -0,0 +1,34 @@
+# Generated by Django 5.1.7 on 2026-10-17 23:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImageAnalysisCache',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sha256', models.CharField(max_length=64, unique=True, verbose_name='内容哈希')),
+                ('phash', models.CharField(blank=True, max_length=16, verbose_name='感知哈希')),
+                ('phash_0', models.CharField(blank=True, db_index=True, max_length=4)),
+                ('phash_1', models.CharField(blank=True, db_index=True, max_length=4)),
+                ('phash_2', models.CharField(blank=True, db_index=True, max_length=4)),
+                ('phash_3', models.CharField(blank=True, db_index=True, max_length=4)),
+                ('result', models.JSONField(verbose_name='识别结果')),
+                ('hit_count', models.PositiveIntegerField(default=0, verbose_name='命中次数')),
+                ('created_at', models.DateTimeField(auto_now_add=True, db_index=True, verbose_name='创建时间')),
+                ('last_accessed_at', models.DateTimeField(auto_now_add=True, db_index=True, verbose_name='最近访问时间')),
+            ],
+            options={
+                'verbose_name': '图片识别缓存',
+                'verbose_name_plural': '图片识别缓存',
+            },
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 5.1.7 on 2026-10-17 23:19
+
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('nutrition', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AnalysisJob',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('status', models.CharField(choices=[('pending', '等待中'), ('running', '执行中'), ('succeeded', '成功'), ('failed', '失败')], default='pending', max_length=10, verbose_name='状态')),
+                ('image', models.BinaryField(verbose_name='图片内容')),
+                ('mime_type', models.CharField(default='image/jpeg', max_length=20, verbose_name='图片类型')),
+                ('callback_url', models.URLField(blank=True, max_length=500, verbose_name='回调地址')),
+                ('attempts', models.PositiveSmallIntegerField(default=0, verbose_name='已执行次数')),
+                ('max_attempts', models.PositiveSmallIntegerField(default=3, verbose_name='最多执行次数')),
+                ('next_attempt_at', models.DateTimeField(verbose_name='可执行时间')),
+                ('deadline', models.DateTimeField(verbose_name='截止时间')),
+                ('lease_expires_at', models.DateTimeField(blank=True, null=True, verbose_name='领取到期时间')),
+                ('result', models.JSONField(blank=True, null=True, verbose_name='识别结果')),
+                ('error', models.TextField(blank=True, verbose_name='错误信息')),
+                ('callback_status', models.CharField(blank=True, max_length=100, verbose_name='回调结果')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='创建时间')),
+                ('started_at', models.DateTimeField(blank=True, null=True, verbose_name='开始时间')),
+                ('finished_at', models.DateTimeField(blank=True, null=True, verbose_name='完成时间')),
+                ('expires_at', models.DateTimeField(blank=True, db_index=True, null=True, verbose_name='结果过期时间')),
+            ],
+            options={
+                'verbose_name': '图片识别任务',
+                'verbose_name_plural': '图片识别任务',
+                'indexes': [models.Index(fields=['status', 'next_attempt_at'], name='analysisjob_claim_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,94 @@
+# nutrition/models.py
+
+import uuid
+
+from django.conf import settings
+from django.db import models
+
+
+class ImageAnalysisCache(models.Model):
+    """
+    食物图片识别结果缓存
+
+    以图片内容的 SHA-256 为键缓存识别结果, 同一张图片重复上传时不再调用视觉模型;
+    同时保存图片的感知哈希(dHash), 用于匹配重新压缩、轻微裁剪后的近似图片。
+    感知哈希按16位分为4段分别建索引, 汉明距离不超过3的图片至少有一段完全相同。
+    """
+    sha256 = models.CharField(max_length=64, unique=True, verbose_name="内容哈希")
+    phash = models.CharField(max_length=16, blank=True, verbose_name="感知哈希")
+    phash_0 = models.CharField(max_length=4, blank=True, db_index=True)
+    phash_1 = models.CharField(max_length=4, blank=True, db_index=True)
+    phash_2 = models.CharField(max_length=4, blank=True, db_index=True)
+    phash_3 = models.CharField(max_length=4, blank=True, db_index=True)
+
+    result = models.JSONField(verbose_name="识别结果")
+    hit_count = models.PositiveIntegerField(default=0, verbose_name="命中次数")
+
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True, verbose_name="创建时间")
+    last_accessed_at = models.DateTimeField(auto_now_add=True, db_index=True, verbose_name="最近访问时间")
+
+    class Meta:
+        verbose_name = "图片识别缓存"
+        verbose_name_plural = "图片识别缓存"
+
+    def __str__(self):
+        return f"{self.sha256[:12]} (命中{self.hit_count}次)"
+
+
+class AnalysisJob(models.Model):
+    """
+    异步图片识别任务
+
+    请求以异步模式提交时只保存图片并立即返回任务ID, 由 run_analysis_worker 命令启动的
+    工作进程领取执行; 客户端轮询任务状态, 或在提交时提供回调地址, 完成后接收通知。
+    """
+    STATUS_PENDING = 'pending'
+    STATUS_RUNNING = 'running'
+    STATUS_SUCCEEDED = 'succeeded'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, '等待中'),
+        (STATUS_RUNNING, '执行中'),
+        (STATUS_SUCCEEDED, '成功'),
+        (STATUS_FAILED, '失败'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    # 提交任务的用户, 只有该用户可以查询任务
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        null=True,
+        related_name='analysis_jobs',
+        verbose_name="提交用户"
+    )
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_PENDING, verbose_name="状态")
+
+    image = models.BinaryField(verbose_name="图片内容")  # 完成后清空
+    mime_type = models.CharField(max_length=20, default="image/jpeg", verbose_name="图片类型")
+    callback_url = models.URLField(max_length=500, blank=True, verbose_name="回调地址")
+
+    attempts = models.PositiveSmallIntegerField(default=0, verbose_name="已执行次数")
+    max_attempts = models.PositiveSmallIntegerField(default=3, verbose_name="最多执行次数")
+    next_attempt_at = models.DateTimeField(verbose_name="可执行时间")
+    deadline = models.DateTimeField(verbose_name="截止时间")
+    lease_expires_at = models.DateTimeField(null=True, blank=True, verbose_name="领取到期时间")
+
+    result = models.JSONField(null=True, blank=True, verbose_name="识别结果")
+    error = models.TextField(blank=True, verbose_name="错误信息")
+    callback_status = models.CharField(max_length=100, blank=True, verbose_name="回调结果")
+
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="创建时间")
+    started_at = models.DateTimeField(null=True, blank=True, verbose_name="开始时间")
+    finished_at = models.DateTimeField(null=True, blank=True, verbose_name="完成时间")
+    expires_at = models.DateTimeField(null=True, blank=True, db_index=True, verbose_name="结果过期时间")
+
+    class Meta:
+        verbose_name = "图片识别任务"
+        verbose_name_plural = "图片识别任务"
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='analysisjob_claim_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.id} ({self.get_status_display()})"
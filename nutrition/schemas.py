@@ -0,0 +1,183 @@
+# nutrition/schemas.py
+
+"""
+模型返回的营养结果的结构校验
+
+食物识别和营养计算的模型输出格式相同: {"foods": [...], "total": {...}}。
+用 pydantic 模型直接校验 JSON 字符串(model_validate_json 由 pydantic-core 解析, 不经过 json.loads),
+数值字段统一转换为 float, 模型额外返回的字段(如 note、analysis_time)原样保留。
+
+模型输出因 max_tokens 被截断时, 先截掉最后一个已闭合的食物(或顶层字段)之后的内容, 再用
+pydantic_core.from_json(allow_partial=True) 解析: 只保留以 } 结尾的完整食物(被截断的数值如 "fat":12
+会被 allow_partial 当作完整数值接受, 不能直接解析), 总计缺失时按食物明细重新汇总, 并在结果中标记 partial。
+"""
+
+import logging
+import random
+from typing import Any, Dict, List, Tuple
+
+import pydantic_core
+from django.conf import settings
+from pydantic import BaseModel, ConfigDict, ValidationError
+
+logger = logging.getLogger(__name__)
+
+
+class ResponseFormatError(ValueError):
+    """模型输出无法解析为有效的营养结果"""
+
+
+class FoodEntry(BaseModel):
+    model_config = ConfigDict(extra='allow')
+
+    name: str
+    weight: float
+    calories: float
+    protein: float
+    carbs: float
+    fat: float
+
+
+class NutritionTotal(BaseModel):
+    model_config = ConfigDict(extra='allow')
+
+    total_calories: float
+    total_protein: float
+    total_carbs: float
+    total_fat: float
+
+
+class NutritionResult(BaseModel):
+    model_config = ConfigDict(extra='allow')
+
+    foods: List[FoodEntry]
+    total: NutritionTotal
+
+
+def _strip_fence(content: str) -> str:
+    # 个别模型会把 JSON 包在 ```json 代码块中
+    if content.startswith("```"):
+        content = content.split("\n", 1)[1] if "\n" in content else ""
+        content = content.rstrip().removesuffix("```")
+    return content.strip()
+
+
+def _missing_fields(error: ValidationError) -> str:
+    return ", ".join(".".join(str(part) for part in item["loc"]) or item["msg"] for item in error.errors())
+
+
+def _sum_total(foods: List[FoodEntry]) -> NutritionTotal:
+    return NutritionTotal(
+        total_calories=round(sum(food.calories for food in foods), 1),
+        total_protein=round(sum(food.protein for food in foods), 1),
+        total_carbs=round(sum(food.carbs for food in foods), 1),
+        total_fat=round(sum(food.fat for food in foods), 1),
+    )
+
+
+def _closed_prefix(content: str) -> str:
+    """
+    截取到最后一个闭合在顶层对象或其数组中的 } / ] 为止
+
+    截断点之前的每个值后面都跟着分隔符或括号, 因此都是完整的; 未闭合的食物和总计被整体丢弃。
+    """
+    depth = 0
+    in_string = escaped = False
+    end = 0
+    for index, char in enumerate(content):
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+        elif char in "{[":
+            depth += 1
+        elif char in "}]":
+            depth -= 1
+            if depth <= 2:
+                end = index + 1
+    return content[:end]
+
+
+def _repair(content: str) -> Dict[str, Any]:
+    """从被截断的 JSON 中恢复已完整的食物"""
+    try:
+        data = pydantic_core.from_json(content, allow_partial=True)
+    except ValueError:
+        raise ResponseFormatError("模型返回非JSON格式")
+    if not isinstance(data, dict) or not isinstance(data.get("foods"), list):
+        raise ResponseFormatError("结果缺失字段：foods")
+
+    prefix = _closed_prefix(content)
+    data = pydantic_core.from_json(prefix, allow_partial=True) if prefix else {"foods": []}
+
+    foods = []
+    for item in data.get("foods") or []:
+        try:
+            foods.append(FoodEntry.model_validate(item))
+        except ValidationError:
+            # 已闭合却缺少字段, 说明输出本身有误, 后面的内容不再采用
+            break
+    if not foods:
+        raise ResponseFormatError("模型输出被截断, 没有完整的食物数据")
+
+    try:
+        total = NutritionTotal.model_validate(data.get("total"))
+    except ValidationError:
+        total = _sum_total(foods)
+
+    extra = {key: value for key, value in data.items() if key not in ("foods", "total")}
+    return NutritionResult(foods=foods, total=total, **extra).model_dump()
+
+
+def parse_nutrition_result(content: str) -> Tuple[Dict[str, Any], bool]:
+    """
+    解析并校验模型输出
+
+    Returns:
+        (结果, 是否为从截断输出中恢复的部分结果)
+
+    Raises:
+        ResponseFormatError: 不是 JSON, 或结构不符合且无法恢复
+    """
+    content = _strip_fence(content)
+    try:
+        return NutritionResult.model_validate_json(content).model_dump(), False
+    except ValidationError as e:
+        if not any(item["type"] == "json_invalid" for item in e.errors()):
+            # JSON 完整但结构不符
+            data = pydantic_core.from_json(content)
+            if isinstance(data, dict) and isinstance(data.get("foods"), list) and "total" not in data:
+                # 只缺总计时按明细汇总
+                try:
+                    foods = [FoodEntry.model_validate(item) for item in data["foods"]]
+                except ValidationError as food_error:
+                    raise ResponseFormatError(f"结果缺失字段：{_missing_fields(food_error)}")
+                extra = {key: value for key, value in data.items() if key != "foods"}
+                return NutritionResult(foods=foods, total=_sum_total(foods), **extra).model_dump(), False
+            raise ResponseFormatError(f"结果缺失字段：{_missing_fields(e)}")
+
+    return _repair(content), True
+
+
+def log_result_sample(kind: str, result: Dict[str, Any]):
+    """
+    按 settings.NUTRITION_LOG_SAMPLE_RATE 的比例以 DEBUG 级别记录结果摘要
+
+    未开启 DEBUG 日志时不做任何格式化, 请求路径上没有控制台输出。
+    """
+    if not logger.isEnabledFor(logging.DEBUG):
+        return
+    if random.random() >= getattr(settings, 'NUTRITION_LOG_SAMPLE_RATE', 0.01):
+        return
+    total = result["total"]
+    logger.debug(
+        "%s: %s | 总热量 %.1fkcal 蛋白质 %.1fg 碳水 %.1fg 脂肪 %.1fg",
+        kind,
+        ", ".join(f"{food['name']} {food['weight']:g}g {food['calories']:g}kcal" for food in result["foods"]),
+        total["total_calories"], total["total_protein"], total["total_carbs"], total["total_fat"],
+    )
@@ -1,24 +1,22 @@
+import asyncio
 import json
 import base64
-from django.utils import timezone
-from chat.services import client  # 导入公共OpenAI client
-class FoodAnalysisService:
-    def __init__(self):
-        self.model = "gpt-4o"
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Any, AsyncIterator, Iterator, List, NamedTuple
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import connection
+from chat.services import get_sync_client, get_async_llm  # 公共OpenAI client
+from core import metrics
+from core.singleflight import SingleFlight
+from diet.search import get_food_search_index
+from . import image_cache
+from .imaging import preprocess_image
+from .schemas import ResponseFormatError, log_result_sample, parse_nutrition_result
 
-    def analyze_image(self, image_path: str):
-        """
-        处理图片编码并调用API分析
-        :param image_path: 临时图片文件的本地路径
-        :return: 结构化分析结果
-        """
-        # 1. 先将图片转换为Base64编码（核心：服务层处理编码）
-        image_base64 = self._encode_image(image_path)
-        if not image_base64:
-            return {"error": "图片编码失败"}
 
-        # 2. 构建提示词
-        prompt = """
+FOOD_ANALYSIS_PROMPT = """
         你需要分析图片中的食物，完成「识别-估算-计算-汇总」全流程，严格遵循以下规则：
 
         ### 一、食物识别要求
@@ -66,111 +64,444 @@ class FoodAnalysisService:
         1. 不可遗漏图片中的任何食物（即使是小份量酱料、坚果等）。
         2. 不可返回JSON以外的内容（如解释文字、换行符、注释）。
         3. 重量和营养数据不可为负数或0（除非食物确实无该成分，如纯瘦肉脂肪接近0可填0.0）。
+        """.strip()
+
+
+def _parse_response(response, kind: str):
+    """
+    解析两个服务共用的模型输出格式
+
+    成功时返回 {"success": True, "data": ...}; 输出被截断但恢复出部分食物时额外带有 "partial": True;
+    失败时返回 {"error": ..., "raw_content": ...}
+    """
+    content = ""
+    try:
+        content = response.choices[0].message.content or ""
+        result, partial = parse_nutrition_result(content)
+    except ResponseFormatError as e:
+        metrics.incr("nutrition.response.invalid")
+        return {"error": str(e), "raw_content": content}
+    except Exception as e:
+        metrics.incr("nutrition.response.invalid")
+        return {"error": f"结果处理失败：{str(e)}", "raw_content": content}
+
+    log_result_sample(kind, result)
+    if partial:
+        metrics.incr("nutrition.response.repaired")
+        return {"success": True, "data": result, "partial": True}
+    return {"success": True, "data": result}
+
+
+class FoodAnalysisService:
+    def __init__(self, llm_client=None, async_llm=None):
+        self.model = "gpt-4o"
+        # 默认使用公共 client, 基准测试等场景可传入指向其他服务的 client
+        self.client = llm_client or get_sync_client()
+        self.async_llm = async_llm
+        # 最近一次 analyze_image 的缓存命中情况: hit(精确)/near(近似)/miss
+        self.cache_status = None
+
+    def analyze_image(self, image_bytes, image_base64: str = None, mime_type: str = "image/jpeg"):
+        """
+        处理图片编码并调用API分析
+
+        图片全程在内存中处理, 不落盘。相同(或近似)图片的识别结果会被缓存,
+        命中时直接返回, 不再调用模型
+        :param image_bytes: 图片内容(bytes / memoryview)
+        :param image_base64: 客户端已提供的Base64编码(可选), 提供时直接透传给模型, 不再重新编码
+        :param mime_type: 图片类型, 用于构造 data URL
+        :return: 结构化分析结果
+        """
+        if not image_bytes:
+            return {"error": "图片编码失败"}
+
+        # 1. 按图片内容查找缓存
+        sha256, phash = self._hash_image(image_bytes)
+        cached_result, self.cache_status = image_cache.lookup(sha256, phash)
+        if cached_result is not None:
+            return cached_result
+
+        # 2. 预处理、编码并调用模型
+        image_base64, mime_type = self._prepare_image(image_bytes, image_base64, mime_type)
+        result = self._analyze(image_base64, mime_type)
+
+        # 只缓存识别成功的结果
+        if result.get("success"):
+            image_cache.store(sha256, phash, result)
+        return result
+
+    async def aanalyze_image(self, image_bytes, image_base64: str = None, mime_type: str = "image/jpeg"):
         """
+        analyze_image 的异步版本(供 ASGI 异步视图使用)
+
+        哈希和图片预处理在线程池中执行, 缓存读写通过 sync_to_async 访问数据库,
+        等待模型返回期间不占用线程
+        """
+        if not image_bytes:
+            return {"error": "图片编码失败"}
+
+        sha256, phash = await asyncio.to_thread(self._hash_image, image_bytes)
+        cached_result, self.cache_status = await sync_to_async(image_cache.lookup)(sha256, phash)
+        if cached_result is not None:
+            return cached_result
+
+        image_base64, mime_type = await asyncio.to_thread(self._prepare_image, image_bytes, image_base64, mime_type)
+        result = await self._aanalyze(image_base64, mime_type)
+
+        if result.get("success"):
+            await sync_to_async(image_cache.store)(sha256, phash, result)
+        return result
+
+    def _hash_image(self, image_bytes):
+        """计算缓存使用的内容哈希和感知哈希"""
+        return image_cache.content_hash(image_bytes), image_cache.perceptual_hash(image_bytes)
+
+    def _prepare_image(self, image_bytes, image_base64: str = None, mime_type: str = "image/jpeg", preprocess: bool = True):
+        """
+        生成发送给模型的Base64编码
+
+        默认先缩小并重新压缩图片(见 imaging.preprocess_image); 图片无需处理时
+        优先透传客户端提供的Base64, 否则对原图编码
+        :return: (Base64编码, 图片类型)
+        """
+        prepared = preprocess_image(image_bytes) if preprocess else None
+        if prepared is not None:
+            return self._encode_image(prepared.data), prepared.mime_type
+        if image_base64 is None:
+            image_base64 = self._encode_image(image_bytes)
+        return image_base64, mime_type
+
+    def _analyze(self, image_base64: str, mime_type: str = "image/jpeg"):
+        """调用视觉模型识别Base64编码的图片"""
 
-        # 3. 调用OpenAI API
         try:
-            response = client.chat.completions.create(
-                model="gpt-4.1",
-                messages=[
-                    {
-                        "role": "user",
-                        "content": [
-                            {"type": "text", "text": prompt.strip()},
-                            {
-                                "type": "image_url",
-                                 "image_url": {
-                                    "url": f"data:image/jpeg;base64,{image_base64}"
-                                }
-                            }
-                        ]
-                    }
-                ]
-                # messages=[
-                #     {
-                #         "role": "user",
-                #         "content": "Hello!"
-                #     }
-                # ]
-            )
-            # print(response.choices[0].message.content)
-            # print(response.output_text)
+            response = self.client.chat.completions.create(**self._request_kwargs(image_base64, mime_type))
             return self._process_response(response)
 
         except Exception as e:
             return {"error": f"API调用失败：{str(e)}"}
 
-    def _encode_image(self, image_path: str) -> str:
-        """图片编码处理（服务层内部方法）"""
+    async def _aanalyze(self, image_base64: str, mime_type: str = "image/jpeg"):
+        """_analyze 的异步版本, 通过并发受限的异步客户端调用"""
         try:
-            with open(image_path, "rb") as f:
-                return base64.b64encode(f.read()).decode("utf-8")  # 返回纯编码字符串
+            response = await (self.async_llm or get_async_llm()).chat_completion(
+                **self._request_kwargs(image_base64, mime_type)
+            )
+            return self._process_response(response)
+
         except Exception as e:
-            print(f"图片编码失败：{e}")
-            return ""
+            return {"error": f"API调用失败：{str(e)}"}
+
+    def _request_kwargs(self, image_base64: str, mime_type: str) -> dict:
+        """构造视觉模型请求参数"""
+        return {
+            "model": "gpt-4.1",
+            "messages": [
+                {
+                    "role": "user",
+                    "content": [
+                        {"type": "text", "text": FOOD_ANALYSIS_PROMPT},
+                        {
+                            "type": "image_url",
+                            "image_url": {
+                                "url": f"data:{mime_type};base64,{image_base64}"
+                            }
+                        }
+                    ]
+                }
+            ],
+        }
+
+    def _encode_image(self, image_bytes: bytes) -> str:
+        """图片编码处理（服务层内部方法）"""
+        return base64.b64encode(image_bytes).decode("utf-8")  # 返回纯编码字符串
 
     def _process_response(self, response):
-        """解析结果并打印到控制台"""
-        try:
-            content = response.choices[0].message.content.strip()
-            result = json.loads(content)
-
-            # 打印结果
-            print("\n" + "="*60)
-            print(f"【分析时间】{timezone.now().strftime('%Y-%m-%d %H:%M:%S')}")
-            print("【食物识别结果】")
-            for food in result["foods"]:
-                print(f"- {food['name']}：{food['weight']}g，{food['calories']}kcal")
-                print(f"  营养：蛋白质{food['protein']}g | 碳水{food['carbs']}g | 脂肪{food['fat']}g")
-            print("\n【总计】")
-            print(f"总热量：{result['total']['total_calories']}kcal | 总蛋白质：{result['total']['total_protein']}g")
-            print(f"总碳水：{result['total']['total_carbs']}g | 总脂肪：{result['total']['total_fat']}g")
-            print("="*60 + "\n")
-
-            return {"success": True, "data": result}
-
-        except json.JSONDecodeError:
-            return {"error": "模型返回非JSON格式", "raw_content": content}
-        except KeyError as e:
-            return {"error": f"结果缺失字段：{str(e)}", "raw_content": content}
-        except Exception as e:
-            return {"error": f"结果处理失败：{str(e)}", "raw_content": content}
+        """校验并解析模型输出(不输出到控制台, 按比例记录DEBUG日志)"""
+        return _parse_response(response, "食物识别")
+
+
+class BatchImage(NamedTuple):
+    """批量识别中的一张图片"""
+    filename: str
+    data: Any  # bytes / memoryview
+    mime_type: str
+
+
+def _batch_concurrency() -> int:
+    return getattr(settings, 'NUTRITION_BATCH_CONCURRENCY', 4)
+
+
+def _batch_line(index: int, image: BatchImage, result: dict) -> bytes:
+    """批量识别的一行输出, result 与单张图片接口的返回格式相同"""
+    line = {"index": index, "filename": image.filename, "result": result}
+    return (json.dumps(line, ensure_ascii=False) + "\n").encode("utf-8")
+
+
+def _record_batch_metrics(service: FoodAnalysisService, started: float):
+    if service.cache_status:
+        metrics.incr(f"nutrition.analyze_batch.cache.{service.cache_status}")
+    metrics.observe("nutrition.analyze_batch.latency", time.perf_counter() - started)
+
+
+def _analyze_batch_item(index: int, image: BatchImage) -> bytes:
+    started = time.perf_counter()
+    service = FoodAnalysisService()
+    try:
+        result = service.analyze_image(image.data, mime_type=image.mime_type)
+    except Exception as e:
+        result = {"error": f"图片识别失败：{str(e)}"}
+    finally:
+        # 工作线程的数据库连接不会在请求结束时自动关闭
+        connection.close()
+    _record_batch_metrics(service, started)
+    return _batch_line(index, image, result)
+
+
+def iter_batch_analysis(images: List[BatchImage]) -> Iterator[bytes]:
+    """
+    并发识别多张图片, 按完成顺序逐行输出结果(NDJSON)
+
+    同时进行的识别数不超过 settings.NUTRITION_BATCH_CONCURRENCY; 每行带有图片在请求中的
+    序号 index, 客户端据此对应图片。客户端断开后尚未开始的识别会被取消。
+    """
+    executor = ThreadPoolExecutor(
+        max_workers=max(1, min(_batch_concurrency(), len(images))),
+        thread_name_prefix="nutrition-batch",
+    )
+    try:
+        futures = [executor.submit(_analyze_batch_item, index, image) for index, image in enumerate(images)]
+        for future in as_completed(futures):
+            yield future.result()
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+async def aiter_batch_analysis(images: List[BatchImage]) -> AsyncIterator[bytes]:
+    """iter_batch_analysis 的异步版本(供 ASGI 异步视图使用)"""
+    semaphore = asyncio.Semaphore(_batch_concurrency())
+
+    async def analyze(index: int, image: BatchImage) -> bytes:
+        async with semaphore:
+            started = time.perf_counter()
+            service = FoodAnalysisService()
+            try:
+                result = await service.aanalyze_image(image.data, mime_type=image.mime_type)
+            except Exception as e:
+                result = {"error": f"图片识别失败：{str(e)}"}
+            _record_batch_metrics(service, started)
+            return _batch_line(index, image, result)
+
+    tasks = [asyncio.ensure_future(analyze(index, image)) for index, image in enumerate(images)]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            yield await next_done
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+# 会明显增加油脂的烹饪方式; 名称中带有这些字而食物库对应项没有时, 模糊匹配的结果不可靠,
+# 交给模型按烹饪后的数据计算(蒸、煮等基本不改变营养的方式仍在本地计算)
+OIL_COOKING_MARKERS = ("炸", "煎", "炒", "烧", "烤", "爆", "酥", "焗")
+
+
+# 正在进行的相同营养计算(食物库无法解析的部分相同)只调用一次模型
+_remote_flight = SingleFlight("nutrition.calculate")
+
+
+def _food_key(item: dict) -> tuple:
+    """规范化的(名称, 重量): 合并空白、忽略大小写, 重量保留一位小数"""
+    return " ".join(item["name"].split()).casefold(), round(float(item["weight"]), 1)
 
 
 class NutritionCalculationService:
+    def __init__(self, llm_client=None, async_llm=None):
+        # 默认使用公共 client, 基准测试等场景可传入指向其他服务的 client
+        self.client = llm_client or get_sync_client()
+        self.async_llm = async_llm
+
     def calculate_nutrition(self, food_list: list):
         """
-        调用OpenAI计算食物热量及营养成分
+        计算食物热量及营养成分
+
+        能在食物库中解析到的食物(精确名称、别名或模糊匹配)直接按每100g营养数据本地计算,
+        只有解析不到的剩余部分合并成一次请求交给OpenAI计算, 最后按原顺序合并结果
         :param food_list: 食物列表，格式如[{"name": "食物名", "weight": 重量克}, ...]
         :return: 结构化计算结果
         """
         if not food_list:
             return {"error": "食物列表为空"}
 
-        # 1. 构造提示词（明确计算逻辑和输出格式）
-        prompt = self._build_prompt(food_list)
+        # 1. 先在食物库中解析, 能解析的本地计算
+        foods, remainder = self._resolve_local(get_food_search_index(), food_list)
 
-        # 2. 调用OpenAI API
-        try:
-            response = client.chat.completions.create(
-                model="gpt-4o",
-                messages=[
-                    {
-                        "role": "user",
-                        "content": prompt
-                    }
-                ],
-                temperature=0.1,  # 降低随机性，确保计算准确
-                max_tokens=1000,
-                response_format={"type": "json_object"}  # 强制返回JSON
+        # 2. 剩余部分一次性调用OpenAI; 相同的请求正在计算时等待其结果, 不重复调用
+        llm_result = None
+        if remainder:
+            canonical = self._canonical_foods(remainder)
+            llm_result = _remote_flight.do(
+                tuple(_food_key(item) for item in canonical), lambda: self._calculate_remote(canonical)
+            )
+
+        # 3. 合并
+        return self._merge(foods, remainder, llm_result)
+
+    async def acalculate_nutrition(self, food_list: list):
+        """calculate_nutrition 的异步版本(供 ASGI 异步视图使用)"""
+        if not food_list:
+            return {"error": "食物列表为空"}
+
+        index = await sync_to_async(get_food_search_index)()
+        foods, remainder = self._resolve_local(index, food_list)
+        llm_result = None
+        if remainder:
+            canonical = self._canonical_foods(remainder)
+            llm_result = await _remote_flight.ado(
+                tuple(_food_key(item) for item in canonical), lambda: self._acalculate_remote(canonical)
             )
+        return self._merge(foods, remainder, llm_result)
 
-            # 3. 解析结果并打印
+    def _resolve_local(self, index, food_list: list):
+        """
+        在食物库中解析食物
+
+        Returns:
+            (按原顺序的计算结果, 无法解析的食物); 结果列表中无法解析的位置为None
+        """
+        foods = []
+        remainder = []
+        for item in food_list:
+            matched, match_type = index.resolve(item["name"])
+            if match_type == "fuzzy" and any(
+                    marker in item["name"] and marker not in matched["name"] for marker in OIL_COOKING_MARKERS):
+                matched = None
+            if matched is None:
+                foods.append(None)
+                remainder.append(item)
+            else:
+                foods.append(self._calculate_local(item, matched, match_type))
+
+        metrics.incr("nutrition.calculate.local_foods", len(food_list) - len(remainder))
+        metrics.incr("nutrition.calculate.llm_foods", len(remainder))
+        return foods, remainder
+
+    def _canonical_foods(self, food_list: list) -> list:
+        """规范化并按(名称, 重量)排序, 顺序或写法不同的相同请求发送给模型的内容完全一致"""
+        return [{"name": name, "weight": weight} for name, weight in sorted(_food_key(item) for item in food_list)]
+
+    def _merge(self, foods: list, remainder: list, llm_result):
+        """将模型的计算结果填回无法本地解析的位置并重新汇总"""
+        if remainder:
+            if not llm_result.get("success"):
+                return llm_result
+            # 模型结果对应规范化后的列表, 按(名称, 重量)映射回请求中的原始名称和顺序
+            canonical = self._canonical_foods(remainder)
+            by_key = {}
+            for food in self._align_remote_foods(canonical, llm_result["data"].get("foods", [])):
+                by_key.setdefault(_food_key(food), []).append(food)
+            llm_iter = iter([
+                {**by_key[_food_key(item)].pop(0), "name": item["name"], "weight": item["weight"]}
+                for item in remainder
+            ])
+            foods = [food if food is not None else next(llm_iter) for food in foods]
+
+        # 汇总(不使用模型给出的总计, 以合并后的明细为准)
+        total = {
+            "total_calories": round(sum(food["calories"] for food in foods), 1),
+            "total_protein": round(sum(food["protein"] for food in foods), 1),
+            "total_carbs": round(sum(food["carbs"] for food in foods), 1),
+            "total_fat": round(sum(food["fat"] for food in foods), 1),
+        }
+        result = {"success": True, "data": {"foods": foods, "total": total}}
+        if llm_result and llm_result.get("partial"):
+            # 模型输出被截断, 未返回的食物营养记为0
+            result["partial"] = True
+        return result
+
+    def _calculate_local(self, item: dict, matched: dict, match_type: str) -> dict:
+        """按食物库中每100g的营养数据换算"""
+        ratio = item["weight"] / 100
+        return {
+            "name": item["name"],
+            "weight": item["weight"],
+            "calories": round(matched["calories"] * ratio, 1),
+            "protein": round(matched["protein"] * ratio, 1),
+            "carbs": round(matched["carbohydrates"] * ratio, 1),
+            "fat": round(matched["fat"] * ratio, 1),
+            "source": "catalog",
+            "matched_name": matched["name"],
+            "match_type": match_type,
+        }
+
+    def _calculate_remote(self, food_list: list):
+        """调用OpenAI计算食物库中没有的食物"""
+        metrics.incr("nutrition.calculate.llm_calls")
+        try:
+            response = self.client.chat.completions.create(**self._request_kwargs(food_list))
+            return self._process_response(response)
+
+        except Exception as e:
+            return {"error": f"API调用失败：{str(e)}"}
+
+    async def _acalculate_remote(self, food_list: list):
+        """_calculate_remote 的异步版本"""
+        metrics.incr("nutrition.calculate.llm_calls")
+        try:
+            response = await (self.async_llm or get_async_llm()).chat_completion(**self._request_kwargs(food_list))
             return self._process_response(response)
 
         except Exception as e:
             return {"error": f"API调用失败：{str(e)}"}
 
+    def _request_kwargs(self, food_list: list) -> dict:
+        """构造营养计算请求参数"""
+        return {
+            "model": "gpt-4o",
+            "messages": [
+                {
+                    "role": "user",
+                    "content": self._build_prompt(food_list)
+                }
+            ],
+            "temperature": 0.1,  # 降低随机性，确保计算准确
+            "max_tokens": 1000,
+            "response_format": {"type": "json_object"},  # 强制返回JSON
+        }
+
+    def _align_remote_foods(self, remainder: list, llm_foods: list) -> list:
+        """
+        将模型返回的食物与请求的食物一一对应
+
+        优先按名称对应, 其余按顺序对应; 模型遗漏的食物营养记为0并注明
+        """
+        by_name = {}
+        for food in llm_foods:
+            by_name.setdefault(food.get("name"), []).append(food)
+        unnamed = [food for food in llm_foods if food.get("name") not in {item["name"] for item in remainder}]
+
+        aligned = []
+        for item in remainder:
+            candidates = by_name.get(item["name"])
+            food = candidates.pop(0) if candidates else (unnamed.pop(0) if unnamed else None)
+            if food is None:
+                aligned.append({
+                    "name": item["name"], "weight": item["weight"],
+                    "calories": 0.0, "protein": 0.0, "carbs": 0.0, "fat": 0.0,
+                    "source": "llm", "note": "模型未返回该食物",
+                })
+                continue
+            aligned.append({
+                "name": item["name"],
+                "weight": item["weight"],
+                "calories": round(float(food.get("calories") or 0), 1),
+                "protein": round(float(food.get("protein") or 0), 1),
+                "carbs": round(float(food.get("carbs") or 0), 1),
+                "fat": round(float(food.get("fat") or 0), 1),
+                "source": "llm",
+            })
+        return aligned
+
     def _build_prompt(self, food_list: list) -> str:
         """构建提示词，说明计算规则"""
         # 格式化食物列表为自然语言
@@ -205,29 +536,5 @@ class NutritionCalculationService:
         """
 
     def _process_response(self, response):
-        """处理API响应，打印结果并返回结构化数据"""
-        try:
-            content = response.choices[0].message.content.strip()
-            result = json.loads(content)
-
-            # 打印到控制台
-            print("\n" + "=" * 60)
-            print(f"【计算时间】{timezone.now().strftime('%Y-%m-%d %H:%M:%S')}")
-            print("【食物营养计算结果】")
-            for food in result["foods"]:
-                print(f"- {food['name']}（{food['weight']}g）：")
-                print(
-                    f"  热量：{food['calories']}kcal | 蛋白质：{food['protein']}g | 碳水：{food['carbs']}g | 脂肪：{food['fat']}g")
-            print("\n【总计】")
-            print(f"总热量：{result['total']['total_calories']}kcal | 总蛋白质：{result['total']['total_protein']}g")
-            print(f"总碳水：{result['total']['total_carbs']}g | 总脂肪：{result['total']['total_fat']}g")
-            print("=" * 60 + "\n")
-
-            return {"success": True, "data": result}
-
-        except json.JSONDecodeError:
-            return {"error": "AI返回非JSON格式", "raw_content": content}
-        except KeyError as e:
-            return {"error": f"结果缺失字段：{str(e)}", "raw_content": content}
-        except Exception as e:
-            return {"error": f"结果处理失败：{str(e)}", "raw_content": content}
\ No newline at end of file
+        """处理API响应, 校验并返回结构化数据"""
+        return _parse_response(response, "营养计算")
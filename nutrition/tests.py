@@ -0,0 +1,70 @@
+import json
+
+from django.test import SimpleTestCase
+
+from .schemas import ResponseFormatError, parse_nutrition_result
+
+RICE = {"name": "米饭", "weight": 150, "calories": 174, "protein": 3.9, "carbs": 38.9, "fat": 0.5}
+CHICKEN = {"name": "鸡胸肉", "weight": 100, "calories": 133, "protein": 24.6, "carbs": 0, "fat": 5}
+TOTAL = {"total_calories": 307, "total_protein": 28.5, "total_carbs": 38.9, "total_fat": 5.5}
+
+
+def dumps(value):
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":"))
+
+
+def truncate_after(content, marker):
+    """截断在 marker 之后(模拟 max_tokens 截断)"""
+    return content[:content.index(marker) + len(marker)]
+
+
+FULL = dumps({"foods": [RICE, CHICKEN], "total": TOTAL})
+
+
+class ParseNutritionResultTests(SimpleTestCase):
+    def test_parse_cases(self):
+        # (说明, 模型输出, 期望的食物名称, 期望的总热量, 是否为部分结果)
+        cases = [
+            ("完整输出", FULL, ["米饭", "鸡胸肉"], 307, False),
+            ("代码块包裹", f"```json\n{FULL}\n```", ["米饭", "鸡胸肉"], 307, False),
+            ("缺少总计时按明细汇总", dumps({"foods": [RICE, CHICKEN]}), ["米饭", "鸡胸肉"], 307, False),
+            ("额外字段原样保留", dumps({"foods": [RICE], "total": TOTAL, "note": "仅供参考"}), ["米饭"], 307, False),
+            ("截断在字符串中间", truncate_after(FULL, '"name":"鸡胸'), ["米饭"], 174, True),
+            # allow_partial 会把被截断的 24 当作完整数值, 未闭合的食物必须整体丢弃
+            ("截断在最后一个食物的数值中间", truncate_after(FULL, '"protein":24'), ["米饭"], 174, True),
+            ("截断在食物对象闭合之前", truncate_after(FULL, '"fat":5'), ["米饭"], 174, True),
+            ("截断在两个食物之间", truncate_after(FULL, '"fat":0.5},'), ["米饭"], 174, True),
+            ("食物完整、总计被截断", truncate_after(FULL, '"total_protein":28'), ["米饭", "鸡胸肉"], 307, True),
+            ("只缺最外层的右括号", FULL[:-1], ["米饭", "鸡胸肉"], 307, True),
+        ]
+        for description, content, names, total_calories, partial in cases:
+            with self.subTest(description):
+                result, is_partial = parse_nutrition_result(content)
+                self.assertEqual([food["name"] for food in result["foods"]], names)
+                self.assertEqual(result["total"]["total_calories"], total_calories)
+                self.assertEqual(is_partial, partial)
+                for food in result["foods"]:
+                    self.assertIsInstance(food["weight"], float)
+
+    def test_truncated_number_is_not_kept(self):
+        content = dumps({"foods": [RICE, dict(CHICKEN, fat=12.5)]})
+        result, partial = parse_nutrition_result(truncate_after(content, '"fat":12'))
+        self.assertTrue(partial)
+        self.assertEqual([food["name"] for food in result["foods"]], ["米饭"])
+        self.assertEqual(result["total"]["total_fat"], 0.5)
+
+    def test_invalid_outputs(self):
+        # (说明, 模型输出, 错误信息中应包含的内容)
+        cases = [
+            ("不是JSON", "抱歉，我无法识别这张图片", "非JSON"),
+            ("缺少foods", dumps({"total": TOTAL}), "foods"),
+            ("食物缺少字段", dumps({"foods": [{"name": "米饭", "weight": 100}], "total": TOTAL}), "calories"),
+            ("数值类型错误", dumps({"foods": [dict(RICE, calories="很多")], "total": TOTAL}), "calories"),
+            ("只缺总计但食物缺少字段", dumps({"foods": [{"name": "米饭"}]}), "weight"),
+            ("截断在第一个食物中间", truncate_after(FULL, '"calories":17'), "截断"),
+        ]
+        for description, content, message in cases:
+            with self.subTest(description):
+                with self.assertRaises(ResponseFormatError) as context:
+                    parse_nutrition_result(content)
+                self.assertIn(message, str(context.exception))
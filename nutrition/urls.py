@@ -1,12 +1,27 @@
 # 项目主urls.py
+from django.conf import settings
 from django.urls import path
 from . import views
 app_name = 'nutrition'
 
+# ASGI 部署时可切换为异步视图, 接口地址不变
+if settings.LLM_ASYNC_VIEWS:
+    analyze_view = views.food_recognition_async_view
+    analyze_batch_view = views.food_recognition_batch_async_view
+    analyze_base64_view = views.food_recognition_base64_async_view
+    calculate_view = views.nutrition_calculation_async_view
+else:
+    analyze_view = views.FoodRecognitionView.as_view()
+    analyze_batch_view = views.FoodRecognitionBatchView.as_view()
+    analyze_base64_view = views.FoodRecognitionBase64View.as_view()
+    calculate_view = views.NutritionCalculationView.as_view()
+
 urlpatterns = [
     # ...其他路由
-    path('analyze/', views.FoodRecognitionView.as_view(), name='food-analysis'),
-    path('analyze/recognize-base64/', views.FoodRecognitionBase64View.as_view(), name='food-recognition-base64'),
-    path('calculate/', views.NutritionCalculationView.as_view(), name='nutrition-calculate'),
+    path('analyze/', analyze_view, name='food-analysis'),
+    path('analyze/batch/', analyze_batch_view, name='food-analysis-batch'),
+    path('analyze/recognize-base64/', analyze_base64_view, name='food-recognition-base64'),
+    path('calculate/', calculate_view, name='nutrition-calculate'),
+    path('jobs/<uuid:job_id>/', views.AnalysisJobView.as_view(), name='analysis-job'),
 
-]
\ No newline at end of file
+]
@@ -1,139 +1,398 @@
 import base64
-import os
-from django.http import JsonResponse
+import json
+import time
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.validators import URLValidator
+from django.http import JsonResponse, StreamingHttpResponse
+from django.urls import reverse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.permissions import IsAuthenticated
 from rest_framework.views import APIView
 from rest_framework.parsers import MultiPartParser, JSONParser
-from pathlib import Path
-from .services import FoodAnalysisService, NutritionCalculationService
+from .services import (
+    BatchImage,
+    FoodAnalysisService,
+    NutritionCalculationService,
+    aiter_batch_analysis,
+    iter_batch_analysis,
+)
+from .jobs import callback_allowed, create_job, get_job, serialize_job
+from core import metrics
+from core.auth import aauthenticate_token
 
-# 临时图片存储目录
-TEMP_DIR = Path(__file__).resolve().parent.parent.parent / "temp"
-TEMP_DIR.mkdir(exist_ok=True)
+# 允许的图片类型(用于构造传给模型的 data URL)
+IMAGE_MIME_TYPES = {"image/jpeg", "image/png", "image/webp", "image/gif"}
+
+
+def _record_analysis_metrics(endpoint: str, service: FoodAnalysisService, started: float):
+    """按接口记录图片识别的缓存命中情况和耗时"""
+    if service.cache_status:
+        metrics.incr(f"nutrition.{endpoint}.cache.{service.cache_status}")
+    metrics.observe(f"nutrition.{endpoint}.latency", time.perf_counter() - started)
+
+
+def _read_upload(image_file):
+    """
+    读取上传的图片内容
+
+    小于 FILE_UPLOAD_MAX_MEMORY_SIZE 的上传由 Django 保存在内存中, 直接返回其缓冲区的
+    memoryview, 不复制也不落盘; 超过该大小的上传才会由 Django 写入临时文件, 此时读出内容。
+    """
+    buffer = getattr(image_file.file, "getbuffer", None)
+    if buffer is not None:
+        return buffer()
+    image_file.seek(0)
+    return image_file.read()
+
+
+def _upload_mime_type(image_file) -> str:
+    return image_file.content_type if image_file.content_type in IMAGE_MIME_TYPES else "image/jpeg"
+
+
+def _parse_base64_image(data):
+    """
+    校验并解码请求中的Base64图片
+
+    Returns:
+        (错误响应, 图片内容, Base64编码, 图片类型), 校验通过时错误响应为 None
+    """
+    # 1. 验证请求数据
+    if "image_base64" not in data:
+        return JsonResponse(
+            {"error": "请提供Base64格式图片，字段名为'image_base64'"},
+            status=400
+        ), None, None, None
+
+    base64_str = data["image_base64"].strip()
+    if not base64_str:
+        return JsonResponse(
+            {"error": "Base64字符串不能为空"},
+            status=400
+        ), None, None, None
+
+    # 2. 处理Base64字符串（去除前缀，如"data:image/jpeg;base64,"）
+    mime_type = "image/jpeg"
+    try:
+        # 分割可能存在的前缀（如"data:image/png;base64,"）
+        if "base64," in base64_str:
+            prefix, base64_data = base64_str.split("base64,", 1)
+            prefix_type = prefix.removeprefix("data:").rstrip(";")
+            if prefix_type in IMAGE_MIME_TYPES:
+                mime_type = prefix_type
+        else:
+            base64_data = base64_str
+
+        # 去掉客户端可能插入的换行等空白, 之后原样透传给模型, 不再重新编码
+        if any(char.isspace() for char in base64_data):
+            base64_data = "".join(base64_data.split())
+
+        # 解码仅用于校验和计算缓存哈希
+        image_bytes = base64.b64decode(base64_data, validate=True)
+    except Exception as e:
+        return JsonResponse(
+            {"error": f"Base64解码失败：{str(e)}（请检查格式是否正确）"},
+            status=400
+        ), None, None, None
+
+    return None, image_bytes, base64_data, mime_type
+
+
+def _validate_food_list(data):
+    """
+    校验营养计算请求的foods字段
+
+    Returns:
+        (错误响应, 食物列表), 校验通过时错误响应为 None
+    """
+    if "foods" not in data:
+        return JsonResponse({"error": "请求缺少foods字段（格式：[{name: str, weight: float}, ...]）"}, status=400), None
+
+    food_list = data["foods"]
+    if not isinstance(food_list, list):
+        return JsonResponse({"error": "foods必须是数组格式"}, status=400), None
+
+    # 验证每个食物项的结构
+    for idx, item in enumerate(food_list):
+        if not isinstance(item, dict):
+            return JsonResponse({"error": f"foods第{idx}项必须是对象"}, status=400), None
+        if "name" not in item or not isinstance(item["name"], str):
+            return JsonResponse({"error": f"foods第{idx}项缺少有效的name字段（字符串）"}, status=400), None
+        if "weight" not in item or not isinstance(item["weight"], (int, float)) or item["weight"] <= 0:
+            return JsonResponse({"error": f"foods第{idx}项缺少有效的weight字段（正数）"}, status=400), None
+
+    return None, food_list
+
+
+def _wants_job(request, data) -> bool:
+    """是否以异步任务模式提交(mode=async, 可放在查询参数或请求体中)"""
+    return (request.GET.get("mode") or data.get("mode")) == "async"
+
+
+def _parse_job_options(request, data, user):
+    """
+    解析异步任务模式参数(mode=async; 可选 callback_url)
+
+    异步模式需要登录用户; 回调地址的主机必须在 NUTRITION_CALLBACK_ALLOWED_HOSTS 中。
+
+    Returns:
+        (错误响应, 是否以异步任务执行, 回调地址), 校验通过时错误响应为 None
+    """
+    if not _wants_job(request, data):
+        return None, False, ""
+
+    if user is None or not user.is_authenticated:
+        return JsonResponse({"error": "异步任务模式需要登录(请求头 Authorization: Token <key>)"}, status=401), True, ""
+
+    callback_url = (data.get("callback_url") or "").strip()
+    if callback_url:
+        try:
+            URLValidator(schemes=["http", "https"])(callback_url)
+        except ValidationError:
+            return JsonResponse({"error": "callback_url必须是有效的http(s)地址"}, status=400), True, ""
+        if not callback_allowed(callback_url):
+            return JsonResponse({"error": "callback_url的主机不在允许的回调主机列表中"}, status=400), True, ""
+    return None, True, callback_url
+
+
+def _job_accepted(request, job):
+    """异步任务已创建: 返回202和任务查询地址"""
+    data = serialize_job(job)
+    data["poll_url"] = request.build_absolute_uri(reverse("nutrition:analysis-job", args=[job.id]))
+    return JsonResponse(data, status=202)
+
+
+def _read_batch_uploads(request):
+    """
+    读取批量识别上传的图片(字段名 images, 可重复)
+
+    Returns:
+        (错误响应, 图片列表), 校验通过时错误响应为 None
+    """
+    image_files = request.FILES.getlist("images")
+    if not image_files:
+        return JsonResponse({"error": "请上传图片文件，字段名为'images'（可上传多张）"}, status=400), None
+
+    max_images = getattr(settings, "NUTRITION_BATCH_MAX_IMAGES", 10)
+    if len(image_files) > max_images:
+        return JsonResponse({"error": f"单次最多上传{max_images}张图片"}, status=400), None
+
+    images = []
+    for image_file in image_files:
+        try:
+            images.append(BatchImage(image_file.name, _read_upload(image_file), _upload_mime_type(image_file)))
+        except Exception as e:
+            return JsonResponse({"error": f"图片{image_file.name}读取失败：{str(e)}"}, status=500), None
+    return None, images
+
+
+def _batch_response(stream):
+    response = StreamingHttpResponse(stream, content_type="application/x-ndjson; charset=utf-8")
+    # 避免 nginx 等反向代理缓冲, 每张图片识别完成后立即送达客户端
+    response["X-Accel-Buffering"] = "no"
+    return response
+
+
+def _load_json_body(request):
+    """异步视图不经过 DRF 解析器, 自行解析 JSON 请求体, 失败时返回 None"""
+    try:
+        data = json.loads(request.body or b"{}")
+    except ValueError:
+        return None
+    return data if isinstance(data, dict) else None
 
 
 class FoodRecognitionView(APIView):
     parser_classes = [MultiPartParser]
 
     def post(self, request):
+        started = time.perf_counter()
+
         # 1. 检查是否上传图片
         if "image" not in request.FILES:
             return JsonResponse({"error": "请上传图片文件"}, status=400)
 
         image_file = request.FILES["image"]
 
-        # 2. 保存图片到临时目录（仅保存，不处理编码）
+        # 2. 读取图片内容（内存中处理，不保存临时文件）
         try:
-            temp_filename = f"food_{os.urandom(10).hex()}.jpg"
-            temp_path = TEMP_DIR / temp_filename
-
-            with open(temp_path, "wb") as f:
-                for chunk in image_file.chunks():
-                    f.write(chunk)
+            image_bytes = _read_upload(image_file)
         except Exception as e:
-            return JsonResponse({"error": f"图片保存失败：{str(e)}"}, status=500)
+            return JsonResponse({"error": f"图片读取失败：{str(e)}"}, status=500)
 
-        # 3. 调用服务层（传递临时文件路径，由服务层处理编码）
-        service = FoodAnalysisService()
-        result = service.analyze_image(temp_path)  # 传入路径而非编码
+        mime_type = _upload_mime_type(image_file)
+
+        # 异步模式: 保存为任务后立即返回, 由工作进程识别
+        error, as_job, callback_url = _parse_job_options(request, request.data, request.user)
+        if error:
+            return error
+        if as_job:
+            return _job_accepted(request, create_job(request.user, image_bytes, mime_type, callback_url))
 
-        # 4. 清理临时文件
-        if os.path.exists(temp_path):
-            os.remove(temp_path)
+        # 3. 调用服务层（直接传递图片内容，由服务层处理编码）
+        service = FoodAnalysisService()
+        result = service.analyze_image(image_bytes, mime_type=mime_type)
 
-        # 5. 返回结果
+        # 4. 返回结果
+        _record_analysis_metrics("analyze", service, started)
         return JsonResponse(result)
 
 
+class FoodRecognitionBatchView(APIView):
+    """批量食物识别: 一次上传多张图片, 并发识别, 每张识别完成后立即以一行JSON返回"""
+    parser_classes = [MultiPartParser]
+
+    def post(self, request):
+        error, images = _read_batch_uploads(request)
+        if error:
+            return error
+        return _batch_response(iter_batch_analysis(images))
+
+
 class FoodRecognitionBase64View(APIView):
     """新增：支持Base64格式图片的食物识别接口"""
     parser_classes = [JSONParser]  # 处理JSON格式的Base64数据
 
-    # 关键：移除认证和权限校验
-    authentication_classes = []  # 不启用任何认证方式（如Token、Session）
+    # 同步识别允许匿名访问; 只启用Token认证(不使用Session, 无需CSRF), 异步任务模式需要登录
+    authentication_classes = [TokenAuthentication]
     permission_classes = []  # 允许所有用户访问（包括匿名用户）
 
     def post(self, request):
-        # 1. 验证请求数据
-        if "image_base64" not in request.data:
-            return JsonResponse(
-                {"error": "请提供Base64格式图片，字段名为'image_base64'"},
-                status=400
-            )
-
-        base64_str = request.data["image_base64"].strip()
-        if not base64_str:
-            return JsonResponse(
-                {"error": "Base64字符串不能为空"},
-                status=400
-            )
-
-        # 2. 处理Base64字符串（去除前缀，如"data:image/jpeg;base64,"）
-        try:
-            # 分割可能存在的前缀（如"data:image/png;base64,"）
-            if "base64," in base64_str:
-                base64_data = base64_str.split("base64,")[1]
-            else:
-                base64_data = base64_str
-
-            # 解码Base64为二进制数据
-            image_bytes = base64.b64decode(base64_data)
-        except Exception as e:
-            return JsonResponse(
-                {"error": f"Base64解码失败：{str(e)}（请检查格式是否正确）"},
-                status=400
-            )
+        started = time.perf_counter()
 
-        # 3. 保存解码后的图片到临时目录
-        try:
-            # 生成唯一文件名（保留.jpg后缀，避免识别模型格式问题）
-            temp_filename = f"food_base64_{os.urandom(10).hex()}.jpg"
-            temp_path = TEMP_DIR / temp_filename
+        # 1. 验证并解码Base64图片
+        error, image_bytes, base64_data, mime_type = _parse_base64_image(request.data)
+        if error:
+            return error
 
-            with open(temp_path, "wb") as f:
-                f.write(image_bytes)
-        except Exception as e:
-            return JsonResponse(
-                {"error": f"图片保存失败：{str(e)}"},
-                status=500
-            )
+        # 异步模式: 保存为任务后立即返回, 由工作进程识别
+        error, as_job, callback_url = _parse_job_options(request, request.data, request.user)
+        if error:
+            return error
+        if as_job:
+            return _job_accepted(request, create_job(request.user, image_bytes, mime_type, callback_url))
 
-        # 4. 调用服务层识别（复用原有FoodAnalysisService，无需修改）
+        # 2. 调用服务层识别（复用原有FoodAnalysisService）
         service = FoodAnalysisService()
-        result = service.analyze_image(temp_path)  # 传入临时文件路径
-
-        # 5. 清理临时文件
-        if os.path.exists(temp_path):
-            os.remove(temp_path)
+        result = service.analyze_image(image_bytes, image_base64=base64_data, mime_type=mime_type)
 
-        # 6. 返回识别结果（与原有接口格式一致，便于前端统一处理）
+        # 3. 返回识别结果（与原有接口格式一致，便于前端统一处理）
+        _record_analysis_metrics("analyze_base64", service, started)
         return JsonResponse(result)
 
 
+class AnalysisJobView(APIView):
+    """查询异步图片识别任务的状态和结果(只能查询自己提交的任务)"""
+    authentication_classes = [TokenAuthentication]
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, job_id):
+        job = get_job(request.user.id, job_id)
+        if job is None:
+            return JsonResponse({"error": "任务不存在或已过期"}, status=404)
+        return JsonResponse(serialize_job(job))
+
+
 # 新增：营养计算视图（接收食物名称和重量，调用AI计算热量）
 class NutritionCalculationView(APIView):
     parser_classes = [JSONParser]  # 处理JSON格式请求（手机端传来的食物列表）
 
     def post(self, request):
         # 1. 验证请求数据格式
-        if "foods" not in request.data:
-            return JsonResponse({"error": "请求缺少foods字段（格式：[{name: str, weight: float}, ...]）"}, status=400)
-
-        food_list = request.data["foods"]
-        if not isinstance(food_list, list):
-            return JsonResponse({"error": "foods必须是数组格式"}, status=400)
-
-        # 验证每个食物项的结构
-        for idx, item in enumerate(food_list):
-            if not isinstance(item, dict):
-                return JsonResponse({"error": f"foods第{idx}项必须是对象"}, status=400)
-            if "name" not in item or not isinstance(item["name"], str):
-                return JsonResponse({"error": f"foods第{idx}项缺少有效的name字段（字符串）"}, status=400)
-            if "weight" not in item or not isinstance(item["weight"], (int, float)) or item["weight"] <= 0:
-                return JsonResponse({"error": f"foods第{idx}项缺少有效的weight字段（正数）"}, status=400)
+        error, food_list = _validate_food_list(request.data)
+        if error:
+            return error
 
         # 2. 调用营养计算服务
         service = NutritionCalculationService()
         result = service.calculate_nutrition(food_list)
 
         # 3. 返回计算结果
-        return JsonResponse(result)
\ No newline at end of file
+        return JsonResponse(result)
+
+
+# 以下为 ASGI 部署时使用的异步视图(settings.LLM_ASYNC_VIEWS=True), 与上面的同步视图接口一致,
+# 等待模型返回期间不占用工作线程。DRF 不支持 async 视图, 因此直接使用 Django 视图。
+
+@csrf_exempt
+@require_POST
+async def food_recognition_async_view(request):
+    started = time.perf_counter()
+
+    if "image" not in request.FILES:
+        return JsonResponse({"error": "请上传图片文件"}, status=400)
+
+    image_file = request.FILES["image"]
+    try:
+        image_bytes = _read_upload(image_file)
+    except Exception as e:
+        return JsonResponse({"error": f"图片读取失败：{str(e)}"}, status=500)
+    mime_type = _upload_mime_type(image_file)
+
+    user = await aauthenticate_token(request) if _wants_job(request, request.POST) else None
+    error, as_job, callback_url = _parse_job_options(request, request.POST, user)
+    if error:
+        return error
+    if as_job:
+        return _job_accepted(request, await sync_to_async(create_job)(user, image_bytes, mime_type, callback_url))
+
+    service = FoodAnalysisService()
+    result = await service.aanalyze_image(image_bytes, mime_type=mime_type)
+
+    _record_analysis_metrics("analyze", service, started)
+    return JsonResponse(result)
+
+
+@csrf_exempt
+@require_POST
+async def food_recognition_batch_async_view(request):
+    error, images = _read_batch_uploads(request)
+    if error:
+        return error
+    return _batch_response(aiter_batch_analysis(images))
+
+
+@csrf_exempt
+@require_POST
+async def food_recognition_base64_async_view(request):
+    started = time.perf_counter()
+
+    data = _load_json_body(request)
+    if data is None:
+        return JsonResponse({"error": "请求体必须是JSON对象"}, status=400)
+
+    error, image_bytes, base64_data, mime_type = _parse_base64_image(data)
+    if error:
+        return error
+
+    user = await aauthenticate_token(request) if _wants_job(request, data) else None
+    error, as_job, callback_url = _parse_job_options(request, data, user)
+    if error:
+        return error
+    if as_job:
+        return _job_accepted(request, await sync_to_async(create_job)(user, image_bytes, mime_type, callback_url))
+
+    service = FoodAnalysisService()
+    result = await service.aanalyze_image(image_bytes, image_base64=base64_data, mime_type=mime_type)
+
+    _record_analysis_metrics("analyze_base64", service, started)
+    return JsonResponse(result)
+
+
+@csrf_exempt
+@require_POST
+async def nutrition_calculation_async_view(request):
+    data = _load_json_body(request)
+    if data is None:
+        return JsonResponse({"error": "请求体必须是JSON对象"}, status=400)
+
+    error, food_list = _validate_food_list(data)
+    if error:
+        return error
+
+    service = NutritionCalculationService()
+    result = await service.acalculate_nutrition(food_list)
+    return JsonResponse(result)